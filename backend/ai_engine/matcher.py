@@ -1,4 +1,3 @@
-import difflib
 import os
 import sys
 
@@ -39,6 +38,9 @@ class SmartMatcher:
             print("  No candidates found in DB.")
             return None
             
+        # Fuzzy ratio with name for all candidates at once (trigram mat-vec in the DB index)
+        name_fuzz = self.db.index.fuzzy_scores(q_clean, [c['id'] for c in candidates], include_aliases=False)
+        
         ranked = []
         for cand in candidates:
             # Get aliases for scoring to ensure alias-matches get high scores
@@ -68,7 +70,7 @@ class SmartMatcher:
             word_score = words_in_name / len(words) if words else 0
             
             # Fuzzy ratio with name
-            fuzzy_score = difflib.SequenceMatcher(None, q_clean, item_name).ratio()
+            fuzzy_score = name_fuzz.get(cand['id'], 0.0)
             
             # combine: If DB score is high (alias match), we respect it.
             final_score = max((word_score * 0.7) + (fuzzy_score * 0.3), db_score)
@@ -1,9 +1,17 @@
+import json
 import os
-import difflib
 import re
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, Date, DateTime, ForeignKey, func, select, or_, text
+import numpy as np
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, bindparam, func, select, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from database.search_index import SearchIndex
 
 class PriceDatabase:
+    # Other workers' writes are replayed into the search index up to this many changed items;
+    # a larger gap rebuilds it
+    INDEX_REPLAY_MAX_ITEMS = 5000
+
     def __init__(self, db_url=None):
         if not db_url:
             # Default to local SQLite if not provided (and not in env)
@@ -37,7 +45,7 @@ class PriceDatabase:
         
         self.prices = Table('prices', self.metadata,
             Column('id', Integer, primary_key=True),
-            Column('item_id', Integer, ForeignKey('items.id')),
+            Column('item_id', Integer, ForeignKey('items.id'), index=True),
             Column('source_id', Integer, ForeignKey('sources.id')),
             Column('price_material', Float),
             Column('price_labor', Float),
@@ -51,9 +59,77 @@ class PriceDatabase:
             Column('alias', String, index=True),
             Column('created_at', DateTime, server_default=func.now())
         )
+
+        # Projection: latest price per item and source type (by offer date), maintained
+        # by every write so the match path never scans the full price history.
+        self.latest_prices = Table('latest_prices', self.metadata,
+            Column('item_id', Integer, ForeignKey('items.id'), primary_key=True),
+            Column('source_type', String, primary_key=True),  # '' for legacy rows without a type
+            Column('price_id', Integer),
+            Column('price_material', Float),
+            Column('price_labor', Float),
+            Column('unit', String),
+            Column('vendor', String),
+            Column('date_offer', Date)
+        )
+
+        # Monotonic counter bumped by every catalog write, so in-memory
+        # structures (search index) can tell when they are stale.
+        self.catalog_meta = Table('catalog_meta', self.metadata,
+            Column('key', String, primary_key=True),
+            Column('value', Integer, nullable=False)
+        )
+
+        # Catalog version at which each item's admin row (name, newest price) or aliases last
+        # changed; deleted items stay as tombstones, so the admin sheet can pull deltas (?since=)
+        # and other workers' search indexes can catch up without a rebuild.
+        self.item_changes = Table('item_changes', self.metadata,
+            Column('item_id', Integer, primary_key=True),
+            Column('version', Integer, nullable=False, index=True),
+            Column('deleted', Integer, nullable=False, server_default='0')
+        )
+
+        # AI extraction result per chunk, keyed by a hash of (prompt version, file type, chunk text),
+        # so re-uploads and resumed ingests only pay for chunks that changed.
+        self.ai_extractions = Table('ai_extractions', self.metadata,
+            Column('key', String, primary_key=True),
+            Column('file_type', String),
+            Column('result', Text, nullable=False),
+            Column('created_at', DateTime, server_default=func.now())
+        )
+
+        # Parsed text of each PDF page, keyed by file hash and parser version, so a file
+        # that is ingested again (or resumed after a failure) is not parsed twice.
+        self.pdf_pages = Table('pdf_pages', self.metadata,
+            Column('file_hash', String, primary_key=True),
+            Column('parser', String, primary_key=True),
+            Column('page', Integer, primary_key=True),
+            Column('page_count', Integer, nullable=False),
+            Column('text', Text, nullable=False)
+        )
+
+        # Upload jobs (IngestJob.to_dict as JSON), so any API worker can answer a status poll
+        self.ingest_jobs = Table('ingest_jobs', self.metadata,
+            Column('id', String, primary_key=True),
+            Column('created_at', Float, nullable=False, index=True),
+            Column('status', String, nullable=False),
+            Column('state', Text, nullable=False)
+        )
         
         self.metadata.create_all(self.engine)
+        # Indexes added to existing tables later (create_all skips tables that exist)
+        for index in self.prices.indexes:
+            index.create(self.engine, checkfirst=True)
         self._migrate_schema()
+        self._init_catalog_version()
+        self._init_latest_prices()
+
+        self.index = SearchIndex()
+        self._priced_ids_cache = {}
+        # Called after every committed catalog write as listener(item_ids, tokens):
+        # item_ids whose names/prices/aliases changed and, if names or aliases were
+        # added, their search tokens (else None). Used for fine-grained cache invalidation.
+        self.change_listeners = []
 
     def _migrate_schema(self):
         """Internal helper to ensure column upgrades."""
@@ -81,6 +157,151 @@ class PriceDatabase:
         except Exception as e:
             print(f"❌ Migration failed: {e}")
 
+    def _init_catalog_version(self):
+        with self.engine.begin() as conn:
+            exists = conn.execute(
+                select(self.catalog_meta.c.value).where(self.catalog_meta.c.key == 'catalog_version')
+            ).scalar()
+            if exists is None:
+                conn.execute(self.catalog_meta.insert().values(key='catalog_version', value=0))
+
+    def _init_latest_prices(self):
+        """Backfill the latest_prices projection for databases created before it existed."""
+        with self.engine.begin() as conn:
+            has_latest = conn.execute(select(self.latest_prices.c.item_id).limit(1)).first()
+            has_prices = conn.execute(select(self.prices.c.id).limit(1)).first()
+            if has_prices and not has_latest:
+                print("⚠️ Building latest_prices projection...")
+                self._refresh_latest_prices(conn)
+
+    def _refresh_latest_prices(self, conn, item_ids=None):
+        """
+        Recompute latest_prices rows for `item_ids` (all items if None) inside the
+        caller's transaction: one row per item and source type, newest offer date first,
+        latest inserted price on ties.
+        """
+        source_type = func.coalesce(self.sources.c.source_type, '')
+        ranked = select(
+            self.prices.c.item_id,
+            source_type.label('source_type'),
+            self.prices.c.id.label('price_id'),
+            self.prices.c.price_material,
+            self.prices.c.price_labor,
+            self.prices.c.unit,
+            self.sources.c.vendor,
+            self.sources.c.date_offer,
+            func.row_number().over(
+                partition_by=[self.prices.c.item_id, source_type],
+                order_by=[self.sources.c.date_offer.desc().nulls_last(), self.prices.c.id.desc()]
+            ).label('rn')
+        ).select_from(self.prices.join(self.sources, self.prices.c.source_id == self.sources.c.id))
+
+        cols = ['item_id', 'source_type', 'price_id', 'price_material', 'price_labor', 'unit', 'vendor', 'date_offer']
+
+        def refresh(stmt_filter=None):
+            sub = (ranked.where(stmt_filter) if stmt_filter is not None else ranked).subquery()
+            conn.execute(self.latest_prices.insert().from_select(
+                cols, select(*[sub.c[c] for c in cols]).where(sub.c.rn == 1)
+            ))
+
+        if item_ids is None:
+            conn.execute(self.latest_prices.delete())
+            refresh()
+            return
+        for chunk in self._chunks(set(item_ids)):
+            conn.execute(self.latest_prices.delete().where(self.latest_prices.c.item_id.in_(chunk)))
+            refresh(self.prices.c.item_id.in_(chunk))
+
+    def _get_catalog_version(self, conn):
+        return conn.execute(
+            select(self.catalog_meta.c.value).where(self.catalog_meta.c.key == 'catalog_version')
+        ).scalar()
+
+    def _get_reset_version(self, conn):
+        """Catalog version of the last reset (0 if never reset): older versions' ids and history are gone."""
+        return conn.execute(
+            select(self.catalog_meta.c.value).where(self.catalog_meta.c.key == 'reset_version')
+        ).scalar() or 0
+
+    def _bump_catalog_version(self, conn):
+        """Increment the catalog version inside the caller's transaction and return the new value."""
+        conn.execute(
+            self.catalog_meta.update()
+            .where(self.catalog_meta.c.key == 'catalog_version')
+            .values(value=self.catalog_meta.c.value + 1)
+        )
+        return self._get_catalog_version(conn)
+
+    def _lock_catalog(self, conn):
+        """Take the catalog_meta row lock (serializes writers) without bumping; returns the current version."""
+        conn.execute(
+            self.catalog_meta.update()
+            .where(self.catalog_meta.c.key == 'catalog_version')
+            .values(value=self.catalog_meta.c.value)
+        )
+        return self._get_catalog_version(conn)
+
+    def _mark_changed(self, conn, version, item_ids, deleted=False):
+        """Record (inside the caller's transaction) that the admin rows of `item_ids` changed at `version`."""
+        item_ids = list(dict.fromkeys(item_ids))
+        for chunk in self._chunks(item_ids):
+            conn.execute(self.item_changes.delete().where(self.item_changes.c.item_id.in_(chunk)))
+            conn.execute(self.item_changes.insert(), [
+                {"item_id": item_id, "version": version, "deleted": int(deleted)} for item_id in chunk
+            ])
+
+    def _sync_index(self, conn):
+        """
+        Make sure the in-memory search index reflects the current catalog version: items
+        changed since the index's version (item_changes) are re-read, and the index is
+        rebuilt only after a reset or when more than INDEX_REPLAY_MAX_ITEMS changed.
+        """
+        item_cols = (self.items.c.id, self.items.c.normalized_name)
+        alias_cols = (self.item_aliases.c.id, self.item_aliases.c.item_id, self.item_aliases.c.alias)
+
+        def load():
+            return conn.execute(select(*item_cols)).fetchall(), conn.execute(select(*alias_cols)).fetchall()
+
+        def replay(since):
+            if since < self._get_reset_version(conn):
+                return None  # ids and change history from before the reset are gone
+            changed = conn.execute(
+                select(self.item_changes.c.item_id).where(self.item_changes.c.version > since)
+                .limit(self.INDEX_REPLAY_MAX_ITEMS + 1)
+            ).scalars().all()
+            if len(changed) > self.INDEX_REPLAY_MAX_ITEMS:
+                return None
+            item_rows, alias_rows = [], []
+            for chunk in self._chunks(changed):
+                item_rows += conn.execute(select(*item_cols).where(self.items.c.id.in_(chunk))).fetchall()
+                alias_rows += conn.execute(select(*alias_cols).where(self.item_aliases.c.item_id.in_(chunk))).fetchall()
+            return changed, item_rows, alias_rows
+
+        version = self._get_catalog_version(conn)
+        self.index.ensure(version, load, replay)
+        return self.index, version
+
+    def _notify(self, item_ids, texts=None):
+        tokens = None
+        if texts is not None:
+            tokens = set()
+            for t in texts:
+                tokens |= SearchIndex.tokenize(t)
+        for listener in self.change_listeners:
+            listener(set(item_ids), tokens)
+
+    def query_tokens(self, query):
+        """Tokens a search for `query` can match on (raw and cleaned text, as in search_many)."""
+        q_norm = query.lower().strip()
+        return SearchIndex.tokenize(q_norm) | SearchIndex.tokenize(self._clean_item_name(q_norm))
+
+    @staticmethod
+    def _chunks(values, size=5000):
+        """Split a list of ids into IN (...) sized batches (SQLite/Postgres bind limits)."""
+        values = list(values)
+        for i in range(0, len(values), size):
+            yield values[i:i + size]
+
     def get_stats(self):
         with self.engine.connect() as conn:
             try:
@@ -91,9 +312,26 @@ class PriceDatabase:
                 return {"items": 0, "prices": 0, "url": str(self.engine.url), "error": str(e)}
 
     def reset_all_data(self):
-        """Drops all tables and recreates them. Use with caution!"""
-        self.metadata.drop_all(self.engine)
-        self.metadata.create_all(self.engine)
+        """
+        Drops all catalog tables and recreates them. Use with caution!
+        Upload jobs and the AI / PDF extraction caches are kept: they describe files, not the
+        catalog, so running jobs stay pollable and re-ingesting the files costs no AI calls.
+        """
+        # The catalog version keeps counting up across the reset: workers (and clients)
+        # holding an older version must see the empty catalog as newer, not as stale
+        with self.engine.connect() as conn:
+            version = self._get_catalog_version(conn) or 0
+        kept = {self.ingest_jobs, self.ai_extractions, self.pdf_pages}
+        catalog = [t for t in self.metadata.sorted_tables if t not in kept]
+        self.metadata.drop_all(self.engine, tables=catalog)
+        self.metadata.create_all(self.engine, tables=catalog)
+        with self.engine.begin() as conn:
+            # reset_version: change history (item_changes) starts here, older deltas need a full reload
+            conn.execute(self.catalog_meta.insert(), [
+                {"key": 'catalog_version', "value": version + 1},
+                {"key": 'reset_version', "value": version + 1},
+            ])
+        self.index.invalidate()
         return True
 
     def delete_item(self, item_id):
@@ -105,20 +343,33 @@ class PriceDatabase:
             return False
         with self.engine.connect() as conn:
             # Delete prices first
+            conn.execute(self.latest_prices.delete().where(self.latest_prices.c.item_id.in_(item_ids)))
             conn.execute(self.prices.delete().where(self.prices.c.item_id.in_(item_ids)))
             # Delete items
             conn.execute(self.items.delete().where(self.items.c.id.in_(item_ids)))
+            version = self._bump_catalog_version(conn)
+            self._mark_changed(conn, version, item_ids, deleted=True)
             conn.commit()
+            self.index.apply(version, lambda idx: idx.remove_items(item_ids))
+            self._notify(item_ids)
             return True
 
     def delete_source(self, source_id):
         """Delete a source and all prices linked to it."""
         with self.engine.connect() as conn:
+            affected = [r[0] for r in conn.execute(
+                select(self.prices.c.item_id).where(self.prices.c.source_id == source_id).distinct()
+            ).fetchall()]
             # Delete prices first (Foreign Key)
             conn.execute(self.prices.delete().where(self.prices.c.source_id == source_id))
             # Delete source
             conn.execute(self.sources.delete().where(self.sources.c.id == source_id))
+            self._refresh_latest_prices(conn, affected)
+            version = self._bump_catalog_version(conn)
+            self._mark_changed(conn, version, affected)
             conn.commit()
+            self.index.apply(version, lambda idx: None)
+            self._notify(affected)
             return True
 
     def add_custom_item(self, name, price_material, price_labor, unit):
@@ -127,13 +378,7 @@ class PriceDatabase:
             name = self._clean_item_name(name)
             norm_name = name.lower().strip()
             
-            # Determine source_type based on which prices are filled (Iron Curtain logic)
-            if price_material > 0 and price_labor == 0:
-                source_type = 'SUPPLIER'  # Material only -> treated as supplier data
-            elif price_labor > 0 and price_material == 0:
-                source_type = 'INTERNAL'  # Labor only -> treated as internal budget
-            else:
-                source_type = 'ADMIN'  # Both or neither -> admin entry
+            source_type = self._user_source_type(price_material, price_labor)
             
             # Check if item already exists
             existing = conn.execute(select(self.items.c.id).where(self.items.c.name == name)).scalar()
@@ -145,17 +390,7 @@ class PriceDatabase:
                 item_id = result.inserted_primary_key[0]
             
             # Get or create source with appropriate type
-            source_name = f"user_input_{source_type.lower()}"
-            source_id = conn.execute(select(self.sources.c.id).where(self.sources.c.filename == source_name)).scalar()
-            if not source_id:
-                from datetime import date
-                result = conn.execute(self.sources.insert().values(
-                    filename=source_name,
-                    vendor="Uživatel",
-                    date_offer=date.today(),
-                    source_type=source_type
-                ))
-                source_id = result.inserted_primary_key[0]
+            source_id = self._get_or_create_source(conn, f"user_input_{source_type.lower()}", "Uživatel", source_type)
             
             # Add price
             conn.execute(self.prices.insert().values(
@@ -166,7 +401,12 @@ class PriceDatabase:
                 unit=unit,
                 quantity=1.0
             ))
+            self._refresh_latest_prices(conn, [item_id])
+            version = self._bump_catalog_version(conn)
+            self._mark_changed(conn, version, [item_id])
             conn.commit()
+            self.index.apply(version, lambda idx: idx.add_item(item_id, norm_name))
+            self._notify([item_id], [norm_name])
             return item_id
 
     def add_alias(self, item_id, query):
@@ -201,48 +441,165 @@ class PriceDatabase:
                 return True
                 
             # 5. Add alias
-            conn.execute(self.item_aliases.insert().values(
+            alias_id = conn.execute(self.item_aliases.insert().values(
                 item_id=item_id,
                 alias=clean_q
-            ))
+            )).inserted_primary_key[0]
+            version = self._bump_catalog_version(conn)
+            self._mark_changed(conn, version, [item_id])
             conn.commit()
+            self.index.apply(version, lambda idx: idx.add_alias(alias_id, item_id, clean_q))
+            self._notify([item_id], [clean_q])
             return True
 
     def delete_alias(self, alias_id):
         """Delete a single alias by ID."""
-        with self.engine.connect() as conn:
-            conn.execute(self.item_aliases.delete().where(self.item_aliases.c.id == alias_id))
-            conn.commit()
+        self.delete_aliases([alias_id])
 
     def delete_aliases(self, alias_ids):
         """Batch delete aliases by IDs."""
         if not alias_ids:
             return
         with self.engine.connect() as conn:
+            owners = [r[0] for r in conn.execute(
+                select(self.item_aliases.c.item_id).where(self.item_aliases.c.id.in_(alias_ids)).distinct()
+            ).fetchall()]
             conn.execute(self.item_aliases.delete().where(self.item_aliases.c.id.in_(alias_ids)))
+            version = self._bump_catalog_version(conn)
+            self._mark_changed(conn, version, owners)
             conn.commit()
+            self.index.apply(version, lambda idx: idx.remove_aliases(alias_ids))
+            self._notify(owners)
+
+    def _alias_stmt(self, after=None, limit=None):
+        stmt = select(
+            self.item_aliases.c.id,
+            self.item_aliases.c.item_id,
+            self.item_aliases.c.alias,
+            self.items.c.name.label('item_name'),
+            self.item_aliases.c.created_at
+        ).join(self.items, self.item_aliases.c.item_id == self.items.c.id).order_by(self.item_aliases.c.id)
+        if after is not None:
+            stmt = stmt.where(self.item_aliases.c.id > after)
+        return stmt.limit(limit)
+
+    @staticmethod
+    def _alias_row(r):
+        return {
+            "id": r.id,
+            "item_id": r.item_id,
+            "alias": r.alias,
+            "item_name": r.item_name,
+            "created_at": r.created_at.isoformat() if r.created_at else None
+        }
 
     def get_all_aliases(self):
         """Returns all aliases stored in the database."""
         with self.engine.connect() as conn:
-            stmt = select(
-                self.item_aliases.c.id,
-                self.item_aliases.c.item_id,
-                self.item_aliases.c.alias,
-                self.items.c.name.label('item_name'),
-                self.item_aliases.c.created_at
-            ).join(self.items, self.item_aliases.c.item_id == self.items.c.id)
-            
-            rows = conn.execute(stmt).fetchall()
-            return [
-                {
-                    "id": r.id,
-                    "item_id": r.item_id,
-                    "alias": r.alias,
-                    "item_name": r.item_name,
-                    "created_at": r.created_at.isoformat()
-                } for r in rows
-            ]
+            return [self._alias_row(r) for r in conn.execute(self._alias_stmt()).fetchall()]
+
+    def get_aliases_page(self, after=None, limit=1000):
+        """One keyset page of aliases (by id) -> {"items", "next"}; pass `next` as `after` for the following page."""
+        with self.engine.connect() as conn:
+            rows = [self._alias_row(r) for r in conn.execute(self._alias_stmt(after, limit)).fetchall()]
+        return {"items": rows, "next": rows[-1]["id"] if len(rows) == limit else None}
+
+    def iter_aliases(self, batch_size=1000):
+        """Yield all aliases as they are fetched (server-side cursor where the driver supports one)."""
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(self._alias_stmt())
+            for r in result:
+                yield self._alias_row(r)
+
+    def _item_ids_by_name(self, conn, names):
+        """{name: item id} of the existing items among `names` (chunked IN lookups)."""
+        ids = {}
+        for chunk in self._chunks(names):
+            for r in conn.execute(select(self.items.c.id, self.items.c.name).where(self.items.c.name.in_(chunk))):
+                ids[r.name] = r.id
+        return ids
+
+    def _insert_items(self, conn, names):
+        """
+        Create items for `names` (none of them existed when looked up) -> {name: id}.
+        Ingests run concurrently and may create the same new name: ON CONFLICT DO NOTHING
+        skips names another writer inserted first, and the re-select returns their ids.
+        """
+        rows = [{"name": n, "normalized_name": n.lower().strip()} for n in names]
+        dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(self.engine.dialect.name)
+        if dialect is not None:
+            conn.execute(dialect.insert(self.items).on_conflict_do_nothing(index_elements=["name"]), rows)
+        else:
+            conn.execute(self.items.insert(), rows)
+        return self._item_ids_by_name(conn, names)
+
+    def get_extraction(self, key):
+        """Cached AI extraction result for a chunk key, or None."""
+        with self.engine.connect() as conn:
+            raw = conn.execute(select(self.ai_extractions.c.result).where(self.ai_extractions.c.key == key)).scalar()
+        return json.loads(raw) if raw is not None else None
+
+    def save_extraction(self, key, file_type, result):
+        with self.engine.connect() as conn:
+            try:
+                conn.execute(self.ai_extractions.insert().values(
+                    key=key, file_type=file_type, result=json.dumps(result, ensure_ascii=False)
+                ))
+                conn.commit()
+            except IntegrityError:
+                # Same chunk extracted concurrently by another job - keep the first result
+                conn.rollback()
+
+    def get_page_texts(self, file_hash, parser):
+        """Cached page texts of a PDF -> (page count, {page: text}), or (None, {}) if none are cached."""
+        t = self.pdf_pages
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(t.c.page, t.c.page_count, t.c.text).where(t.c.file_hash == file_hash, t.c.parser == parser)
+            ).fetchall()
+        if not rows:
+            return None, {}
+        return rows[0].page_count, {r.page: r.text for r in rows}
+
+    def save_page_texts(self, file_hash, parser, page_count, texts):
+        if not texts:
+            return
+        with self.engine.connect() as conn:
+            try:
+                conn.execute(self.pdf_pages.insert(), [
+                    {"file_hash": file_hash, "parser": parser, "page": page, "page_count": page_count, "text": text}
+                    for page, text in texts.items()
+                ])
+                conn.commit()
+            except IntegrityError:
+                # Same pages parsed concurrently by another job
+                conn.rollback()
+
+    def save_ingest_job(self, state):
+        """Insert or update the stored state of an ingest job (a dict from IngestJob.to_dict)."""
+        values = {"created_at": state["created_at"], "status": state["status"],
+                  "state": json.dumps(state, ensure_ascii=False, default=str)}
+        t = self.ingest_jobs
+        with self.engine.connect() as conn:
+            if not conn.execute(t.update().where(t.c.id == state["job_id"]).values(**values)).rowcount:
+                conn.execute(t.insert().values(id=state["job_id"], **values))
+            conn.commit()
+
+    def get_ingest_job(self, job_id):
+        with self.engine.connect() as conn:
+            raw = conn.execute(select(self.ingest_jobs.c.state).where(self.ingest_jobs.c.id == job_id)).scalar()
+        return json.loads(raw) if raw is not None else None
+
+    def trim_ingest_jobs(self, keep):
+        """Delete finished jobs beyond the newest `keep` jobs."""
+        t = self.ingest_jobs
+        with self.engine.connect() as conn:
+            cutoff = conn.execute(
+                select(t.c.created_at).order_by(t.c.created_at.desc()).offset(keep).limit(1)
+            ).scalar()
+            if cutoff is not None:
+                conn.execute(t.delete().where(t.c.created_at <= cutoff, t.c.status.in_(["done", "failed"])))
+                conn.commit()
 
     def check_file_exists(self, file_hash=None, offer_number=None):
         """Check if a file with same hash or offer number exists."""
@@ -294,38 +651,53 @@ class PriceDatabase:
                 )
                 conn.execute(stmt)
                 
-            # 2. Add Items & Prices
-            # Prepare data
+            # 2. Add Items & Prices (set-based: clean names in Python, one IN lookup per
+            #    5000 names, bulk insert of missing items and all prices)
+            rows = []  # (clean name, extracted item)
             for it in items:
                 raw_extracted_name = it.get('raw_name') or it.get('item')
                 if not raw_extracted_name:
                     continue
                 
                 name = self._clean_item_name(raw_extracted_name)
-                if not name:
-                    continue
-                
-                norm_name = name.lower().strip()
-                
-                # Check Item
-                s_item = select(self.items.c.id).where(self.items.c.name == name)
-                item_id = conn.execute(s_item).scalar()
-                
-                if not item_id:
-                    stmt = self.items.insert().values(name=name, normalized_name=norm_name)
-                    item_id = conn.execute(stmt).inserted_primary_key[0]
-                
-                # Insert Price
-                conn.execute(self.prices.insert().values(
-                    item_id=item_id,
-                    source_id=source_id,
-                    price_material=it.get('price_material', 0),
-                    price_labor=it.get('price_labor', 0),
-                    unit=it.get('unit', 'ks'),
-                    quantity=it.get('quantity', 1.0)
-                ))
+                if name:
+                    rows.append((name, it))
+            
+            names = list(dict.fromkeys(name for name, _ in rows))
+            item_ids = self._item_ids_by_name(conn, names)
+            missing = [name for name in names if name not in item_ids]
+            if missing:
+                item_ids.update(self._insert_items(conn, missing))
+            new_items = [(item_ids[n], n.lower().strip()) for n in missing]
+            priced_names = {n.lower().strip() for n in names}
+            
+            if rows:
+                conn.execute(self.prices.insert(), [
+                    {
+                        "item_id": item_ids[name],
+                        "source_id": source_id,
+                        "price_material": it.get('price_material', 0),
+                        "price_labor": it.get('price_labor', 0),
+                        "unit": it.get('unit', 'ks'),
+                        "quantity": it.get('quantity', 1.0)
+                    } for name, it in rows
+                ])
                 
+            # Every item priced by this source (new prices or updated source metadata)
+            affected = [r[0] for r in conn.execute(
+                select(self.prices.c.item_id).where(self.prices.c.source_id == source_id).distinct()
+            ).fetchall()]
+            self._refresh_latest_prices(conn, affected)
+            version = self._bump_catalog_version(conn)
+            self._mark_changed(conn, version, affected)
             conn.commit()
+
+            def index_new_items(idx):
+                for item_id, norm_name in new_items:
+                    idx.add_item(item_id, norm_name)
+            self.index.apply(version, index_new_items)
+            # Items that just got a price (new or newly priced) can now match any query sharing a token
+            self._notify(affected, priced_names)
             return source_id
 
     def search_items(self, query, limit=20):
@@ -343,56 +715,21 @@ class PriceDatabase:
                 rows = conn.execute(stmt).fetchall()
                 return [{"id": r.id, "name": r.name} for r in rows]
             
-            # OR conditions for items and aliases
-            conditions = [self.items.c.normalized_name.ilike(f'%{t}%') for t in tokens]
-            alias_conditions = [self.item_aliases.c.alias.ilike(f'%{t}%') for t in tokens]
-            
-            # Subquery to get unique item_ids from aliases matching tokens
-            matching_alias_ids = select(self.item_aliases.c.item_id).where(or_(*alias_conditions))
-            
-            stmt = select(self.items.c.id, self.items.c.name, self.items.c.normalized_name).where(
-                or_(*conditions, self.items.c.id.in_(matching_alias_ids))
-            )
-            rows = conn.execute(stmt).fetchall()
+            # Candidates = items sharing at least one token (name or alias) with the query.
+            # Scoring requires a whole-token overlap, so the inverted index yields exactly
+            # the rows the old ILIKE scan could ever return.
+            index, _ = self._sync_index(conn)
+            ranked = index.rank(q_norm, tokens, limit)
+            if not ranked:
+                return []
             
-            # Python Scoring
-            scored = []
-            for r in rows:
-                # Get all aliases for this item to include in scoring
-                item_aliases_rows = conn.execute(
-                    select(self.item_aliases.c.alias).where(self.item_aliases.c.item_id == r.id)
-                ).fetchall()
-                item_aliases_text = " ".join([al.alias for al in item_aliases_rows])
-                
-                # Combine name and aliases for richer matching
-                searchable_blob = (r.normalized_name + " " + item_aliases_text).lower()
-                
-                item_tokens = set(searchable_blob.split())
-                query_tokens = set(tokens)
-                overlap = len(item_tokens.intersection(query_tokens))
-                seq = difflib.SequenceMatcher(None, q_norm, searchable_blob).ratio()
-                
-                if overlap > 0:
-                    score = (overlap * 2) + seq
-                    
-                    # Unified UI Match Score Logic
-                    token_score = overlap / len(query_tokens) if query_tokens else 0
-                    best_fuzz = difflib.SequenceMatcher(None, q_norm, r.normalized_name).ratio()
-                    for al_row in item_aliases_rows:
-                        al_fuzz = difflib.SequenceMatcher(None, q_norm, al_row.alias).ratio()
-                        if al_fuzz > best_fuzz:
-                            best_fuzz = al_fuzz
-                    
-                    ui_match_score = (token_score * 0.8) + (best_fuzz * 0.2)
-                    
-                    scored.append((score, {
-                        "id": r.id, 
-                        "name": r.name, 
-                        "match_score": round(ui_match_score, 2)
-                    }))
-            
-            scored.sort(key=lambda x: x[0], reverse=True)
-            return [x[1] for x in scored[:limit]]
+            names = dict(conn.execute(
+                select(self.items.c.id, self.items.c.name).where(self.items.c.id.in_([r[0] for r in ranked]))
+            ).fetchall())
+            return [
+                {"id": item_id, "name": names[item_id], "match_score": match_score}
+                for item_id, _, match_score in ranked if item_id in names
+            ]
 
     def get_price_history(self, item_id):
         with self.engine.connect() as conn:
@@ -508,194 +845,378 @@ class PriceDatabase:
                 for r in rows
             ]
 
+    def _admin_stmt(self, item_filter=None, after=None, limit=None):
+        """Items (optionally filtered, keyset-paged by (name, id)) with their most recent price."""
+        page = select(self.items.c.id, self.items.c.name)
+        if item_filter is not None:
+            page = page.where(item_filter)
+        if after is not None:
+            page = page.where(tuple_(self.items.c.name, self.items.c.id) > tuple_(*after))
+        page = page.order_by(self.items.c.name, self.items.c.id).limit(limit).subquery()
+
+        # Subquery to get latest price id per item (of this page only)
+        latest_price_sub = select(
+            self.prices.c.item_id,
+            func.max(self.prices.c.id).label('latest_id')
+        ).where(self.prices.c.item_id.in_(select(page.c.id))).group_by(self.prices.c.item_id).subquery()
+
+        return select(
+            page.c.id,
+            page.c.name,
+            self.prices.c.price_material,
+            self.prices.c.price_labor,
+            self.prices.c.unit,
+            self.sources.c.vendor,
+            self.sources.c.date_offer
+        ).select_from(
+            page
+            .outerjoin(latest_price_sub, page.c.id == latest_price_sub.c.item_id)
+            .outerjoin(self.prices, latest_price_sub.c.latest_id == self.prices.c.id)
+            .outerjoin(self.sources, self.prices.c.source_id == self.sources.c.id)
+        ).order_by(page.c.name, page.c.id)
+
+    @staticmethod
+    def _admin_row(r):
+        return {
+            "id": r.id,
+            "name": r.name,
+            "price_material": r.price_material or 0,
+            "price_labor": r.price_labor or 0,
+            "unit": r.unit or "ks",
+            "source": r.vendor or "N/A",
+            "date": str(r.date_offer) if r.date_offer else "N/A"
+        }
+
+    def _admin_rows(self, conn, item_filter=None):
+        """Rows of the admin sheet (all items, or those matching `item_filter`)."""
+        return [self._admin_row(r) for r in conn.execute(self._admin_stmt(item_filter)).fetchall()]
+
     def get_all_items_admin(self):
         """Fetch all items with their latest prices for administrative editing."""
         with self.engine.connect() as conn:
-            # We want the most recent price for each item
-            # Subquery to get latest price id per item
-            latest_price_sub = select(
-                self.prices.c.item_id,
-                func.max(self.prices.c.id).label('latest_id')
-            ).group_by(self.prices.c.item_id).subquery()
+            return self._admin_rows(conn)
 
-            stmt = select(
-                self.items.c.id,
-                self.items.c.name,
-                self.prices.c.price_material,
-                self.prices.c.price_labor,
-                self.prices.c.unit,
-                self.sources.c.vendor,
-                self.sources.c.date_offer
-            ).select_from(
-                self.items
-                .outerjoin(latest_price_sub, self.items.c.id == latest_price_sub.c.item_id)
-                .outerjoin(self.prices, latest_price_sub.c.latest_id == self.prices.c.id)
-                .outerjoin(self.sources, self.prices.c.source_id == self.sources.c.id)
-            ).order_by(self.items.c.name)
+    def get_admin_items_page(self, after=None, limit=1000):
+        """
+        One keyset page of admin rows ordered by (name, id) -> {"version", "items", "next"};
+        pass `next` as `after` for the following page. `version` is the catalog version
+        read before the page, a safe starting point for get_admin_changes().
+        """
+        with self.engine.connect() as conn:
+            version = self._get_catalog_version(conn)
+            rows = [self._admin_row(r) for r in conn.execute(self._admin_stmt(after=after, limit=limit)).fetchall()]
+        return {"version": version, "items": rows, "next": (rows[-1]["name"], rows[-1]["id"]) if len(rows) == limit else None}
 
-            rows = conn.execute(stmt).fetchall()
-            return [
-                {
-                    "id": r.id,
-                    "name": r.name,
-                    "price_material": r.price_material or 0,
-                    "price_labor": r.price_labor or 0,
-                    "unit": r.unit or "ks",
-                    "source": r.vendor or "N/A",
-                    "date": str(r.date_offer) if r.date_offer else "N/A"
-                }
-                for r in rows
-            ]
+    def iter_admin_items(self, batch_size=1000):
+        """Yield all admin rows as they are fetched (server-side cursor where the driver supports one)."""
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(self._admin_stmt())
+            for r in result:
+                yield self._admin_row(r)
 
-    def sync_admin_items(self, items_data):
-        """Bulk sync items and prices from admin sheet data."""
+    def get_admin_changes(self, since=0):
+        """
+        Admin rows changed after catalog version `since` -> {"version", "full", "items", "deleted"}.
+        `deleted` lists ids of items removed since then. A full snapshot ("full": True) is
+        returned for since=0, for versions the database does not know, and for versions from
+        before a reset (their deletions are no longer recorded).
+        """
         with self.engine.connect() as conn:
-            # Get user source
-            source_name = "user_input"
-            source_id = conn.execute(select(self.sources.c.id).where(self.sources.c.filename == source_name)).scalar()
-            if not source_id:
-                from datetime import date
-                result = conn.execute(self.sources.insert().values(
-                    filename=source_name,
-                    vendor="Uživatel (Změna)",
-                    date_offer=date.today()
-                ))
-                source_id = result.inserted_primary_key[0]
+            version = self._get_catalog_version(conn)
+            reset_version = self._get_reset_version(conn)
+            if not since or since > version or since < reset_version:
+                return {"version": version, "full": True, "items": self._admin_rows(conn), "deleted": []}
+            changed = conn.execute(
+                select(self.item_changes.c.item_id, self.item_changes.c.deleted)
+                .where(self.item_changes.c.version > since)
+            ).fetchall()
+            items = []
+            for chunk in self._chunks([r.item_id for r in changed if not r.deleted]):
+                items.extend(self._admin_rows(conn, self.items.c.id.in_(chunk)))
+            return {
+                "version": version,
+                "full": False,
+                "items": sorted(items, key=lambda r: r["name"]),
+                "deleted": [r.item_id for r in changed if r.deleted],
+            }
 
-            changes_count = 0
-            for it in items_data:
-                item_id = it.get('id')
-                name = it.get('name')
-                price_mat = float(it.get('price_material', 0) or 0)
-                price_lab = float(it.get('price_labor', 0) or 0)
-                unit = it.get('unit', 'ks')
+    @staticmethod
+    def _user_source_type(price_material, price_labor):
+        """Source type of a user-entered price (Iron Curtain logic)."""
+        if price_material > 0 and price_labor == 0:
+            return 'SUPPLIER'  # Material only -> treated as supplier data
+        if price_labor > 0 and price_material == 0:
+            return 'INTERNAL'  # Labor only -> treated as internal budget
+        return 'ADMIN'  # Both or neither -> admin entry
 
-                if not name:
-                    continue
+    def _get_or_create_source(self, conn, filename, vendor, source_type=None):
+        """Id of a user source by filename, created (dated today) on first use."""
+        source_id = conn.execute(select(self.sources.c.id).where(self.sources.c.filename == filename)).scalar()
+        if not source_id:
+            from datetime import date
+            values = dict(filename=filename, vendor=vendor, date_offer=date.today())
+            if source_type:
+                values["source_type"] = source_type
+            source_id = conn.execute(self.sources.insert().values(**values)).inserted_primary_key[0]
+        return source_id
+
+    def _latest_price_rows(self, conn, item_ids):
+        """{item_id: newest price row (by insertion)} for `item_ids`, one query per 5000 ids."""
+        latest = {}
+        for chunk in self._chunks(item_ids):
+            newest = (
+                select(func.max(self.prices.c.id))
+                .where(self.prices.c.item_id.in_(chunk))
+                .group_by(self.prices.c.item_id)
+            )
+            for r in conn.execute(
+                select(self.prices.c.item_id, self.prices.c.price_material, self.prices.c.price_labor, self.prices.c.unit)
+                .where(self.prices.c.id.in_(newest))
+            ):
+                latest[r.item_id] = r
+        return latest
+
+    def sync_admin_items(self, items_data, base_version=None):
+        """
+        Bulk sync items and prices from admin sheet data.
+        Current names and newest prices of all submitted ids are read up front and diffed in
+        memory; only changed names and prices are written, in bulk and in one transaction.
+
+        With `base_version` (the catalog version the sheet was loaded at), rows of items
+        changed by someone else since then are not applied and reported as conflicts.
+        A rename to a name another item has (or another row of the batch renames to) is not
+        applied either and comes back in `errors` as {"row", "id", "name", "error"} (row =
+        position in items_data); new rows with a name renamed to in the batch reuse that item.
+        Returns row counts {"unchanged", "updated", "inserted", "skipped"} (skipped: unknown ids),
+        the conflicting item ids, the row errors, the stored values of every saved or unchanged
+        row ("rows": [{"row", "id", "name", "price_material", "price_labor", "unit"}], names
+        cleaned as stored, so the sheet can keep ids and fingerprints of what the database has)
+        and the catalog version.
+        """
+        # Compare with tolerance (0.01) to avoid float precision issues
+        def floats_equal(a, b, tol=0.01):
+            return abs((a or 0) - (b or 0)) < tol
 
-                if item_id:
-                    # Update Item Name
-                    name = self._clean_item_name(name)
-                    conn.execute(self.items.update().where(self.items.c.id == item_id).values(
-                        name=name, normalized_name=name.lower().strip()
+        rows = []
+        for pos, it in enumerate(items_data):
+            name = self._clean_item_name(it.get('name') or '')
+            if not name:
+                continue
+            rows.append((
+                it.get('id'), name,
+                float(it.get('price_material', 0) or 0), float(it.get('price_labor', 0) or 0),
+                it.get('unit', 'ks'), pos
+            ))
+        known = [r for r in rows if r[0]]
+        new_rows = [r for r in rows if not r[0]]
+        counts = {"unchanged": 0, "updated": 0, "inserted": 0, "skipped": 0}
+        errors = []
+
+        with self.engine.connect() as conn:
+            # Lock first: the catalog_meta row lock serializes concurrent writers before the checks below
+            version = self._lock_catalog(conn)
+            ids = list(dict.fromkeys(r[0] for r in known))
+            conflicts = set()
+            if base_version is not None and base_version < self._get_reset_version(conn):
+                # Loaded before a reset: its ids may now belong to other items
+                conflicts.update(ids)
+            elif base_version is not None:
+                for chunk in self._chunks(ids):
+                    conflicts.update(r[0] for r in conn.execute(
+                        select(self.item_changes.c.item_id).where(
+                            self.item_changes.c.item_id.in_(chunk), self.item_changes.c.version > base_version
+                        )
                     ))
-                    
-                    # Check if prices actually changed (with tolerance for floats)
-                    existing_latest = conn.execute(
-                        select(self.prices.c.price_material, self.prices.c.price_labor, self.prices.c.unit)
-                        .where(self.prices.c.item_id == item_id)
-                        .order_by(self.prices.c.id.desc())
-                        .limit(1)
-                    ).fetchone()
-
-                    # Compare with tolerance (0.01) to avoid float precision issues
-                    def floats_equal(a, b, tol=0.01):
-                        return abs((a or 0) - (b or 0)) < tol
-
-                    if not existing_latest or (
-                        not floats_equal(existing_latest.price_material, price_mat) or 
-                        not floats_equal(existing_latest.price_labor, price_lab) or 
-                        existing_latest.unit != unit
-                    ):
-                        conn.execute(self.prices.insert().values(
-                            item_id=item_id,
-                            source_id=source_id,
-                            price_material=price_mat,
-                            price_labor=price_lab,
-                            unit=unit,
-                            quantity=1.0
-                        ))
-                        changes_count += 1
+            names = {}
+            for chunk in self._chunks(ids):
+                for r in conn.execute(select(self.items.c.id, self.items.c.name).where(self.items.c.id.in_(chunk))):
+                    names[r.id] = r.name
+            latest = self._latest_price_rows(conn, ids)
+            # Items currently holding the names that rows rename to (unique names)
+            holders = self._item_ids_by_name(conn, list(dict.fromkeys(
+                name for item_id, name, *_ in known if item_id in names and names[item_id] != name
+            )))
+
+            # 1. Diff existing rows in memory
+            stored_rows = []  # values the database holds for each saved or unchanged row
+            renamed = {}  # item_id -> new name
+            claimed = {}  # new name -> item_id renamed to it in this batch
+            new_prices = []  # (item_id, source filename, vendor, source_type, values)
+            for item_id, name, price_mat, price_lab, unit, pos in known:
+                if item_id in conflicts:
+                    continue
+                if item_id not in names:
+                    counts["skipped"] += 1
+                    continue
+                changed = False
+                if names[item_id] != name:
+                    if holders.get(name, item_id) != item_id or claimed.get(name, item_id) != item_id:
+                        errors.append({"row": pos, "id": item_id, "name": name,
+                                       "error": "Název už má jiná položka"})
+                        continue
+                    claimed[name] = item_id
+                    renamed[item_id] = names[item_id] = name
+                    changed = True
+                current = latest.get(item_id)
+                if not current or (
+                    not floats_equal(current.price_material, price_mat) or
+                    not floats_equal(current.price_labor, price_lab) or
+                    current.unit != unit
+                ):
+                    new_prices.append((item_id, "user_input", "Uživatel (Změna)", None, price_mat, price_lab, unit))
+                    changed = True
                 else:
-                    # New Item
-                    self.add_custom_item(name, price_mat, price_lab, unit)
-                    changes_count += 1
-            
+                    price_mat, price_lab, unit = current.price_material, current.price_labor, current.unit
+                counts["updated" if changed else "unchanged"] += 1
+                stored_rows.append({"row": pos, "id": item_id, "name": name, "price_material": price_mat,
+                                    "price_labor": price_lab, "unit": unit})
+
+            # 2. Renames first: names renamed away are free for new rows below
+            if renamed:
+                conn.execute(
+                    self.items.update().where(self.items.c.id == bindparam("item_id")),
+                    [{"item_id": i, "name": n, "normalized_name": n.lower().strip()} for i, n in renamed.items()]
+                )
+
+            # 3. New rows: reuse items with the same name (after the renames), create the rest
+            new_names = list(dict.fromkeys(r[1] for r in new_rows))
+            new_ids = self._item_ids_by_name(conn, new_names)
+            created = [n for n in new_names if n not in new_ids]
+            if created:
+                new_ids.update(self._insert_items(conn, created))
+            for _, name, price_mat, price_lab, unit, pos in new_rows:
+                stored_rows.append({"row": pos, "id": new_ids[name], "name": name, "price_material": price_mat,
+                                    "price_labor": price_lab, "unit": unit})
+                source_type = self._user_source_type(price_mat, price_lab)
+                new_prices.append((new_ids[name], f"user_input_{source_type.lower()}", "Uživatel", source_type,
+                                   price_mat, price_lab, unit))
+                counts["inserted"] += 1
+
+            # 4. Prices in bulk
+            sources = {}
+            for _, filename, vendor, source_type, *_ in new_prices:
+                if filename not in sources:
+                    sources[filename] = self._get_or_create_source(conn, filename, vendor, source_type)
+            if new_prices:
+                conn.execute(self.prices.insert(), [
+                    {"item_id": item_id, "source_id": sources[filename], "price_material": price_mat,
+                     "price_labor": price_lab, "unit": unit, "quantity": 1.0}
+                    for item_id, filename, _, _, price_mat, price_lab, unit in new_prices
+                ])
+
+            repriced = list(dict.fromkeys(p[0] for p in new_prices))
+            indexed = {**renamed, **{new_ids[n]: n for n in new_names}}
+            result = {**counts, "conflicts": sorted(conflicts), "errors": errors,
+                      "rows": sorted(stored_rows, key=lambda r: r["row"])}
+            if not indexed and not repriced:
+                # Nothing written: no new version, so indexes and match caches stay valid
+                conn.commit()
+                return {**result, "version": version}
+            self._refresh_latest_prices(conn, repriced)
+            version = self._bump_catalog_version(conn)
+            self._mark_changed(conn, version, list(indexed) + repriced)
             conn.commit()
-            return changes_count
+
+            def index_names(idx):
+                for item_id, name in indexed.items():
+                    idx.add_item(item_id, name.lower().strip())
+            self.index.apply(version, index_names)
+            # Repriced items can newly match queries of a source scope, like freshly ingested ones
+            priced_names = {**{i: names[i] for i in repriced if i in names}, **indexed}
+            self._notify(list(indexed) + repriced, [n.lower().strip() for n in priced_names.values()])
+            return {**result, "version": version}
 
     # Legacy V1 search support
     def search(self, query, limit=20, source_type_filter=None):
-        # Similar logic to search_items but returns full details
-        q_norm = query.lower().strip()
-        tokens = [t for t in q_norm.split() if len(t) > 2]
+        return self.search_many([query], limit=limit, source_type_filter=source_type_filter)[query]
+
+    def search_many(self, queries, limit=20, source_type_filter=None, exact_first=False):
+        """
+        Batch variant of search(): returns {query: [matches]} for many queries.
+        Duplicate descriptions are ranked once, and the whole batch runs a constant number
+        of statements (catalog version, priced item ids, latest prices of the winners)
+        instead of one candidate scan per query.
+
+        With exact_first, a query whose cleaned text equals an item name or a learned alias
+        returns that item first with match_score 1.0, followed by the ranked alternatives.
+        """
+        by_norm = {}
+        for q in queries:
+            by_norm.setdefault(q.lower().strip(), []).append(q)
         
         with self.engine.connect() as conn:
-            # Join items, prices, sources
-            j = self.prices.join(self.items).join(self.sources)
+            # Latest price per item and source type, from the maintained projection
             base_query = select(
                 self.items.c.id,
                 self.items.c.name.label('item'),
                 self.items.c.normalized_name,
-                self.prices.c.price_material,
-                self.prices.c.price_labor,
-                self.prices.c.unit,
-                self.sources.c.vendor.label('source'),
-                self.sources.c.date_offer.label('date')
-            ).select_from(j).order_by(self.sources.c.date_offer.desc())
+                self.latest_prices.c.price_material,
+                self.latest_prices.c.price_labor,
+                self.latest_prices.c.unit,
+                self.latest_prices.c.vendor.label('source'),
+                self.latest_prices.c.date_offer.label('date')
+            ).select_from(
+                self.latest_prices.join(self.items, self.latest_prices.c.item_id == self.items.c.id)
+            ).order_by(self.latest_prices.c.date_offer.desc().nulls_last(), self.latest_prices.c.price_id.desc())
             
             if source_type_filter:
-                base_query = base_query.where(self.sources.c.source_type.in_(source_type_filter))
-            
-            if not tokens:
-                stmt = base_query.where(self.items.c.normalized_name.ilike(f'%{q_norm}%')).limit(limit)
-                rows = conn.execute(stmt).fetchall()
-                return [dict(r._mapping) for r in rows]
-            
-            conditions = [self.items.c.normalized_name.ilike(f'%{t}%') for t in tokens]
-            alias_conditions = [self.item_aliases.c.alias.ilike(f'%{t}%') for t in tokens]
+                base_query = base_query.where(self.latest_prices.c.source_type.in_(source_type_filter))
             
-            # Subquery to get unique item_ids from aliases matching tokens
-            matching_alias_ids = select(self.item_aliases.c.item_id).where(or_(*alias_conditions))
+            index, version = self._sync_index(conn)
+            allowed = self._priced_item_ids(conn, version, source_type_filter)
             
-            stmt = base_query.where(or_(*conditions, self.items.c.id.in_(matching_alias_ids)))
+            ranked_by_norm = {}
+            results_by_norm = {}
+            for q_norm in by_norm:
+                hit = None
+                if exact_first:
+                    hit = index.exact(self._clean_item_name(q_norm).lower().strip(), allowed=allowed)
+                tokens = [t for t in q_norm.split() if len(t) > 2]
+                if hit is not None:
+                    # The exact hit leads; the ranked alternatives fill the remaining slots
+                    ranked = index.rank(q_norm, tokens, limit + 1, allowed=allowed) if tokens else []
+                    ranked_by_norm[q_norm] = [(hit, None, 1.0)] + [r for r in ranked if r[0] != hit][:limit - 1]
+                elif not tokens:
+                    stmt = base_query.where(self.items.c.normalized_name.ilike(f'%{q_norm}%')).limit(limit)
+                    results_by_norm[q_norm] = [dict(r._mapping) for r in conn.execute(stmt).fetchall()]
+                else:
+                    ranked_by_norm[q_norm] = index.rank(q_norm, tokens, limit, allowed=allowed)
             
-            rows = conn.execute(stmt).fetchall()
+            # Latest price row (by offer date, across the allowed source types) of every winner
+            winner_ids = {item_id for ranked in ranked_by_norm.values() for item_id, _, _ in ranked}
+            latest = {}
+            for chunk in self._chunks(winner_ids):
+                for r in conn.execute(base_query.where(self.items.c.id.in_(chunk))).fetchall():
+                    latest.setdefault(r.id, r)
             
-            scored = []
-            seen_ids = set()
-            for r in rows:
-                if r.id in seen_ids:
-                    continue
-                seen_ids.add(r.id)
-                
-                # Get aliases for scoring
-                item_aliases_rows = conn.execute(
-                    select(self.item_aliases.c.alias).where(self.item_aliases.c.item_id == r.id)
-                ).fetchall()
-                item_aliases_text = " ".join([al.alias for al in item_aliases_rows])
-                searchable_blob = (r.normalized_name + " " + item_aliases_text).lower()
-                
-                item_tokens = set(searchable_blob.split())
-                query_tokens = set(tokens)
-                overlap = len(item_tokens.intersection(query_tokens))
-                seq = difflib.SequenceMatcher(None, q_norm, searchable_blob).ratio()
-                
-                if overlap > 0:
-                    score = (overlap * 2) + seq
-                    
-                    # Calculate a better match_score (0-1) for the UI
-                    # If all query tokens are found in the searchable blob, the score should be high
-                    token_score = overlap / len(query_tokens) if query_tokens else 0
-                    
-                    # Fuzzy match against the full blob often yields low ratios for short queries
-                    # Let's also try fuzzy matching against the name and each alias separately
-                    best_fuzz = difflib.SequenceMatcher(None, q_norm, r.normalized_name).ratio()
-                    for al_row in item_aliases_rows:
-                        al_fuzz = difflib.SequenceMatcher(None, q_norm, al_row.alias).ratio()
-                        if al_fuzz > best_fuzz:
-                            best_fuzz = al_fuzz
-                    
-                    # Final match score for UI (weighted tokens + best fuzzy)
-                    ui_match_score = (token_score * 0.8) + (best_fuzz * 0.2)
-                    
-                    # Convert row to dict and add match_score
+            for q_norm, ranked in ranked_by_norm.items():
+                matches = []
+                for item_id, _, match_score in ranked:
+                    r = latest.get(item_id)
+                    if r is None:
+                        continue
                     d = dict(r._mapping)
-                    d['match_score'] = round(ui_match_score, 2)
-                    scored.append((score, d))
-            
-            scored.sort(key=lambda x: x[0], reverse=True)
-            return [x[1] for x in scored[:limit]]
+                    d['match_score'] = match_score
+                    matches.append(d)
+                results_by_norm[q_norm] = matches
+        
+        return {q: results_by_norm[q_norm] for q_norm, originals in by_norm.items() for q in originals}
+
+    def _priced_item_ids(self, conn, version, source_type_filter=None):
+        """Boolean mask (indexed by item id) of items priced by the given source types, cached per catalog version."""
+        key = tuple(sorted(source_type_filter)) if source_type_filter else None
+        cache = self._priced_ids_cache
+        if cache.get('version') != version:
+            cache = self._priced_ids_cache = {'version': version}
+        if key not in cache:
+            stmt = select(self.latest_prices.c.item_id).distinct()
+            if source_type_filter:
+                stmt = stmt.where(self.latest_prices.c.source_type.in_(source_type_filter))
+            ids = np.fromiter((r[0] for r in conn.execute(stmt).fetchall()), dtype=np.int64)
+            mask = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=bool)
+            mask[ids] = True
+            cache[key] = mask
+        return cache[key]
 
     def _clean_item_name(self, name):
         """
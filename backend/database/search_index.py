@@ -0,0 +1,309 @@
+import threading
+
+import numpy as np
+
+from database.similarity import TrigramMatrix
+
+
+class SearchIndex:
+    """
+    In-memory inverted index: search token -> ids of items whose name or aliases contain it.
+    Uses the same token rules as PriceDatabase.search (lowercase, whitespace split, len > 2),
+    so candidate generation touches only the postings of the query tokens instead of
+    running an ILIKE scan per token. Alias texts are kept per item as well, so scoring
+    candidates needs no further queries, and names/aliases are mirrored into a
+    TrigramMatrix for vectorised fuzzy scoring.
+
+    Full normalized names and aliases are also hashed for an O(1) exact-match tier.
+    """
+    MIN_TOKEN_LEN = 3
+    # Candidates (times the result limit) of highest token overlap that get a fuzzy score
+    RANK_POOL = 4
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None  # catalog version the index reflects (None = stale)
+        self._postings = {}  # token -> {item_id: refcount}
+        self._posting_arrays = {}  # token -> sorted np.ndarray of item ids (lazy)
+        self._name_tokens = {}  # item_id -> set of tokens from the item name
+        self._names = {}  # item_id -> normalized name
+        self._exact_names = {}  # normalized name -> set of item ids
+        self._exact_aliases = {}  # alias text -> {alias_id: item_id}
+        self._aliases = {}  # alias_id -> (item_id, set of tokens)
+        self._item_aliases = {}  # item_id -> {alias_id: alias text}
+        self._trigrams = TrigramMatrix()  # rows: ('name', item_id) / ('alias', alias_id)
+
+    @classmethod
+    def tokenize(cls, text):
+        if not text:
+            return set()
+        return {t for t in text.lower().split() if len(t) >= cls.MIN_TOKEN_LEN}
+
+    # --- Loading & versioning ---
+
+    def ensure(self, version, loader, replay=None):
+        """
+        Bring the index to `version` (no-op if already there or newer). `replay(since)` ->
+        (item_ids, item_rows, alias_rows) of the items changed after `since`, or None when
+        the changes are not known (reset, large gap); then the index is rebuilt from
+        `loader()` -> (item_rows, alias_rows).
+        """
+        with self.lock:
+            if self.version is not None and self.version >= version:
+                return
+            delta = replay(self.version) if replay is not None and self.version is not None else None
+            if delta is not None:
+                self._replay(*delta)
+                self.version = version
+                return
+            item_rows, alias_rows = loader()
+            self._postings = {}
+            self._posting_arrays = {}
+            self._name_tokens = {}
+            self._names = {}
+            self._exact_names = {}
+            self._exact_aliases = {}
+            self._aliases = {}
+            self._item_aliases = {}
+            self._trigrams = TrigramMatrix()
+            keys, owners, texts = [], [], []
+            for item_id, normalized_name in item_rows:
+                self._index_item(item_id, normalized_name)
+                keys.append(('name', item_id))
+                owners.append(item_id)
+                texts.append(normalized_name)
+            for alias_id, item_id, alias in alias_rows:
+                self._index_alias(alias_id, item_id, alias)
+                keys.append(('alias', alias_id))
+                owners.append(item_id)
+                texts.append(alias)
+            self._trigrams.load(keys, owners, texts)
+            self.version = version
+
+    def _replay(self, item_ids, item_rows, alias_rows):
+        """Re-read the names and aliases of `item_ids` (items missing from `item_rows` were deleted)."""
+        names = dict(item_rows)
+        aliases = {}
+        for alias_id, item_id, alias in alias_rows:
+            aliases.setdefault(item_id, {})[alias_id] = alias
+        for item_id in item_ids:
+            if item_id not in names:
+                self.remove_items([item_id])
+                continue
+            if self._names.get(item_id) != (names[item_id] or "").strip():
+                self.add_item(item_id, names[item_id])
+            current = aliases.get(item_id, {})
+            known = self._item_aliases.get(item_id, {})
+            self.remove_aliases([alias_id for alias_id in known if alias_id not in current])
+            for alias_id, alias in current.items():
+                if self._item_aliases.get(item_id, {}).get(alias_id) != alias:
+                    self.add_alias(alias_id, item_id, alias)
+
+    def apply(self, new_version, change):
+        """
+        Mirror a committed write into the index. The delta is only applied when the index
+        was exactly one version behind; otherwise another writer got in between and the
+        index keeps its older version, so the next read replays the missed changes.
+        """
+        with self.lock:
+            if self.version is not None and self.version == new_version - 1:
+                change(self)
+                self.version = new_version
+
+    def invalidate(self):
+        with self.lock:
+            self.version = None
+
+    # --- Mutations (idempotent, called under the lock) ---
+
+    def _link(self, item_id, tokens):
+        for t in tokens:
+            posting = self._postings.setdefault(t, {})
+            posting[item_id] = posting.get(item_id, 0) + 1
+            self._posting_arrays.pop(t, None)
+
+    def _unlink(self, item_id, tokens):
+        for t in tokens:
+            posting = self._postings.get(t)
+            if not posting or item_id not in posting:
+                continue
+            self._posting_arrays.pop(t, None)
+            if posting[item_id] <= 1:
+                del posting[item_id]
+                if not posting:
+                    del self._postings[t]
+            else:
+                posting[item_id] -= 1
+
+    def _forget_name(self, item_id):
+        self._unlink(item_id, self._name_tokens.pop(item_id, ()))
+        old = self._names.pop(item_id, None)
+        if old is not None:
+            ids = self._exact_names.get(old)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self._exact_names[old]
+
+    def _index_item(self, item_id, normalized_name):
+        self._forget_name(item_id)
+        tokens = self.tokenize(normalized_name)
+        self._name_tokens[item_id] = tokens
+        self._link(item_id, tokens)
+        key = (normalized_name or "").strip()
+        self._names[item_id] = key
+        self._exact_names.setdefault(key, set()).add(item_id)
+
+    def _index_alias(self, alias_id, item_id, alias):
+        self.remove_aliases([alias_id])
+        tokens = self.tokenize(alias)
+        self._aliases[alias_id] = (item_id, tokens)
+        self._item_aliases.setdefault(item_id, {})[alias_id] = alias
+        self._link(item_id, tokens)
+        self._exact_aliases.setdefault(alias.strip(), {})[alias_id] = item_id
+
+    def add_item(self, item_id, normalized_name):
+        """Add or rename an item."""
+        with self.lock:
+            self._index_item(item_id, normalized_name)
+            self._trigrams.set(('name', item_id), item_id, normalized_name)
+
+    def remove_items(self, item_ids):
+        with self.lock:
+            ids = set(item_ids)
+            for item_id in ids:
+                self._forget_name(item_id)
+                self._trigrams.remove(('name', item_id))
+                self.remove_aliases(list(self._item_aliases.get(item_id, ())))
+
+    def add_alias(self, alias_id, item_id, alias):
+        with self.lock:
+            self._index_alias(alias_id, item_id, alias)
+            self._trigrams.set(('alias', alias_id), item_id, alias)
+
+    def remove_aliases(self, alias_ids):
+        with self.lock:
+            for alias_id in alias_ids:
+                entry = self._aliases.pop(alias_id, None)
+                if entry:
+                    item_id, tokens = entry
+                    self._unlink(item_id, tokens)
+                    self._trigrams.remove(('alias', alias_id))
+                    item_aliases = self._item_aliases.get(item_id)
+                    if item_aliases is not None:
+                        alias = item_aliases.pop(alias_id, None)
+                        if not item_aliases:
+                            del self._item_aliases[item_id]
+                        same_text = self._exact_aliases.get((alias or "").strip())
+                        if same_text is not None:
+                            same_text.pop(alias_id, None)
+                            if not same_text:
+                                del self._exact_aliases[alias.strip()]
+
+    # --- Queries ---
+
+    def candidates(self, tokens):
+        """Union of the posting lists of `tokens`."""
+        with self.lock:
+            result = set()
+            for t in tokens:
+                posting = self._postings.get(t)
+                if posting:
+                    result.update(posting)
+            return result
+
+    def _posting_array(self, token):
+        arr = self._posting_arrays.get(token)
+        if arr is None:
+            posting = self._postings.get(token)
+            if not posting:
+                return None
+            arr = self._posting_arrays[token] = np.fromiter(sorted(posting), dtype=np.int32, count=len(posting))
+        return arr
+
+    def rank(self, query, tokens, limit, allowed=None):
+        """
+        Rank items sharing a token with the query -> [(item_id, rank_score, match_score)].
+
+        Same scoring as before: rank_score = overlap * 2 + fuzzy and
+        match_score = overlap / n_tokens * 0.8 + fuzzy * 0.2 (fuzzy = best trigram
+        similarity of name/aliases). Overlap counts come from merging the sorted posting
+        arrays, so a query costs O(postings touched), not O(largest item id). Fuzzy scores
+        are only computed for the RANK_POOL * limit items of highest overlap (lower ids
+        first within the boundary tier), since fuzzy <= 1 only reorders items within a tier.
+        `allowed` (boolean mask indexed by item id) restricts results, e.g. to items
+        priced in a source type.
+        """
+        query_tokens = set(tokens)
+        if not query_tokens or limit <= 0:
+            return []
+        with self.lock:
+            arrays = [a for a in (self._posting_array(t) for t in query_tokens) if a is not None]
+            if not arrays:
+                return []
+            merged = np.sort(np.concatenate(arrays)) if len(arrays) > 1 else arrays[0]
+            if allowed is not None:
+                if merged[-1] < len(allowed):
+                    merged = merged[allowed[merged]]
+                else:
+                    keep = merged < len(allowed)
+                    keep[keep] = allowed[merged[keep]]
+                    merged = merged[keep]
+            if not len(merged):
+                return []
+            starts = np.flatnonzero(np.concatenate(([True], merged[1:] != merged[:-1])))
+            ids, overlap = merged[starts], np.diff(np.append(starts, len(merged)))
+            pool = min(len(ids), self.RANK_POOL * limit)
+            if pool < len(ids):
+                # Overlap of the pool's last item: counts are small ints, so tiers beat a partition
+                reached = np.cumsum(np.bincount(overlap)[::-1])[::-1]  # items with overlap >= o
+                kth = int(np.flatnonzero(reached >= pool)[-1])
+                top = overlap > kth
+                top[np.flatnonzero(overlap == kth)[:pool - int(top.sum())]] = True
+                ids, overlap = ids[top], overlap[top]
+            fuzz = self._trigrams.best_by_owner(query, ids).astype(np.float64)
+
+        rank_scores = overlap * 2 + fuzz
+        match_scores = np.round((overlap / len(query_tokens)) * 0.8 + fuzz * 0.2, 2)
+        order = np.argsort(-rank_scores, kind='stable')[:limit]
+        return [(int(ids[i]), float(rank_scores[i]), float(match_scores[i])) for i in order]
+
+    def exact(self, key, allowed=None):
+        """
+        Item whose normalized name or learned alias equals `key`, or None.
+        Names win over aliases; among aliases the most recently learned one wins.
+        `allowed` (boolean mask indexed by item id) skips items outside the source filter.
+        """
+        def ok(item_id):
+            return allowed is None or (item_id < len(allowed) and allowed[item_id])
+
+        with self.lock:
+            for item_id in sorted(self._exact_names.get(key, ())):
+                if ok(item_id):
+                    return item_id
+            aliases = self._exact_aliases.get(key, {})
+            for alias_id in sorted(aliases, reverse=True):
+                if ok(aliases[alias_id]):
+                    return aliases[alias_id]
+        return None
+
+    def aliases_of(self, item_id):
+        """Learned aliases of an item (replaces a per-candidate SELECT in the scoring loop)."""
+        with self.lock:
+            return list(self._item_aliases.get(item_id, {}).values())
+
+    def fuzzy_scores(self, query, item_ids, include_aliases=True):
+        """
+        Best trigram similarity (0-1) of `query` against each item's name and,
+        optionally, its aliases -> {item_id: score}. One sparse mat-vec for all candidates.
+        """
+        item_ids = list(item_ids)
+        with self.lock:
+            if include_aliases:
+                sims = self._trigrams.best_by_owner(query, np.asarray(item_ids, dtype=np.int64))
+            else:
+                sims = self._trigrams.score(query, [('name', item_id) for item_id in item_ids])
+        return dict(zip(item_ids, sims.tolist()))
+
+    def __len__(self):
+        return len(self._name_tokens)
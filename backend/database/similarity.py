@@ -0,0 +1,229 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+
+class TrigramMatrix:
+    """
+    Character-trigram vectors of item names and aliases, kept as a CSR matrix
+    (indptr / indices / data arrays, L2-normalised counts).
+
+    A query is scored against any subset of rows with a single sparse gather +
+    bincount, i.e. a sparse mat-vec restricted to the candidate rows. Scores are
+    cosine similarities in [0, 1] and replace difflib's per-candidate ratio().
+
+    Trigrams are extracted with NumPy as well: texts are encoded to UTF-32 code
+    points and every trigram becomes one int64 code (3 x 21 bits), so building
+    the matrix for the whole catalog never loops over characters in Python.
+
+    Rows are addressed by hashable keys (e.g. ('alias', alias_id)) and carry an
+    integer owner (the item id), so the best score per item over all of its rows
+    can be taken without touching Python objects per candidate. Rows added or
+    removed after the last compaction live in a small pending set and are folded
+    into the CSR arrays once enough of them accumulate.
+    """
+    COMPACT_AFTER = 256
+
+    def __init__(self):
+        self._vocab = {}  # trigram code -> column
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int64)
+        self._data = np.zeros(0, dtype=np.float32)
+        self._owner = np.zeros(0, dtype=np.int64)  # row -> owner id
+        self._live = np.zeros(0, dtype=bool)  # False for rows removed since compaction
+        self._row_of = {}  # key -> row in the compiled arrays
+        self._pending = {}  # key -> (owner, cols, vals) not yet compiled
+        self._removed = 0  # compiled rows that are no longer referenced
+        # Owner index over the compiled rows (CSR by owner): rows of _owner_ids[i] are
+        # _owner_rows[_owner_ptr[i]:_owner_ptr[i + 1]]
+        self._owner_ids = np.zeros(0, dtype=np.int64)
+        self._owner_ptr = np.zeros(1, dtype=np.int64)
+        self._owner_rows = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _pad(text):
+        text = " ".join((text or "").lower().split())
+        return f"  {text} " if text else ""
+
+    def _encode(self, texts, grow):
+        """
+        Vectorise `texts` -> CSR parts (indptr, cols, vals), one row per text.
+        With grow=False unseen trigrams are dropped but still count towards the norm.
+        """
+        padded = [self._pad(t) for t in texts]
+        lengths = np.fromiter((len(p) for p in padded), dtype=np.int64, count=len(padded))
+        cp = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+
+        # A trigram starting at i is valid when i and i + 2 belong to the same text
+        owner = np.repeat(np.arange(len(padded)), lengths)
+        valid = owner[:-2] == owner[2:] if len(cp) >= 3 else np.zeros(0, dtype=bool)
+        codes = ((cp[:-2] << 42) | (cp[1:-1] << 21) | cp[2:])[valid] if len(cp) >= 3 else cp[:0]
+        rows = owner[:-2][valid] if len(cp) >= 3 else owner[:0]
+
+        uniq, inverse = np.unique(codes, return_inverse=True)
+        if grow:
+            vocab = self._vocab
+            uniq_cols = np.fromiter((vocab.setdefault(c, len(vocab)) for c in uniq.tolist()), dtype=np.int64, count=len(uniq))
+        else:
+            uniq_cols = np.fromiter((self._vocab.get(c, -1) for c in uniq.tolist()), dtype=np.int64, count=len(uniq))
+        cols = uniq_cols[inverse]
+
+        # Count (row, trigram) pairs; unknown trigrams get column -1 but are kept for the norm
+        width = max(len(self._vocab), 1) + 1
+        pairs, counts = np.unique(rows * width + (cols + 1), return_counts=True)
+        pair_rows = pairs // width
+        pair_cols = pairs % width - 1
+        counts = counts.astype(np.float32)
+        norms = np.sqrt(np.bincount(pair_rows, weights=counts * counts, minlength=len(padded)))
+        vals = counts / norms[pair_rows]
+
+        known = pair_cols >= 0
+        indptr = np.zeros(len(padded) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pair_rows[known], minlength=len(padded)), out=indptr[1:])
+        return indptr, pair_cols[known], vals[known].astype(np.float32)
+
+    def load(self, keys, owners, texts):
+        """Replace the whole matrix with `texts` (bulk build, fully vectorised)."""
+        self._vocab = {}
+        self._indptr, self._indices, self._data = self._encode(texts, grow=True)
+        self._owner = np.asarray(owners, dtype=np.int64)
+        self._live = np.ones(len(keys), dtype=bool)
+        self._row_of = {k: i for i, k in enumerate(keys)}
+        self._pending = {}
+        self._removed = 0
+        self._index_owners()
+
+    def _index_owners(self):
+        self._owner_rows = np.argsort(self._owner, kind="stable")
+        self._owner_ids, counts = np.unique(self._owner, return_counts=True)
+        self._owner_ptr = np.zeros(len(self._owner_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self._owner_ptr[1:])
+
+    def set(self, key, owner, text):
+        _, cols, vals = self._encode([text], grow=True)
+        self.remove(key)
+        self._pending[key] = (owner, cols, vals)
+
+    def remove(self, key):
+        self._pending.pop(key, None)
+        row = self._row_of.pop(key, None)
+        if row is not None:
+            self._live[row] = False
+            self._removed += 1
+
+    @staticmethod
+    def _ranges(starts, lengths):
+        """Concatenation of the ranges [start, start + length) as one flat index array."""
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return np.arange(lengths.sum(), dtype=np.int64) + offsets
+
+    def _gather(self, rows):
+        """Flat positions of the non-zeros of compiled `rows` and their row lengths."""
+        starts = self._indptr[rows]
+        lengths = self._indptr[rows + 1] - starts
+        return self._ranges(starts, lengths), lengths
+
+    def compact(self):
+        keys = list(self._row_of)
+        rows = np.fromiter(self._row_of.values(), dtype=np.int64, count=len(keys))
+        flat, lengths = self._gather(rows)
+        indices = [self._indices[flat]]
+        data = [self._data[flat]]
+        lengths = [lengths]
+        owners = [self._owner[rows]]
+        for key, (owner, cols, vals) in self._pending.items():
+            keys.append(key)
+            indices.append(cols)
+            data.append(vals)
+            lengths.append(np.array([len(cols)], dtype=np.int64))
+            owners.append(np.array([owner], dtype=np.int64))
+        self._indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(lengths), out=self._indptr[1:])
+        self._indices = np.concatenate(indices)
+        self._data = np.concatenate(data)
+        self._owner = np.concatenate(owners)
+        self._live = np.ones(len(keys), dtype=bool)
+        self._row_of = {k: i for i, k in enumerate(keys)}
+        self._pending = {}
+        self._removed = 0
+        self._index_owners()
+
+    def _query(self, text):
+        """Dense query vector over the vocabulary, or None if it shares no trigram with it."""
+        if len(self._pending) + self._removed > self.COMPACT_AFTER:
+            self.compact()
+        # One short text: counting its trigrams in Python beats the vectorised encoder's overhead
+        padded = self._pad(text)
+        cp = [ord(ch) for ch in padded]
+        counts = Counter((cp[i] << 42) | (cp[i + 1] << 21) | cp[i + 2] for i in range(len(cp) - 2))
+        cols = {self._vocab.get(code, -1): n for code, n in counts.items()}
+        cols.pop(-1, None)
+        if not cols:
+            return None
+        norm = np.float32(math.sqrt(sum(n * n for n in counts.values())))
+        q = np.zeros(len(self._vocab), dtype=np.float32)
+        q[np.fromiter(cols, dtype=np.int64, count=len(cols))] = np.fromiter(cols.values(), dtype=np.float32, count=len(cols)) / norm
+        return q
+
+    def _dot_rows(self, rows, q):
+        flat, lengths = self._gather(rows)
+        products = self._data[flat] * q[self._indices[flat]]
+        segment = np.repeat(np.arange(len(rows)), lengths)
+        return np.bincount(segment, weights=products, minlength=len(rows))
+
+    def score(self, text, keys):
+        """Cosine similarity of `text` against the rows `keys` -> float array aligned with keys."""
+        out = np.zeros(len(keys), dtype=np.float32)
+        q = self._query(text) if keys else None
+        if q is None:
+            return out
+
+        positions, rows = [], []
+        for pos, key in enumerate(keys):
+            row = self._row_of.get(key)
+            if row is not None:
+                positions.append(pos)
+                rows.append(row)
+            else:
+                pending = self._pending.get(key)
+                if pending is not None:
+                    _, cols, vals = pending
+                    out[pos] = float(np.dot(vals, q[cols]))
+
+        if rows:
+            out[np.asarray(positions)] = self._dot_rows(np.asarray(rows, dtype=np.int64), q)
+        return np.clip(out, 0.0, 1.0)
+
+    def best_by_owner(self, text, owners):
+        """
+        Best similarity of `text` over all rows of each owner -> float array aligned
+        with `owners` (unique ints). Only the candidates' rows are gathered, through the
+        owner index, so the cost follows the candidates, not the size of the matrix.
+        """
+        owners = np.asarray(owners, dtype=np.int64)
+        out = np.zeros(len(owners), dtype=np.float32)
+        q = self._query(text) if len(owners) else None
+        if q is None:
+            return out
+
+        if len(self._owner_ids):
+            at = np.searchsorted(self._owner_ids, owners)
+            found = np.nonzero(self._owner_ids[np.minimum(at, len(self._owner_ids) - 1)] == owners)[0]
+            if len(found):
+                starts = self._owner_ptr[at[found]]
+                lengths = self._owner_ptr[at[found] + 1] - starts
+                rows = self._owner_rows[self._ranges(starts, lengths)]
+                scores = (self._dot_rows(rows, q) * self._live[rows]).astype(np.float32)
+                out[found] = np.maximum.reduceat(scores, np.cumsum(lengths) - lengths)
+
+        if self._pending:
+            pos_of = {owner: pos for pos, owner in enumerate(owners.tolist())}
+            for owner, cols, vals in self._pending.values():
+                pos = pos_of.get(owner)
+                if pos is not None:
+                    out[pos] = max(out[pos], float(np.dot(vals, q[cols])))
+        return np.clip(out, 0.0, 1.0)
+
+    def __len__(self):
+        return len(self._row_of) + len(self._pending)
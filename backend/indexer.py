@@ -4,6 +4,8 @@ import tempfile
 
 # Add current dir to path to import local modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Processors import their siblings as top-level packages (like the API does)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from backend.database.price_db import PriceDatabase
 from backend.processors.excel_processor import ExcelProcessor
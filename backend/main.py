@@ -1,10 +1,12 @@
+import base64
+import json
 import os
-import shutil
 import sys
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -14,6 +16,7 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from services.data_manager import DataManager  # noqa: E402
+from services.upload_buffer import UploadBuffer  # noqa: E402
 
 app = FastAPI(title="AI Pricing Assistant API v2")
 
@@ -37,6 +40,48 @@ class MatchRequest(BaseModel):
     type: Optional[str] = "material"  # "material" or "labor"
     threshold: Optional[float] = 0.4
 
+def _build_match_result(matches, price_field, threshold):
+    """Best match above `threshold` with the price for the requested type, or None."""
+    if not matches:
+        return None
+    best = matches[0]
+    best_score = best.get('match_score', 0)
+    
+    # Use threshold
+    if best_score < threshold:
+        return None
+    
+    # Return the specific price based on type + both prices for compatibility
+    return {
+        "price": best.get(price_field, 0),
+        "price_material": best.get('price_material', 0),  # Both for direct use
+        "price_labor": best.get('price_labor', 0),
+        "unit": best.get('unit', 'ks'),
+        "source": best.get('source'),
+        "date": str(best.get('date')),
+        "item_id": best.get('id'),
+        "original_name": best.get('item'),
+        "match_score": best_score,
+        # Always provide all candidates so user can pick alternatives
+        "candidates": matches
+    }
+
+def _search_and_cache(items, scope, source_filter):
+    """Batch search `items` -> {item: top candidates} and store them in the match cache."""
+    if not items:
+        return {}
+    # Exact name/alias hits first, then fuzzy
+    matches_by_item = manager.db.search_many(items, limit=10, source_type_filter=source_filter, exact_first=True)
+    ranked = {}
+    new_entries = []
+    for item in items:
+        candidates = (matches_by_item.get(item) or [])[:5]
+        ranked[item] = candidates
+        # Store with the items and tokens the result depends on, for invalidation
+        new_entries.append((item, scope, candidates, {c.get('id') for c in candidates}, manager.db.query_tokens(item)))
+    manager.cache.set_many(new_entries)
+    return ranked
+
 @app.post("/match")
 def match_items(req: MatchRequest):
     results = {}
@@ -44,49 +89,43 @@ def match_items(req: MatchRequest):
     
     # "Iron Curtain" Logic:
     source_filter = ['INTERNAL', 'ADMIN'] if req.type == 'labor' else ['SUPPLIER', 'ADMIN']
+    scope = tuple(source_filter)
+
+    # 1. Check Cache (ranked candidates per query and source filter, [] = no candidates)
+    ranked = {}
+    misses = []
+    for item in dict.fromkeys(req.items):
+        cached = manager.cache.get(item, scope)
+        if cached is not None:
+            ranked[item] = cached
+        else:
+            misses.append(item)
 
-    for item in req.items:
-        # 1. Check Cache
-        cached = manager.cache.get(item, req.type, req.threshold)
-        if cached:
-            results[item] = cached
+    # 2. Search DB for the misses; identical queries already being searched by concurrent
+    #    requests are awaited instead of searched again (single-flight)
+    keys = {item: (item.lower().strip(), scope) for item in misses}
+    mine, theirs = manager.flights.lead(set(keys.values()))
+    computed = {}
+    try:
+        computed = _search_and_cache([item for item in misses if keys[item] in mine], scope, source_filter)
+    finally:
+        manager.flights.finish(mine, {keys[item]: candidates for item, candidates in computed.items()})
+    ranked.update(computed)
+
+    waited = manager.flights.wait(theirs)
+    leftover = []
+    for item in misses:
+        if item in ranked:
             continue
-
-        # 2. Search DB
-        matches = manager.db.search(item, limit=10, source_type_filter=source_filter)
-        if matches:
-            best = matches[0]
-            best_score = best.get('match_score', 0)
-            
-            # Use threshold
-            if best_score < req.threshold:
-                results[item] = None
-                continue
-
-            # Always provide all candidates so user can pick alternatives
-            candidates = matches[:5]
-            
-            # Return the specific price based on type + both prices for compatibility
-            specific_price = best.get(price_field, 0)
-            
-            match_result = {
-                "price": specific_price,  # Always return price (for cache)
-                "price_material": best.get('price_material', 0),  # Both for direct use
-                "price_labor": best.get('price_labor', 0),
-                "unit": best.get('unit', 'ks'),
-                "source": best.get('source'),
-                "date": str(best.get('date')),
-                "item_id": best.get('id'),
-                "original_name": best.get('item'),
-                "match_score": best_score,
-                "candidates": candidates
-            }
-            results[item] = match_result
-            
-            # 3. Store in Cache
-            manager.cache.set(item, req.type, req.threshold, match_result)
+        if keys[item] in waited:
+            ranked[item] = waited[keys[item]]
         else:
-            results[item] = None
+            leftover.append(item)  # leader failed or timed out -> search ourselves
+    ranked.update(_search_and_cache(leftover, scope, source_filter))
+
+    # 3. Threshold and price type are applied per request, on top of the shared ranking
+    for item in dict.fromkeys(req.items):
+        results[item] = _build_match_result(ranked[item], price_field, req.threshold)
     return results
 
 class SuggestionRequest(BaseModel):
@@ -185,35 +224,82 @@ def get_status():
             "status": "online", 
             "total_items": stats['items'], 
             "total_prices": stats['prices'],
-            "cache_size": manager.cache.get_stats(),
+            "cache_size": len(manager.cache),
+            "cache": manager.cache.get_stats(),
+            "match_inflight": manager.flights.get_stats(),
+            "ingest_jobs": manager.ingest.get_stats(),
             "database_path": stats['url']
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 @app.post("/ingest/upload")
-async def ingest_file(file: UploadFile = File(...), file_type: Optional[str] = Form(None)):
-    temp_path = f"Input/temp_{file.filename}"
-    os.makedirs("Input", exist_ok=True)
-    
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    result = manager.process_file(temp_path, file_type_override=file_type)
-    
-    # Cleanup
-    if os.path.exists(temp_path):
-        os.remove(temp_path)
+def ingest_file(file: UploadFile = File(...), file_type: Optional[str] = Form(None)):
+    """Buffer the upload and queue it for background processing; poll /ingest/jobs/{job_id} for progress."""
+    filename = os.path.basename(file.filename or "upload")
+    # Read once: hashed while buffering, parsed from the same buffer (no shared temp path)
+    upload = UploadBuffer.from_fileobj(file.file, filename, max_memory=manager.upload_spool_bytes)
     
-    # Invalidate all cache after new data ingestion
-    manager.cache.clear()
-        
-    return result
+    # Affected cache entries are invalidated by the catalog change listener once the job saves
+    job = manager.ingest.submit(upload, filename, file_type=file_type)
+    if job is None:
+        upload.close()
+        raise HTTPException(status_code=503, detail="Ingest queue is full, try again later")
+    return {"status": "queued", "job_id": job.id, "filename": filename}
+
+@app.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    """Status, progress (sheets/chunks done, items extracted), errors and final result of an upload."""
+    job = manager.ingest.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
     
+MAX_PAGE_SIZE = 5000
+
+def _encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor, valid):
+    """Position encoded in `cursor`; 400 unless it decodes and passes `valid`."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        position = None
+    if position is None or not valid(position):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+def _page_size(limit):
+    return max(1, min(limit or 1000, MAX_PAGE_SIZE))
+
+def _ndjson(rows):
+    """Stream rows as newline-delimited JSON while they are read from the database."""
+    return StreamingResponse((json.dumps(r, ensure_ascii=False) + "\n" for r in rows), media_type="application/x-ndjson")
+
 @app.get("/admin/items")
-def get_admin_items():
-    """Get all items with latest prices for the admin sync sheet."""
-    return manager.db.get_all_items_admin()
+def get_admin_items(since: Optional[int] = None, cursor: Optional[str] = None, limit: Optional[int] = None,
+                    format: Optional[str] = None):
+    """
+    Get all items with latest prices for the admin sync sheet.
+    - `since` (a catalog version, 0 for a full load): only rows changed after it, plus deleted
+      ids and the current version: {"version", "full", "items", "deleted"}.
+    - `limit` / `cursor`: keyset pages {"version", "items", "next_cursor"} ordered by name.
+    - `format=ndjson`: all rows streamed as newline-delimited JSON.
+    """
+    if since is not None:
+        return manager.db.get_admin_changes(since)
+    if format == "ndjson":
+        return _ndjson(manager.db.iter_admin_items())
+    if limit is None and cursor is None:
+        return manager.db.get_all_items_admin()
+    after = None
+    if cursor:
+        after = tuple(_decode_cursor(cursor, lambda p: isinstance(p, list) and len(p) == 2 and isinstance(p[0], str)
+                                     and isinstance(p[1], int) and not isinstance(p[1], bool)))
+    page = manager.db.get_admin_items_page(after=after, limit=_page_size(limit))
+    return {"version": page["version"], "items": page["items"],
+            "next_cursor": _encode_cursor(list(page["next"])) if page["next"] else None}
 
 class AdminSyncItem(BaseModel):
     id: Optional[int]
@@ -229,14 +315,15 @@ def batch_delete_items(item_ids: List[int]):
     return {"status": "success", "deleted_count": len(item_ids)}
 
 @app.post("/admin/sync")
-def sync_admin_data(items: List[AdminSyncItem]):
-    """Sync changes from the admin sheet to the database."""
+def sync_admin_data(items: List[AdminSyncItem], base_version: Optional[int] = None):
+    """
+    Sync changes from the admin sheet to the database. The sheet may send only changed rows;
+    with `base_version` rows of items changed by others since then come back as conflicts.
+    """
     # Convert Pydantic models to dicts
     data = [it.dict() for it in items]
-    manager.db.sync_admin_items(data)
-    # Invalidate all cache after sync
-    manager.cache.clear()
-    return {"status": "success", "synced_count": len(data)}
+    result = manager.db.sync_admin_items(data, base_version=base_version)
+    return {"status": "success", "synced_count": len(data), **result}
 
 @app.post("/admin/reset-database")
 def reset_database():
@@ -246,15 +333,23 @@ def reset_database():
     return {"status": "success", "message": "Database has been completely reset."}
 
 @app.get("/admin/aliases")
-def get_aliases():
-    """List all learned aliases for debugging."""
-    return manager.db.get_all_aliases()
+def get_aliases(cursor: Optional[str] = None, limit: Optional[int] = None, format: Optional[str] = None):
+    """
+    List all learned aliases for debugging. Supports keyset pages (`limit` / `cursor`,
+    {"items", "next_cursor"}) and `format=ndjson` streaming like /admin/items.
+    """
+    if format == "ndjson":
+        return _ndjson(manager.db.iter_aliases())
+    if limit is None and cursor is None:
+        return manager.db.get_all_aliases()
+    after = _decode_cursor(cursor, lambda p: isinstance(p, int) and not isinstance(p, bool)) if cursor else None
+    page = manager.db.get_aliases_page(after=after, limit=_page_size(limit))
+    return {"items": page["items"], "next_cursor": _encode_cursor(page["next"]) if page["next"] else None}
 
 @app.post("/admin/aliases/batch-delete")
 def batch_delete_aliases(alias_ids: List[int]):
     """Delete multiple aliases by their IDs."""
     manager.db.delete_aliases(alias_ids)
-    manager.cache.clear()
     return {"status": "success", "deleted_count": len(alias_ids)}
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import math
+import re
+import unicodedata
+import pandas as pd
+
+
+class ExcelProcessor:
+    """
+    Rule-based extraction of priced rows from spreadsheets in known layouts (no AI).
+
+    The header row is found by keywords in the first rows of a sheet, its columns are
+    mapped to roles (description, unit, quantity, material / labor unit price) and the
+    rows below are read with Czech number parsing ("1 234,50 Kč"). A sheet is accepted
+    only if the mapping is confident; otherwise extract_sheet() returns None with the
+    reason, and the caller sends the sheet to the AI.
+    """
+    HEADER_SCAN_ROWS = 30
+    # Share of described data rows that must carry a parseable unit price
+    MIN_PRICED_SHARE = 0.5
+
+    # Header patterns per role in order of preference, matched against lowercased headers
+    # without diacritics. Roles are assigned in this order, so "Cena MJ" is a price, not a unit.
+    ROLE_PATTERNS = [
+        ("price_labor", [r"^montaz a\b", r"^montaz\s*/\s*mj", r"^cena (montaze|prace)", r"^prace\s*/\s*mj"]),
+        ("price_material", [r"^dodavka a\b", r"^dodavka\s*/\s*mj", r"po sleve", r"^cena\s*/?\s*(za )?mj",
+                            r"^jedn(otkova|\.)?\s*cena", r"^cena bez dph", r"^unit price"]),
+        ("quantity", [r"^(mnozstvi|pocet|vymera|mn\.|qty|quantity)"]),
+        ("unit", [r"^(mj|m\.\s?j\.|jednotka|merna jednotka|unit)$"]),
+        # "Položka" / "Označení" only as the whole header: "Položka č.", "Označení položky" are item codes
+        ("description", [r"^popis", r"^nazev", r"^(text|specifikace|description)", r"^(polozka|oznaceni)$"]),
+    ]
+    # Totals, percentages and discounts are never unit prices
+    NOT_PRICE_RE = re.compile(r"celkem|total|%|^sleva")
+    # Summary rows inside the data
+    SUMMARY_RE = re.compile(r"^(celkem|soucet|mezisoucet|cena celkem|zaklad dane|dph|total|rekapitulace)\b")
+    # Price columns of the company's own budget template ("Dodávka A" / "Montáž A")
+    TEMPLATE_PRICE_RE = {"price_material": re.compile(r"^dodavka a\b"), "price_labor": re.compile(r"^montaz a\b")}
+
+    @staticmethod
+    def _normalize(value):
+        text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+        return re.sub(r"\s+", " ", text).strip().lower()
+
+    @staticmethod
+    def parse_number(value):
+        """Czech/plain number -> float or None: 1234.5, "1 234,50", "1.234,50 Kč", "120,-"."""
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return None if math.isnan(value) else float(value)
+        text = re.sub(r"\s", "", str(value)).lower()
+        text = re.sub(r"(kč|czk|eur|€|,-|\.-)$", "", text)
+        if not text:
+            return None
+        if re.fullmatch(r"-?\d{1,3}(\.\d{3})+(,\d+)?", text):
+            text = text.replace(".", "").replace(",", ".")  # 1.234,50
+        elif re.fullmatch(r"-?\d{1,3}(,\d{3})+\.\d+", text):
+            text = text.replace(",", "")  # 1,234.50
+        else:
+            text = text.replace(",", ".")
+        try:
+            return float(text)
+        except ValueError:
+            return None
+
+    def _map_header(self, cells):
+        """{role: column position} for one candidate header row."""
+        headers = [self._normalize(c) if isinstance(c, str) else "" for c in cells]
+        roles, taken = {}, set()
+        for role, patterns in self.ROLE_PATTERNS:
+            for pattern in patterns:
+                pos = next((
+                    pos for pos, header in enumerate(headers)
+                    if header and pos not in taken and re.search(pattern, header)
+                    and not (role.startswith("price") and self.NOT_PRICE_RE.search(header))
+                ), None)
+                if pos is not None:
+                    roles[role] = pos
+                    taken.add(pos)
+                    break
+        return roles
+
+    def _find_header(self, raw):
+        """(row index, roles) of the first row mapping a description and a price column, or (None, {})."""
+        for idx in range(min(self.HEADER_SCAN_ROWS, len(raw))):
+            roles = self._map_header(raw.iloc[idx].tolist())
+            if "description" in roles and ("price_material" in roles or "price_labor" in roles):
+                return idx, roles
+        return None, {}
+
+    def extract_sheet(self, raw):
+        """
+        Items of one sheet read without a header (pd.read_excel(..., header=None))
+        -> ({"items", "layout", "header_row", "columns"}, None), or (None, reason).
+        """
+        header_row, roles = self._find_header(raw)
+        if header_row is None:
+            return None, "no header with description and price columns"
+
+        described = 0
+        items = []
+        for row in raw.iloc[header_row + 1:].itertuples(index=False):
+            desc = row[roles["description"]]
+            if not isinstance(desc, str) or not re.search(r"[^\W\d_]", desc):
+                continue
+            desc = re.sub(r"\s+", " ", desc).strip()
+            if self.SUMMARY_RE.match(self._normalize(desc)):
+                continue
+            described += 1
+            material = self.parse_number(row[roles["price_material"]]) if "price_material" in roles else None
+            labor = self.parse_number(row[roles["price_labor"]]) if "price_labor" in roles else None
+            if not (material and material > 0) and not (labor and labor > 0):
+                continue  # section titles, notes, unpriced rows
+            unit = row[roles["unit"]] if "unit" in roles else None
+            quantity = self.parse_number(row[roles["quantity"]]) if "quantity" in roles else None
+            items.append({
+                "raw_name": desc,
+                "price_material": material if material and material > 0 else 0.0,
+                "price_labor": labor if labor and labor > 0 else 0.0,
+                "unit": re.sub(r"\s+", " ", unit).strip() if isinstance(unit, str) and unit.strip() else "ks",
+                "quantity": quantity if quantity and quantity > 0 else 1.0,
+            })
+
+        if not items:
+            return None, "no priced rows under the header"
+        if len(items) < self.MIN_PRICED_SHARE * described:
+            return None, f"only {len(items)} of {described} rows priced"
+
+        header = raw.iloc[header_row].tolist()
+        template = all(role in roles and pattern.search(self._normalize(header[roles[role]]))
+                       for role, pattern in self.TEMPLATE_PRICE_RE.items())
+        layout = "internal_budget" if template else "price_list"
+        return {
+            "items": items,
+            "layout": layout,
+            "header_row": header_row,
+            "columns": {role: str(header[pos]).strip() for role, pos in roles.items()},
+        }, None
+
+    def extract_data(self, path, is_internal=False):
+        """All items of the workbook's confidently mapped sheets (internal budgets keep labor only)."""
+        items = []
+        for sheet_name, raw in pd.read_excel(path, sheet_name=None, header=None).items():
+            result, reason = self.extract_sheet(raw)
+            if result is None:
+                print(f"  Sheet '{sheet_name}' skipped: {reason}")
+                continue
+            items.extend(result["items"])
+        if is_internal:
+            for it in items:
+                it["price_material"] = 0.0
+        return items
@@ -1,83 +1,205 @@
 import fitz  # PyMuPDF
+import multiprocessing
 import re
 import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from processors.excel_processor import ExcelProcessor
+
+# Document opened once per pool worker (see PDFProcessor.iter_page_texts)
+_worker_doc = None
+
+
+def _open(source):
+    """fitz document from a path or from the file's bytes."""
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _init_worker(source):
+    global _worker_doc
+    _worker_doc = _open(source)
+
+
+def _worker_pages(numbers):
+    return [(n, PDFProcessor.page_text(_worker_doc[n])) for n in numbers]
+
 
 class PDFProcessor:
-    def __init__(self):
-        pass
+    """
+    Page-level PDF reading. Each page is rebuilt from PyMuPDF word coordinates into
+    visual lines of tab-separated cells; below a recognized table header the cells are
+    aligned to the header's columns, so a table row reads like a spreadsheet row and is
+    parsed by the same rules as Excel sheets (ExcelProcessor). Documents of
+    parallel_min_pages+ pages are parsed in a process pool; pages come out in order as
+    they finish.
+    """
+    # Bump when page_text() output changes (cached page texts are keyed by it)
+    PARSER_VERSION = "1"
+    # A horizontal gap wider than this share of the line height separates two cells
+    CELL_GAP = 0.5
+    TABLES = ExcelProcessor()
+
+    def __init__(self, workers=None, parallel_min_pages=32, batch_pages=8):
+        self.workers = workers if workers is not None else min(4, os.cpu_count() or 1)
+        self.parallel_min_pages = parallel_min_pages
+        self.batch_pages = batch_pages
+
+    # --- Page layout ---
+
+    @staticmethod
+    def _visual_lines(page):
+        """Words grouped into lines by vertical position -> [([(x0, x1, word)], height)] top to bottom."""
+        words = sorted(page.get_text("words"), key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+        lines, current, center, height = [], [], None, 0.0
+        for x0, y0, x1, y1, word, *_ in words:
+            mid = (y0 + y1) / 2
+            if current and abs(mid - center) > max(height, y1 - y0) / 2:
+                lines.append((sorted(current), height))
+                current = []
+            if not current:
+                center, height = mid, y1 - y0
+            current.append((x0, x1, word))
+        if current:
+            lines.append((sorted(current), height))
+        return lines
+
+    @classmethod
+    def _cells(cls, words, height):
+        """Words of one line joined into cells -> [(x0, x1, text)]."""
+        cells = []
+        for x0, x1, word in words:
+            if cells and x0 - cells[-1][1] <= cls.CELL_GAP * height:
+                cells[-1] = (cells[-1][0], x1, f"{cells[-1][2]} {word}")
+            else:
+                cells.append((x0, x1, word))
+        return cells
+
+    @staticmethod
+    def _column_spans(header):
+        """Header cells widened to meet halfway between neighbours -> [(left, right)]."""
+        bounds = [float("-inf")] + [(header[i - 1][1] + header[i][0]) / 2 for i in range(1, len(header))] + [float("inf")]
+        return list(zip(bounds, bounds[1:]))
+
+    @staticmethod
+    def _column_of(cell, spans):
+        x0, x1, _ = cell
+        return max(range(len(spans)), key=lambda i: min(x1, spans[i][1]) - max(x0, spans[i][0]))
+
+    @classmethod
+    def page_text(cls, page):
+        """
+        Text of one page as lines of tab-separated cells. Lines under a table header
+        (description and unit price columns) have one cell per header column, empty ones included.
+        """
+        out, spans = [], None
+        for words, height in cls._visual_lines(page):
+            cells = cls._cells(words, height)
+            if spans is None:
+                roles = cls.TABLES._map_header([text for _, _, text in cells])
+                if "description" in roles and ("price_material" in roles or "price_labor" in roles):
+                    spans = cls._column_spans(cells)
+            elif cells:
+                row = [[] for _ in spans]
+                for cell in cells:
+                    row[cls._column_of(cell, spans)].append(cell[2])
+                out.append("\t".join(" ".join(parts) for parts in row))
+                continue
+            out.append("\t".join(text for _, _, text in cells))
+        return "\n".join(out) + "\n" if out else ""
+
+    def page_rows(self, text):
+        """Priced rows of a page text: table rows when the page has a recognized header, else a line scan."""
+        raw = pd.DataFrame([line.split("\t") for line in text.splitlines()])
+        result, _ = self.TABLES.extract_sheet(raw) if not raw.empty else (None, None)
+        if result:
+            return result["items"]
+        return self._scan_lines(text)
+
+    @staticmethod
+    def _scan_lines(text):
+        """Line heuristics for pages without a table header: a Czech price ("16 175,00") and a description."""
+        items = []
+        lines = [line.replace("\t", " ").strip() for line in text.splitlines() if line.strip()]
+        for i, line in enumerate(lines):
+            # Ignore lines that look like percentages or discounts
+            if '%' in line or ' slev' in line.lower():
+                continue
+            price_match = re.search(r'(\d{1,3}(?:\s\d{3})*,\d{2})', line)
+            if not price_match:
+                continue
+            price = float(price_match.group(1).replace(' ', '').replace(',', '.'))
+            if price < 0.01:
+                continue  # Ignore zero prices
+
+            # The description is on the same line for table rows, else usually the line above
+            description = ""
+            if len(line) > 20:
+                description = line.replace(price_match.group(1), '').strip()
+            if not description and i > 0:
+                description = lines[i - 1]
+            description = re.sub(r'^\d+[\s\.]+', '', description)  # remove leading numbers
+            if len(description) < 5 or not re.search('[a-zA-Zá-žÁ-Ž]', description):
+                continue
+            items.append({"raw_name": description, "price_material": price, "price_labor": 0.0, "unit": "ks", "quantity": 1.0})
+        return items
+
+    # --- Documents ---
+
+    def page_count(self, source):
+        with _open(source) as doc:
+            return len(doc)
+
+    def iter_page_texts(self, source, pages=None):
+        """
+        Yield (page_number, text) in page order (0-based) as pages are parsed. `source` is a
+        path or the file's bytes; `pages` limits parsing to those page numbers.
+        """
+        with _open(source) as doc:
+            numbers = list(range(len(doc))) if pages is None else list(pages)
+            if len(numbers) < self.parallel_min_pages or self.workers <= 1:
+                for n in numbers:
+                    yield n, self.page_text(doc[n])
+                return
+        batches = [numbers[i:i + self.batch_pages] for i in range(0, len(numbers), self.batch_pages)]
+        # Spawned, not forked: the API process runs threads. Each worker opens the document once.
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(batches)),
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker,
+                                 initargs=(source if isinstance(source, str) else bytes(source),)) as pool:
+            for future in [pool.submit(_worker_pages, batch) for batch in batches]:
+                yield from future.result()
+
+    def iter_rows(self, source):
+        """Yield (page_number, items) page by page as pages finish."""
+        for number, text in self.iter_page_texts(source):
+            yield number, self.page_rows(text)
 
     def extract_prices(self, file_path):
         """
         Extracts items and prices from a PDF supplier quote.
         Returns a list of dicts: [{'item': ..., 'price': ..., 'unit': ..., 'date': ...}]
         """
-        items = []
         try:
-            doc = fitz.open(file_path)
-            file_date = self._extract_date(file_path) # Fallback to filename date if not found in text
-            
-            full_text = ""
-            for page in doc:
-                full_text += page.get_text()
-            
-            # Simple heuristic for this specific format
-            # Look for patterns like "množství MJ cena MJ bez DPH"
-            # We will use regex to find items
-            # Pattern: [code]? [description] [quantity] [unit] [price]
-            
-            # For now, let's extract by lines
-            lines = [line.strip() for line in full_text.split('\n') if line.strip()]
-            for i, line in enumerate(lines):
-                # Ignore lines that look like percentages or have '%'
-                if '%' in line or ' slev' in line.lower():
-                    continue
-
-                # Look for price-like numbers (e.g., "16 175,00")
-                # Must be at the end of line or followed by MJ
-                price_match = re.search(r'(\d{1,3}(?:\s\d{3})*,\d{2})', line)
-                if price_match:
-                    # Potential price line
-                    price_str = price_match.group(1).replace(' ', '').replace(',', '.')
-                    try:
-                        price = float(price_str)
-                        if price < 0.01:
-                            continue  # Ignore zero prices
-
-                        # We need to find the description which is usually 1-2 lines above
-                        # OR on the same line if it's a table row
-                        description = ""
-                        if len(line) > 20: # Likely the line contains both desc and price
-                             description = line.replace(price_match.group(1), '').strip()
-                        
-                        if not description and i > 0:
-                            description = lines[i-1]
-                        
-                        # Clean description
-                        description = re.sub(r'^\d+[\s\.]+', '', description) # remove leading numbers
-                        
-                        if len(description) < 5 or not re.search('[a-zA-Zá-žÁ-Ž]', description):
-                            continue
-
-                        # Avoid repeating the same price/item if multiple matches found
-                        items.append({
-                            'item': description,
-                            'price': price,
-                            'unit': "ks", 
-                            'date': file_date,
-                            'source': os.path.basename(file_path)
-                        })
-                    except Exception:
-                        continue
-            
-            # De-duplicate items from the same PDF (simple check)
+            file_date = self._extract_date(file_path)  # Fallback to filename date if not found in text
             unique_items = []
             seen = set()
-            for it in items:
-                key = (it['item'], it['price'])
-                if key not in seen:
-                    unique_items.append(it)
+            for _, rows in self.iter_rows(file_path):
+                for row in rows:
+                    price = row['price_material'] or row['price_labor']
+                    # De-duplicate items from the same PDF (simple check)
+                    key = (row['raw_name'], price)
+                    if key in seen:
+                        continue
                     seen.add(key)
-
+                    unique_items.append({
+                        'item': row['raw_name'],
+                        'price': price,
+                        'unit': row['unit'],
+                        'date': file_date,
+                        'source': os.path.basename(file_path)
+                    })
             return unique_items
         except Exception as e:
             print(f"Error processing PDF {file_path}: {e}")
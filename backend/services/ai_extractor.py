@@ -3,21 +3,35 @@ import os
 import json
 import re
 from dotenv import load_dotenv
+from google.api_core import exceptions as api_exceptions
 
 load_dotenv()
 
+
+class TransientAIError(Exception):
+    """Rate limit (429), server error (5xx) or timeout: the same call may succeed when retried."""
+
+
 class AIExtractor:
+    # Bump whenever the extraction prompts change: cached chunk results are keyed by it
+    PROMPT_VERSION = "2025-02-1"
+    MODEL_NAME = 'gemini-2.0-flash'
+    # Errors raised as TransientAIError; any other failure returns None (retrying would not help)
+    TRANSIENT_ERRORS = (api_exceptions.TooManyRequests, api_exceptions.ServerError, TimeoutError, ConnectionError)
+
     def __init__(self, api_key=None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY is not set")
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = genai.GenerativeModel(self.MODEL_NAME)
 
     def extract_from_text(self, text_content: str, filename: str, file_type: str = 'supplier'):
         """
         Extracts structured pricing data from raw text using Gemini.
         file_type: 'supplier' (PDFs) or 'internal' (Excel History)
+        Returns None when the response is empty or not JSON or the request is rejected;
+        raises TransientAIError for rate limits, server errors and timeouts.
         """
         
         if file_type == 'internal':
@@ -89,6 +103,8 @@ ODPOVĚZ POUZE PLATNÝM JSON OBJEKTEM (začni {{ a skonči }}):"""
             # Debug: print first 500 chars of response
             print(f"DEBUG AI Response (first 500 chars): {raw[:500]}")
             return self._parse_json(raw)
+        except self.TRANSIENT_ERRORS as e:
+            raise TransientAIError(f"{type(e).__name__}: {e}") from e
         except Exception as e:
             print(f"Detail AI Error: {e}")
             return None
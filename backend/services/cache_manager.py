@@ -1,37 +1,288 @@
+import json
+import threading
 import time
+from collections import OrderedDict
 
 class CacheManager:
-    def __init__(self, ttl_seconds=3600):
-        self._cache = {}  # {(query, type, threshold): (result, timestamp)}
+    """
+    Bounded LRU cache for /match results: the ranked candidates of a query within a
+    search scope (source type filter). Threshold and price type are applied by the caller,
+    so one entry serves every threshold, and an empty list caches "no candidates".
+    Limits both the number of entries and their approximate size (JSON bytes), supports a
+    per-entry TTL and sweeps expired entries lazily so they don't pile up between reads.
+    A secondary index (normalized query -> its keys) makes invalidate(query) proportional
+    to the entries it removes. All access goes through one lock (FastAPI threadpool).
+
+    Entries can also record the item ids their result depends on and the search tokens
+    of their query. Reverse indexes (item id -> keys, token -> keys) let catalog writes
+    drop only the entries they can affect, see invalidate_items().
+
+    With a `shared` tier (SharedCache) this is the in-process L1: misses fall through to
+    the on-disk L2 shared by all workers, writes and invalidations go to both, and
+    invalidations made by other workers are replayed into L1 at most every sync_interval.
+    """
+    def __init__(self, ttl_seconds=3600, max_entries=20000, max_bytes=64 * 1024 * 1024, sweep_interval=60,
+                 shared=None, sync_interval=1.0):
+        self._cache = OrderedDict()  # {(query, scope): (result, expires_at, size, item_ids, tokens)}, LRU first
+        self._by_query = {}  # {query: set of keys}
+        self._by_item = {}  # {item_id: set of keys}
+        self._by_token = {}  # {token: set of keys}; queries without tokens live under None
+        self._lock = threading.RLock()
         self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._bytes = 0
+        self._last_sweep = time.time()
+        self._stats = {"hits": 0, "l1_hits": 0, "l2_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        self.shared = shared
+        self.sync_interval = sync_interval
+        self._shared_seq = shared.last_seq() if shared is not None else 0
+        self._last_sync = time.time()
+        # Bumped by every invalidation: an L2 hit read while one ran is not promoted into L1
+        self._generation = 0
+
+    @staticmethod
+    def _estimate_size(result):
+        try:
+            return len(json.dumps(result, default=str))
+        except (TypeError, ValueError):
+            return len(repr(result))
+
+    @staticmethod
+    def _link(index, values, key):
+        for v in values:
+            index.setdefault(v, set()).add(key)
+
+    @staticmethod
+    def _unlink(index, values, key):
+        for v in values:
+            keys = index.get(v)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[v]
+
+    @staticmethod
+    def _shared_key(key):
+        return json.dumps(key, ensure_ascii=False)
 
-    def get(self, query, price_type, threshold):
-        key = (query.lower().strip(), price_type, threshold)
+    @staticmethod
+    def _deps(key, item_ids, tokens):
+        """Dependency tags of an entry in the shared tier."""
+        return (
+            [f"q:{key[0]}"]
+            + [f"i:{i}" for i in item_ids]
+            + [f"t:{t}" if t is not None else "t" for t in tokens]
+        )
+
+    def _remove(self, key):
+        _, _, size, item_ids, tokens = self._cache.pop(key)
+        self._bytes -= size
+        self._unlink(self._by_query, (key[0],), key)
+        self._unlink(self._by_item, item_ids, key)
+        self._unlink(self._by_token, tokens, key)
+
+    def _store(self, key, result, expires_at, item_ids, tokens):
+        """Insert into L1 and evict least recently used entries (called under the lock)."""
+        size = self._estimate_size(result)
         if key in self._cache:
-            result, timestamp = self._cache[key]
-            if time.time() - timestamp < self.ttl:
-                return result
-            else:
-                del self._cache[key]
-        return None
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        self._cache[key] = (result, expires_at, size, item_ids, tokens)
+        self._link(self._by_query, (key[0],), key)
+        self._link(self._by_item, item_ids, key)
+        self._link(self._by_token, tokens, key)
+        self._bytes += size
+        # Evict least recently used entries until both limits hold
+        while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._cache)))
+            self._stats["evictions"] += 1
+
+    def _sweep(self, now):
+        """
+        Drop expired entries (at most once per sweep_interval). Returns True when the shared
+        tier is due for a prune too, which the caller runs after releasing the lock (disk I/O).
+        """
+        if now - self._last_sweep < self.sweep_interval:
+            return False
+        self._last_sweep = now
+        expired = [k for k, entry in self._cache.items() if entry[1] <= now]
+        for k in expired:
+            self._remove(k)
+        self._stats["expirations"] += len(expired)
+        return self.shared is not None
+
+    def _prune_shared(self, due, now):
+        if due:
+            self.shared.prune(now)
+
+    def _sync_shared(self, now):
+        """Replay invalidations logged by other workers into L1 (at most once per sync_interval)."""
+        if self.shared is None or now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+        self._shared_seq, events, complete = self.shared.events_since(self._shared_seq)
+        if not complete:
+            self._clear_local()
+            return
+        for kind, payload in events:
+            if kind == "clear":
+                self._clear_local()
+            elif kind == "query":
+                self._invalidate_local(payload)
+            elif kind == "items":
+                self._invalidate_items_local(payload["item_ids"], payload["tokens"])
+
+    def get(self, query, scope):
+        """Cached result or None on a miss (empty results are cached as such)."""
+        key = (query.lower().strip(), scope)
+        now = time.time()
+        hit = False
+        with self._lock:
+            self._sync_shared(now)
+            prune = self._sweep(now)
+            generation = self._generation
+            entry = self._cache.get(key)
+            if entry is not None:
+                result, expires_at = entry[0], entry[1]
+                if expires_at > now:
+                    self._cache.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["l1_hits"] += 1
+                    hit = True
+                else:
+                    self._remove(key)
+                    self._stats["expirations"] += 1
+        self._prune_shared(prune, now)
+        if hit:
+            return result
 
-    def set(self, query, price_type, threshold, result):
-        key = (query.lower().strip(), price_type, threshold)
-        self._cache[key] = (result, time.time())
+        stored = self.shared.get(self._shared_key(key), now) if self.shared is not None else None
+        with self._lock:
+            if stored is None or self._generation != generation:
+                # An invalidation ran since the L2 read started: the entry may be stale
+                self._stats["misses"] += 1
+                return None
+            # Promote the L2 hit into L1
+            value, expires_at = stored
+            self._store(key, value["result"], expires_at, frozenset(value["item_ids"]), frozenset(value["tokens"]))
+            self._stats["hits"] += 1
+            self._stats["l2_hits"] += 1
+            return value["result"]
+
+    def set(self, query, scope, result, ttl=None, item_ids=None, tokens=None):
+        """
+        Store a result. `item_ids` are the items it was built from and `tokens` the search
+        tokens of the query (an empty set for queries matched by substring only); both are
+        optional and only used by invalidate_items().
+        """
+        self.set_many([(query, scope, result, item_ids, tokens)], ttl=ttl)
+
+    def set_many(self, entries, ttl=None):
+        """Store [(query, scope, result, item_ids, tokens)]; the shared tier is written in one transaction."""
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.ttl)
+        shared_rows = []
+        with self._lock:
+            for query, scope, result, item_ids, tokens in entries:
+                key = (query.lower().strip(), scope)
+                item_ids = frozenset(item_ids or ())
+                tokens = frozenset(tokens) if tokens else (frozenset([None]) if tokens is not None else frozenset())
+                self._store(key, result, expires_at, item_ids, tokens)
+                if self.shared is not None:
+                    value = {"result": result, "item_ids": sorted(item_ids), "tokens": list(tokens)}
+                    shared_rows.append((self._shared_key(key), value, expires_at, self._deps(key, item_ids, tokens)))
+            prune = self._sweep(now)
+        if shared_rows:
+            self.shared.set_many(shared_rows)
+        self._prune_shared(prune, now)
+
+    def _invalidate_local(self, q_norm):
+        # Remove all keys of this query (across all scopes)
+        self._generation += 1
+        for k in list(self._by_query.get(q_norm, ())):
+            self._remove(k)
 
     def invalidate(self, query=None):
         """Invalidate entries for a specific query or clear all."""
         if query:
             q_norm = query.lower().strip()
-            # Remove all keys that match this query (across all types/thresholds)
-            keys_to_del = [k for k in self._cache.keys() if k[0] == q_norm]
-            for k in keys_to_del:
-                del self._cache[k]
+            with self._lock:
+                self._invalidate_local(q_norm)
+            if self.shared is not None:
+                self.shared.invalidate([f"q:{q_norm}"], "query", q_norm)
+                self._bump_generation()
         else:
-            self._cache.clear()
+            self.clear()
 
-    def clear(self):
+    def _invalidate_items_local(self, item_ids, tokens):
+        self._generation += 1
+        keys = set()
+        for item_id in item_ids:
+            keys.update(self._by_item.get(item_id, ()))
+        if tokens is not None:
+            for t in set(tokens) | {None}:
+                keys.update(self._by_token.get(t, ()))
+        for k in keys:
+            self._remove(k)
+        return len(keys)
+
+    def invalidate_items(self, item_ids=(), tokens=None):
+        """
+        Drop entries affected by a catalog write: those whose result used one of `item_ids`
+        and, when the write added names or aliases (`tokens` is their token set, possibly
+        empty), those whose query shares a token with them. Substring-only queries are
+        dropped on any new name. Returns the number of removed (L1) entries.
+        """
+        item_ids = sorted(item_ids)
+        tokens = sorted(tokens) if tokens is not None else None
+        with self._lock:
+            removed = self._invalidate_items_local(item_ids, tokens)
+        if self.shared is not None:
+            deps = [f"i:{i}" for i in item_ids]
+            if tokens is not None:
+                deps += [f"t:{t}" for t in tokens] + ["t"]
+            self.shared.invalidate(deps, "items", {"item_ids": item_ids, "tokens": tokens})
+            self._bump_generation()
+        return removed
+
+    def _bump_generation(self):
+        """Called once the shared tier is invalidated too: L2 reads that overlapped it are not promoted."""
+        with self._lock:
+            self._generation += 1
+
+    def _clear_local(self):
+        self._generation += 1
         self._cache.clear()
+        self._by_query.clear()
+        self._by_item.clear()
+        self._by_token.clear()
+        self._bytes = 0
 
-    def get_stats(self):
+    def clear(self):
+        with self._lock:
+            self._clear_local()
+        if self.shared is not None:
+            self.shared.clear()
+            self._bump_generation()
+
+    def __len__(self):
         return len(self._cache)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            stats = {
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            }
+        if self.shared is not None:
+            stats["l2_entries"] = len(self.shared)
+        return stats
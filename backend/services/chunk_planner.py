@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class ChunkPlanner:
+    """
+    Splits extraction input into AI calls that fit a token budget, instead of fixed
+    50-row chunks and a truncated whole document.
+
+    Tokens are estimated from characters (~4 per token). A chunk must fit both the input
+    budget (prompt template + chunk text) and the output budget: every extracted row costs
+    roughly OUTPUT_TOKENS_PER_ROW tokens of JSON, and a response cut off at the model's
+    output limit loses items. Sheets are cut into equal row windows (rounded to tens, so
+    small edits don't move the boundaries and cached chunks stay valid); windows over the
+    budget are halved. Documents are packed page by page; pages over the budget are split by lines.
+    """
+    CHARS_PER_TOKEN = 4
+    PROMPT_TOKENS = 1000  # extraction prompt template around each chunk
+    OUTPUT_TOKENS_PER_ROW = 40
+    # AIExtractor cuts chunk text at 200,000 characters (~50,000 tokens)
+    MAX_INPUT_TOKENS = 45000
+
+    def __init__(self, max_input_tokens=12000, max_output_tokens=6000, max_rows=None):
+        self.max_input_tokens = min(max_input_tokens, self.MAX_INPUT_TOKENS)
+        self.max_output_tokens = max_output_tokens
+        self.max_rows = max_rows
+
+    @classmethod
+    def estimate_tokens(cls, text):
+        return len(text) // cls.CHARS_PER_TOKEN + 1
+
+    @classmethod
+    def prompt_tokens(cls, content):
+        """Estimated input tokens of one extraction call over `content`."""
+        return cls.estimate_tokens(content) + cls.PROMPT_TOKENS
+
+    @property
+    def _text_budget(self):
+        return max(1, self.max_input_tokens - self.PROMPT_TOKENS)
+
+    @property
+    def _rows_by_output(self):
+        return max(1, self.max_output_tokens // self.OUTPUT_TOKENS_PER_ROW)
+
+    # --- Sheets ---
+
+    def row_windows(self, df):
+        """[(start, end)] row ranges of `df` for one call each (CSV of the rows, with header)."""
+        n = len(df)
+        if n == 0:
+            return []
+        # CSV length of each row: cell texts plus separators
+        lengths = df.fillna("").astype(str).apply(lambda col: col.str.len()).sum(axis=1).to_numpy()
+        row_tokens = (lengths + len(df.columns)) / self.CHARS_PER_TOKEN
+        header_tokens = self.estimate_tokens(",".join(str(c) for c in df.columns)) + 20
+        budget = max(1, self._text_budget - header_tokens)
+
+        rows = min(self._rows_by_output, int(budget // max(1.0, float(np.mean(row_tokens)))))
+        if self.max_rows:
+            rows = min(rows, self.max_rows)
+        if rows >= 20:
+            rows -= rows % 10
+        rows = max(1, rows)
+
+        windows = []
+        for start in range(0, n, rows):
+            windows.extend(self._fit(row_tokens, start, min(start + rows, n), budget))
+        return windows
+
+    def _fit(self, sizes, start, end, budget):
+        """Halve [start, end) until every part fits the budget (single rows always pass)."""
+        if end - start <= 1 or sizes[start:end].sum() <= budget:
+            return [(start, end)]
+        mid = (start + end) // 2
+        return self._fit(sizes, start, mid, budget) + self._fit(sizes, mid, end, budget)
+
+    # --- Documents ---
+
+    def _line_rows(self, text):
+        # Items usually span one or two lines of extracted text
+        return sum(1 for line in text.splitlines() if line.strip()) // 2 + 1
+
+    def _fits(self, tokens, rows):
+        return tokens <= self._text_budget and rows * self.OUTPUT_TOKENS_PER_ROW <= self.max_output_tokens
+
+    def _split_lines(self, text):
+        """Pieces of an oversized page, cut at line boundaries."""
+        pieces, current, tokens, rows = [], [], 0, 0
+        for line in text.splitlines(keepends=True):
+            line_tokens, line_rows = self.estimate_tokens(line), (1 if line.strip() else 0) / 2
+            if current and not self._fits(tokens + line_tokens, rows + line_rows):
+                pieces.append("".join(current))
+                current, tokens, rows = [], 0, 0
+            current.append(line)
+            tokens += line_tokens
+            rows += line_rows
+        if current:
+            pieces.append("".join(current))
+        return pieces
+
+    def page_windows(self, pages):
+        """
+        Pack consecutive page texts into calls -> [(first_page, last_page, text)] (1-based).
+        A single page over the budget becomes several windows of the same page number.
+        """
+        windows = []
+        current, first, tokens, rows = [], None, 0, 0
+        for number, text in enumerate(pages, start=1):
+            page_tokens, page_rows = self.estimate_tokens(text), self._line_rows(text)
+            if current and not self._fits(tokens + page_tokens, rows + page_rows):
+                windows.append((first, number - 1, "".join(current)))
+                current, first, tokens, rows = [], None, 0, 0
+            if not self._fits(page_tokens, page_rows):
+                windows.extend((number, number, piece) for piece in self._split_lines(text))
+                continue
+            if first is None:
+                first = number
+            current.append(text)
+            tokens += page_tokens
+            rows += page_rows
+        if current:
+            windows.append((first, len(pages), "".join(current)))
+        return windows
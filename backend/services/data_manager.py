@@ -1,35 +1,114 @@
 import hashlib
 import os
+import random
 import re
+import time
+import numpy as np
 import pandas as pd
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from database.price_db import PriceDatabase
-from services.ai_extractor import AIExtractor
+from processors.excel_processor import ExcelProcessor
+from services.ai_extractor import AIExtractor, TransientAIError
 from services.cache_manager import CacheManager
+from services.chunk_planner import ChunkPlanner
+from services.shared_cache import SharedCache
+from services.single_flight import SingleFlight
+from services.ingest_queue import IngestQueue
+from services.rate_limiter import RateLimiter
+from services.upload_buffer import UploadBuffer
 
 class DataManager:
     def __init__(self, db_url=None):
         # We pass just the path, PriceDatabase handles connection
         self.db = PriceDatabase(db_url)
-        self.cache = CacheManager()
+        self.cache = CacheManager(shared=self._open_shared_cache())
+        # Catalog writes drop only the cached matches they can affect
+        self.db.change_listeners.append(self.cache.invalidate_items)
+        # Concurrent /match misses for the same query share one search
+        self.flights = SingleFlight()
         # Initialize AI intentionally lazy or if key exists
         try:
             self.ai = AIExtractor()
         except Exception:
             print("Warning: AI Extractor not initialized (Missing Key?)")
             self.ai = None
+        # AI extraction: parallel chunk calls, paced by a limiter shared by all ingest jobs
+        self.ai_max_parallel = int(os.getenv("AI_MAX_PARALLEL", "4"))
+        self.ai_retries = int(os.getenv("AI_MAX_RETRIES", "3"))
+        self.ai_backoff = float(os.getenv("AI_RETRY_BACKOFF", "2.0"))
+        self.ai_limiter = RateLimiter(
+            requests_per_minute=int(os.getenv("AI_REQUESTS_PER_MINUTE", "60")),
+            tokens_per_minute=int(os.getenv("AI_TOKENS_PER_MINUTE", "1000000"))
+        )
+        # Rows/pages are packed into calls up to these (estimated) token budgets
+        self.chunk_planner = ChunkPlanner(
+            max_input_tokens=int(os.getenv("AI_CHUNK_TOKENS", "12000")),
+            max_output_tokens=int(os.getenv("AI_OUTPUT_TOKENS", "6000")),
+            max_rows=int(os.getenv("AI_CHUNK_MAX_ROWS", "0")) or None
+        )
+        # Sheets in a recognized layout are read by rules instead of the AI
+        self.table_extractor = ExcelProcessor()
+        # Large PDFs are parsed page-parallel in this many processes
+        self.pdf_workers = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.pdf_parallel_min_pages = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+        # Uploads are buffered in memory up to this size (larger ones spill to a temp file)
+        self.upload_spool_bytes = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+        # Uploads are processed in the background by a small worker pool
+        # (job state is kept in the database, so any API worker can answer a status poll)
+        self.ingest = IngestQueue(self.process_file, max_workers=int(os.getenv("INGEST_WORKERS", "2")), store=self.db)
 
-    def process_file(self, filepath: str, file_type_override: str = None):
+    def _open_shared_cache(self):
+        """
+        On-disk match cache shared by all uvicorn workers on this host. Location comes from
+        MATCH_CACHE_PATH (empty = disabled), else it sits next to the SQLite database.
+        """
+        path = os.getenv("MATCH_CACHE_PATH")
+        if path is None:
+            url = self.db.engine.url
+            if url.get_backend_name() == "sqlite":
+                if not url.database or url.database == ":memory:":
+                    return None
+                path = os.path.splitext(url.database)[0] + "_match_cache.db"
+            else:
+                path = "Input/04_Databaze/match_cache.db"
+        if not path:
+            return None
+        try:
+            return SharedCache(path)
+        except Exception as e:
+            print(f"⚠️ Shared match cache disabled ({path}): {e}")
+            return None
+
+    def process_file(self, source, file_type_override: str = None, progress=None):
         """
         Main entry point. Reads file, sends to AI, saves to DB.
+        `source` is a file path or an UploadBuffer (its hash is already known and all
+        parsers read its bytes, so the file is read once).
         For Excel files, processes sheet by sheet to ensure all data is captured.
+        `progress` (e.g. an IngestJob) gets update(**counters) / update(error=...) calls.
         """
-        if not self.ai:
-            return {"error": "AI not ready"}
+        if isinstance(source, UploadBuffer):
+            return self._process_buffer(source, file_type_override, progress)
+        try:
+            buf = UploadBuffer.from_path(source)
+        except OSError as e:
+            return {"status": "error", "message": str(e)}
+        with buf:
+            return self._process_buffer(buf, file_type_override, progress)
+
+    def _process_buffer(self, buf, file_type_override, progress):
+        report = progress.update if progress is not None else (lambda **kw: None)
+        filepath = buf.name
 
         try:
-            # 1. Calculate Hash & Check Duplicates
-            file_hash = self._calculate_file_hash(filepath)
+            # 1. Hash (computed while buffering) & reject exact duplicates before any parsing
+            report(stage="duplicate_check")
+            file_hash = buf.sha256
+            existing = self.db.check_file_exists(file_hash=file_hash)
+            if existing:
+                return self._duplicate_result(existing)
             
             # 2. Determine Type
             file_type = file_type_override
@@ -38,60 +117,100 @@ class DataManager:
                 if '02_Historie' in filepath or 'internal' in filepath.lower():
                     file_type = 'internal'
 
-            ext = os.path.splitext(filepath)[1].lower()
-            is_excel = ext in ['.xlsx', '.xls']
+            is_excel = buf.ext in ['.xlsx', '.xls']
+
+            # 2b. Cheap local pass over the first page/sheet: offer-level duplicates are rejected
+            #     before the AI runs (an Excel version of an ingested PDF offer still goes through)
+            pre_offer_number = self._pre_extract_offer_number(buf)
+            if pre_offer_number:
+                existing = self.db.check_file_exists(offer_number=pre_offer_number)
+                if existing and not self._is_upgrade(existing, is_excel):
+                    return self._duplicate_result(existing)
 
-            # 3. Read & Process (Sheet-by-sheet for Excel)
-            all_items = []
+            # 3. Plan the AI calls: sheets in row windows, PDF/TXT in page windows (token budget).
+            #    Sheets of an internal file in the budget template are extracted locally and need no call.
+            report(stage="extracting")
             final_data = {"vendor": "Unknown", "date": None, "offer_number": None}
+            name = os.path.basename(filepath)
 
             if is_excel:
-                sheets = pd.read_excel(filepath, sheet_name=None)
-                sheet_stats = []
-                for sheet_name, df in sheets.items():
-                    if df.empty or len(df.columns) < 2:
-                        continue
-                    
-                    # Split sheet into chunks of 50 rows to prevent AI truncation/summarization
-                    chunk_size = 50
-                    chunks = [df[i:i + chunk_size] for i in range(0, len(df), chunk_size)]
-                    sheet_item_count = 0
-                    
-                    print(f"📄 Processing sheet '{sheet_name}' ({len(df)} rows, {len(chunks)} chunks) from {os.path.basename(filepath)}")
-                    
-                    for idx, chunk in enumerate(chunks):
-                        print(f"  - Chunk {idx+1}/{len(chunks)} for sheet '{sheet_name}'")
-                        content = f"--- LIST: {sheet_name} (Chunk {idx+1}/{len(chunks)}) ---\n{chunk.to_csv(index=False)}"
-                        
-                        data = self.ai.extract_from_text(content, f"{os.path.basename(filepath)} [{sheet_name} ch{idx+1}]", file_type=file_type)
-                        if data and data.get('items'):
-                            all_items.extend(data['items'])
-                            sheet_item_count += len(data['items'])
-                            
-                            # Keep metadata from the first valid chunk result
-                            if final_data["vendor"] == "Unknown":
-                                if data.get('vendor'):
-                                    final_data["vendor"] = data.get('vendor')
-                                if data.get('date'):
-                                    final_data["date"] = data.get('date')
-                                if data.get('offer_number'):
-                                    final_data["offer_number"] = data.get('offer_number')
-                    
-                    sheet_stats.append(f"{sheet_name}: {sheet_item_count}")
-                    print(f"✅ Extracted total {sheet_item_count} items from sheet '{sheet_name}'")
-                
-                if sheet_stats:
-                    print(f"📊 Summary for {os.path.basename(filepath)}: " + ", ".join(sheet_stats))
+                # (sheet_name, label, content), {sheet_name: items}, [per-sheet path]
+                chunk_jobs, local_items, sheets, saved = self._plan_sheet_chunks(buf, name, file_type)
+                groups = list(dict.fromkeys(sheet_name for sheet_name, _, _ in chunk_jobs))
+                report(sheets_total=len(sheets), sheets_done=len(local_items),
+                       items_extracted=sum(len(items) for items in local_items.values()))
             else:
-                # Standard single-shot process for PDF/TXT
-                content = self._read_file_content(filepath)
-                data = self.ai.extract_from_text(content, os.path.basename(filepath), file_type=file_type)
-                if data:
-                    all_items = data.get('items', [])
-                    final_data = data
+                chunk_jobs = [(None, label, content) for label, content in self._plan_page_chunks(buf, name)]
+                groups, local_items, sheets = [], {}, []
+                saved = {"bytes": 0, "tokens": 0}
+            report(chunks_total=len(chunk_jobs))
+
+            if chunk_jobs and not self.ai:
+                return {"error": "AI not ready", "sheets": sheets}
+
+            # Extract all chunks concurrently (results keep chunk order)
+            chunks_left = {g: 0 for g in groups}
+            for group, _, _ in chunk_jobs:
+                if group is not None:
+                    chunks_left[group] += 1
+            done = {"chunks": 0, "cached": 0, "calls": 0, "tokens": 0,
+                    "items": sum(len(items) for items in local_items.values()), "sheets": len(local_items)}
+
+            def chunk_done(i, data, cached):
+                group, label, content = chunk_jobs[i]
+                print(f"  - Chunk {label} {'from cache' if cached else 'done'} ({done['chunks'] + 1}/{len(chunk_jobs)})")
+                done["chunks"] += 1
+                done["cached"] += int(cached)
+                if not cached:
+                    done["calls"] += 1
+                    done["tokens"] += self.chunk_planner.prompt_tokens(content)
+                done["items"] += len((data or {}).get('items') or [])
+                if group is not None:
+                    chunks_left[group] -= 1
+                    if not chunks_left[group]:
+                        done["sheets"] += 1
+                if data is None:
+                    report(error=f"{label}: AI extraction failed")
+                report(chunks_done=done["chunks"], chunks_cached=done["cached"], items_extracted=done["items"],
+                       sheets_done=done["sheets"], ai_calls=done["calls"], ai_tokens=done["tokens"])
+
+            results = self._extract_chunks([(label, content) for _, label, content in chunk_jobs], file_type, chunk_done)
+
+            group_items = {g: [] for g in [None] + groups}
+            for (group, _, _), data in zip(chunk_jobs, results):
+                if data and data.get('items'):
+                    group_items[group].extend(data['items'])
+                    
+                    # Keep metadata from the first valid chunk result
+                    if final_data["vendor"] == "Unknown":
+                        if data.get('vendor'):
+                            final_data["vendor"] = data.get('vendor')
+                        if data.get('date'):
+                            final_data["date"] = data.get('date')
+                        if data.get('offer_number'):
+                            final_data["offer_number"] = data.get('offer_number')
+            
+            # Items in sheet order, whichever path each sheet took
+            all_items = list(group_items[None])
+            for sheet in sheets:
+                items = local_items.get(sheet["sheet"]) or group_items.get(sheet["sheet"], [])
+                sheet["items"] = len(items)
+                all_items.extend(items)
+                print(f"✅ Extracted total {len(items)} items from sheet '{sheet['sheet']}' ({sheet['path']})")
+            if sheets:
+                print(f"📊 Summary for {name}: " + ", ".join(f"{s['sheet']}: {s['items']}" for s in sheets))
+            if local_items and final_data["vendor"] == "Unknown":
+                # Locally read sheets carry no metadata. The regex pre-check number is only a
+                # duplicate hint and is not stored as the offer number.
+                final_data["vendor"] = "Internal"
+            usage = {"chunks": len(chunk_jobs), "ai_calls": done["calls"], "ai_tokens": done["tokens"],
+                     "prompt_bytes_saved": saved["bytes"], "prompt_tokens_saved": saved["tokens"]}
+            if sheets:
+                usage["sheets"] = sheets
+            print(f"🔢 {name}: {usage['chunks']} chunks, {usage['ai_calls']} AI calls, ~{usage['ai_tokens']} input tokens")
 
             if not all_items:
-                return {"status": "skipped", "reason": "No data found by AI in any sheet"}
+                return {"status": "skipped", "reason": "No data found by AI in any sheet", **usage}
 
             offer_number = final_data.get('offer_number')
             
@@ -99,21 +218,14 @@ class DataManager:
             existing = self.db.check_file_exists(file_hash=file_hash, offer_number=offer_number)
             
             if existing:
-                existing_ext = os.path.splitext(existing['filename'])[1].lower()
-                existing_is_excel = existing_ext in ['.xlsx', '.xls']
-
-                if is_excel and not existing_is_excel:
+                if self._is_upgrade(existing, is_excel):
                     print(f"Upgrading existing PDF offer {offer_number} with new Excel data.")
                     self.db.delete_source(existing['id']) 
                 else:
-                    return {
-                        "status": "duplicate", 
-                        "reason": f"File already exists (Matched by {existing['type']}). Original: {existing['filename']} by {existing['vendor']}",
-                        "details": existing
-                    }
+                    return self._duplicate_result(existing)
 
             # 5. Validate & Normalize Date
-            offer_date = self._determine_date(final_data.get('date'), filepath)
+            offer_date = self._determine_date(final_data.get('date'), filepath, buf.mtime)
             
             # Map file_type to source_type
             source_type = 'INTERNAL' if file_type == 'internal' else 'SUPPLIER'
@@ -124,6 +236,7 @@ class DataManager:
                     it['price_material'] = 0.0
 
             # 6. Save
+            report(stage="saving")
             source_id = self.db.add_processed_file(
                 filename=os.path.basename(filepath),
                 vendor=final_data.get('vendor', 'Unknown'),
@@ -134,48 +247,296 @@ class DataManager:
                 source_type=source_type
             )
             
-            return {"status": "success", "type": file_type, "items_count": len(all_items), "source_id": source_id}
+            return {"status": "success", "type": file_type, "items_count": len(all_items), "source_id": source_id, **usage}
             
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
-    def _calculate_file_hash(self, filepath):
-        hasher = hashlib.sha256()
-        with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+    @staticmethod
+    def _is_upgrade(existing, is_excel):
+        """An Excel file replaces an offer that was ingested from a PDF."""
+        existing_ext = os.path.splitext(existing['filename'])[1].lower()
+        return is_excel and existing_ext not in ['.xlsx', '.xls']
+
+    @staticmethod
+    def _duplicate_result(existing):
+        return {
+            "status": "duplicate", 
+            "reason": f"File already exists (Matched by {existing['type']}). Original: {existing['filename']} by {existing['vendor']}",
+            "details": existing
+        }
+
+    # Only labels that mean "offer number": "Nabídka č. 2024-118", "Cenová nabídka číslo 77/2025",
+    # "Číslo nabídky: NAB/24/0077", "Offer No. Q-778". Project numbers ("Zakázka č.") are shared
+    # by every bid for the project and prices ("Cena nabídky: 125 400 Kč") are not identifiers.
+    OFFER_NUMBER_RE = re.compile(
+        r'(?:nab[ií]dk[ay]\s*(?:[čc]\.|[čc][ií]s(?:lo|\.))'
+        r'|[čc][ií]slo\s+nab[ií]dky'
+        r'|(?:offer|quotation)\s*(?:no\.?|nr\.?|number|#))'
+        r'[\s:#]*([A-Z0-9][A-Z0-9/_.-]{2,30})',
+        re.IGNORECASE
+    )
+    # A label preceded by "cena" ("Cena nabídka č. ...") and values that run on into an amount
+    PRICE_LABEL_RE = re.compile(r'\bcen[ay]?\s*$', re.IGNORECASE)
+    AMOUNT_AFTER_RE = re.compile(r'[\d\s.,]*(?:kč|czk|eur|€|,-)', re.IGNORECASE)
 
-    def _read_file_content(self, filepath):
-        ext = os.path.splitext(filepath)[1].lower()
+    def _pre_extract_offer_number(self, buf, max_chars=20000):
+        """Offer number found by regex in the first page/sheet (no AI), or None."""
         try:
-            if ext in ['.xlsx', '.xls']:
-                # Read all sheets into a dictionary of DataFrames
-                sheets = pd.read_excel(filepath, sheet_name=None)
-                all_content = []
-                for sheet_name, df in sheets.items():
-                    if not df.empty:
-                        all_content.append(f"--- LIST: {sheet_name} ---\n{df.to_string()}")
-                return "\n\n".join(all_content)
-            elif ext == '.pdf':
+            if buf.ext in ['.xlsx', '.xls']:
+                head = pd.read_excel(buf.stream(), sheet_name=0, header=None, nrows=40)
+                text = head.to_csv(index=False, header=False, sep="\t")
+            elif buf.ext == '.pdf':
+                import fitz  # PyMuPDF
+                with fitz.open(stream=buf.view(), filetype="pdf") as doc:
+                    text = doc[0].get_text() if len(doc) else ""
+            elif buf.ext == '.txt':
+                # Up to 4 bytes per character in UTF-8
+                text = buf.text(errors='ignore', limit=max_chars * 4)
+            else:
+                return None
+        except Exception as e:
+            print(f"Offer number pre-check skipped for {buf.filename}: {e}")
+            return None
+        text = text[:max_chars]
+        for m in self.OFFER_NUMBER_RE.finditer(text):
+            candidate = m.group(1).rstrip('.-/_')
+            line_start = text.rfind("\n", 0, m.start()) + 1
+            if not any(ch.isdigit() for ch in candidate) \
+                    or self.PRICE_LABEL_RE.search(text[line_start:m.start()]) \
+                    or self.AMOUNT_AFTER_RE.match(text, m.end(1)):
+                continue
+            return candidate
+        return None
+
+    def _extract_chunks(self, chunks, file_type, on_done=None):
+        """
+        AI extraction of [(label, content)] with at most ai_max_parallel calls in flight ->
+        results in input order (None for chunks that failed after retries).
+        on_done(index, data, cached) is called in this thread as each chunk finishes.
+        """
+        results = [None] * len(chunks)
+        if not chunks:
+            return results
+        with ThreadPoolExecutor(max_workers=max(1, min(self.ai_max_parallel, len(chunks)))) as pool:
+            futures = {
+                pool.submit(self._extract_cached, content, label, file_type): i
+                for i, (label, content) in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i], cached = future.result()
+                if on_done:
+                    on_done(i, results[i], cached)
+        return results
+
+    def _extraction_key(self, content, file_type):
+        """Content address of a chunk extraction: prompt version + extractor + file type + chunk text."""
+        version = getattr(self.ai, "PROMPT_VERSION", "0")
+        extractor = f"{type(self.ai).__name__}:{getattr(self.ai, 'MODEL_NAME', '')}"
+        return hashlib.sha256("\0".join([version, extractor, file_type or "", content]).encode("utf-8")).hexdigest()
+
+    def _extract_cached(self, content, label, file_type):
+        """Chunk extraction served from the ai_extractions store when possible -> (data, from_cache)."""
+        key = self._extraction_key(content, file_type)
+        data = self.db.get_extraction(key)
+        if data is not None:
+            return data, True
+        data = self._extract_with_retry(content, label, file_type)
+        if data is not None:
+            self.db.save_extraction(key, file_type, data)
+        return data, False
+
+    def _extract_with_retry(self, content, label, file_type):
+        """
+        One rate-limited AI call, retried with exponential backoff on transient errors (rate
+        limits, 5xx, timeouts). Other failures (unparseable or empty response, rejected
+        request) would fail again and return None at once.
+        """
+        for attempt in range(self.ai_retries + 1):
+            self.ai_limiter.acquire(self.chunk_planner.prompt_tokens(content))
+            try:
+                return self.ai.extract_from_text(content, label, file_type=file_type)
+            except TransientAIError as e:
+                print(f"AI extraction error for {label}: {e}")
+            except Exception as e:
+                print(f"AI extraction error for {label}: {e}")
+                return None
+            if attempt < self.ai_retries:
+                delay = self.ai_backoff * (2 ** attempt) * (1 + random.random() / 4)
+                print(f"  ↻ Retrying {label} in {delay:.1f}s ({attempt + 1}/{self.ai_retries})")
+                time.sleep(delay)
+        return None
+
+    def _plan_sheet_chunks(self, buf, name, file_type):
+        """
+        Every non-empty sheet of an internal file in the budget template is read locally by
+        the table extractor; the others (supplier price lists need the AI for vendor and offer
+        metadata) are compacted and cut into row windows sized by the planner
+        -> (chunk_jobs [(sheet_name, label, content)], {sheet_name: items read locally},
+            [{"sheet", "path": "local" | "ai", ...}] in sheet order, {"bytes", "tokens"} saved by compaction).
+        """
+        sheets = pd.read_excel(buf.stream(), sheet_name=None, header=None)
+        chunk_jobs, local_items, report = [], {}, []
+        raw_size = compact_size = 0
+        for sheet_name, raw in sheets.items():
+            if raw.empty or len(raw.columns) < 2:
+                continue
+            local, reason = self.table_extractor.extract_sheet(raw)
+            if local and (file_type != 'internal' or local["layout"] != "internal_budget"):
+                local, reason = None, f"{local['layout']} layout in a {file_type} file"
+            if local:
+                local_items[sheet_name] = local["items"]
+                report.append({"sheet": sheet_name, "path": "local", "layout": local["layout"]})
+                print(f"⚡ Sheet '{sheet_name}' of {name} read locally "
+                      f"({local['layout']}, {len(local['items'])} items, columns {local['columns']})")
+                continue
+            df = self._with_header(raw)
+            if df.empty:
+                continue
+            compact, constants = self._compact_sheet(df)
+            if compact.empty:
+                continue
+            report.append({"sheet": sheet_name, "path": "ai", "reason": reason})
+            raw_size += len(df.to_csv(index=False).encode("utf-8"))
+            compact_size += len(self._serialize_rows(compact).encode("utf-8"))
+            # Columns with one value in every row are stated once in the chunk title
+            common = "".join(f"; {col}={value}" for col, value in constants.items())
+            windows = self.chunk_planner.row_windows(compact)
+            print(f"📄 Processing sheet '{sheet_name}' ({len(df)} rows, {len(windows)} chunks) from {name}")
+            for idx, (start, end) in enumerate(windows):
+                content = f"--- LIST: {sheet_name} (Chunk {idx+1}/{len(windows)}{common}) ---\n{self._serialize_rows(compact[start:end])}"
+                chunk_jobs.append((sheet_name, f"{name} [{sheet_name} ch{idx+1}]", content))
+        saved = max(0, raw_size - compact_size)
+        if raw_size:
+            print(f"✂️ {name}: sheet text {raw_size} -> {compact_size} bytes ({100 * saved // raw_size}% saved)")
+        return chunk_jobs, local_items, report, {"bytes": saved, "tokens": saved // ChunkPlanner.CHARS_PER_TOKEN}
+
+    @staticmethod
+    def _with_header(raw):
+        """A sheet read with header=None, as header=0 returns it: the first row becomes the column titles."""
+        titles, seen = [], Counter()
+        for i, value in enumerate(raw.iloc[0].tolist()):
+            title = f"Unnamed: {i}" if pd.isna(value) else value
+            seen[title] += 1
+            titles.append(title if seen[title] == 1 else f"{title}.{seen[title] - 1}")
+        df = raw.iloc[1:].infer_objects()
+        df.columns = titles
+        return df.reset_index(drop=True)
+
+    @staticmethod
+    def _compact_sheet(df, min_rows_for_constants=5):
+        """
+        Prompt-side cleanup of a sheet -> (rows, {column: value} common to all rows):
+        whitespace collapsed, empty columns and 'Unnamed: N' headers removed, copies of the
+        header row repeated inside the data dropped, and (on sheets of min_rows_for_constants+
+        rows) single-valued text columns lifted out of the rows. Numbers, prices and
+        quantities always stay in the rows.
+        """
+        df = df.copy()
+        for col in df.columns:
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].map(lambda v: re.sub(r"\s+", " ", v).strip() if isinstance(v, str) else v)
+        # NaN, not None: on pandas < 2 replace(x, None) forward-fills from the cell above
+        df = df.replace("", np.nan)
+        df = df.dropna(axis=1, how="all").dropna(axis=0, how="all")
+        if df.empty:
+            return df, {}
+        titles = {c: "" if str(c).startswith("Unnamed:") else re.sub(r"\s+", " ", str(c)).strip() for c in df.columns}
+
+        # Copies of the header row inside the data (one per printed page)
+        keys = df.astype(str).where(df.notna(), "").apply(lambda row: tuple(v.lower() for v in row), axis=1)
+        header_key = tuple(titles[c].lower() for c in df.columns)
+        df = df[~keys.map(lambda k: k == header_key)]
+
+        constants = {}
+        if len(df) >= min_rows_for_constants:
+            roles = ExcelProcessor()._map_header([titles[c] for c in df.columns])
+            kept = {df.columns[pos] for role, pos in roles.items() if role.startswith("price") or role == "quantity"}
+            for col in list(df.columns):
+                values = df[col].dropna().unique()
+                if titles[col] and col not in kept and len(values) == 1 and df[col].notna().all() \
+                        and ExcelProcessor.parse_number(values[0]) is None:
+                    constants[titles[col]] = DataManager._format_value(values[0])
+                    df = df.drop(columns=col)
+
+        # Whole-number floats (e.g. quantities read as 2.0) print as integers; columns that
+        # were mixed only because of the dropped header rows become numeric again
+        for col in df.columns:
+            values = df[col].dropna()
+            if not pd.api.types.is_numeric_dtype(df[col]) and len(values) and \
+                    values.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).all():
+                df[col] = pd.to_numeric(df[col])
+            if pd.api.types.is_float_dtype(df[col]) and (df[col].dropna() % 1 == 0).all():
+                df[col] = df[col].astype("Int64")
+        return df.rename(columns=titles).reset_index(drop=True), constants
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    @staticmethod
+    def _serialize_rows(df):
+        """Compact delimited form of sheet rows: tab-separated, so commas in text need no quoting."""
+        return df.to_csv(index=False, sep="\t")
+
+    def _plan_page_chunks(self, buf, name):
+        """[(label, content)] of a PDF/TXT in page windows; a document that fits is one call as before."""
+        windows = self.chunk_planner.page_windows(self._read_pages(buf))
+        if len(windows) <= 1:
+            return [(name, windows[0][2] if windows else "")]
+        print(f"📄 Splitting {name} into {len(windows)} page windows")
+        parts = Counter(first for first, last, _ in windows if first == last)
+        seen = Counter()
+        chunks = []
+        for first, last, text in windows:
+            if first != last:
+                label = f"{name} [pages {first}-{last}]"
+            elif parts[first] > 1:
+                seen[first] += 1
+                label = f"{name} [page {first} part {seen[first]}]"
+            else:
+                label = f"{name} [page {first}]"
+            chunks.append((label, text))
+        return chunks
+
+    def _read_pages(self, buf):
+        """Text of each PDF page (a TXT file is one page); [] for unsupported or unreadable files."""
+        try:
+            if buf.ext == '.pdf':
                 try:
-                    import fitz  # PyMuPDF
-                    doc = fitz.open(filepath)
-                    text = ""
-                    for page in doc:
-                        text += page.get_text()
-                    return text
+                    from processors.pdf_processor import PDFProcessor
                 except ImportError:
-                    return "Error: PyMuPDF (fitz) not installed."
-            elif ext == '.txt':
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    return f.read()
-            return ""
+                    return ["Error: PyMuPDF (fitz) not installed."]
+                return self._read_pdf_pages(buf, PDFProcessor(self.pdf_workers, self.pdf_parallel_min_pages))
+            elif buf.ext == '.txt':
+                return [buf.text()]
+            return []
         except Exception as e:
-            print(f"Error reading file {filepath}: {e}")
-            return ""
+            print(f"Error reading file {buf.name}: {e}")
+            return []
 
-    def _determine_date(self, date_str, filepath):
+    def _read_pdf_pages(self, buf, parser, save_every=16):
+        """Page texts of a PDF: cached pages by file hash, the rest parsed (and cached as they finish)."""
+        page_count, texts = self.db.get_page_texts(buf.sha256, parser.PARSER_VERSION)
+        source = buf.path or buf.view()
+        if page_count is None:
+            page_count = parser.page_count(source)
+        missing = [n for n in range(page_count) if n not in texts]
+        if missing:
+            fresh = {}
+            for number, text in parser.iter_page_texts(source, pages=missing):
+                texts[number] = fresh[number] = text
+                if len(fresh) >= save_every:
+                    self.db.save_page_texts(buf.sha256, parser.PARSER_VERSION, page_count, fresh)
+                    fresh = {}
+            self.db.save_page_texts(buf.sha256, parser.PARSER_VERSION, page_count, fresh)
+        print(f"📄 {buf.filename}: {page_count} pages ({page_count - len(missing)} from cache)")
+        return [texts[n] for n in range(page_count)]
+
+    def _determine_date(self, date_str, filepath, mtime=None):
         # 1. Try AI-detected date
         if date_str and len(date_str) > 5:
             try:
@@ -201,12 +562,10 @@ class DataManager:
             except Exception:
                 pass
 
-        # 3. Fallback to File Modification Time
-        try:
-            timestamp = os.path.getmtime(filepath)
-            return datetime.fromtimestamp(timestamp).date()
-        except Exception:
-            return datetime.now().date()
+        # 3. Fallback to File Modification Time (uploads have none -> today)
+        if mtime is not None:
+            return datetime.fromtimestamp(mtime).date()
+        return datetime.now().date()
 
     def check_outliers(self, item_id):
         """
@@ -0,0 +1,150 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class IngestJob:
+    """
+    State of one queued upload; updated by the worker, read by GET /ingest/jobs/{id}.
+    With a `store`, the state is also written there (progress at most every
+    `persist_every` seconds), so API workers other than this one can answer polls.
+    """
+    def __init__(self, source, filename, file_type=None, store=None, persist_every=1.0):
+        self.id = uuid.uuid4().hex
+        self.source = source  # UploadBuffer (or path) handed to the processor
+        self.filename = filename
+        self.file_type = file_type
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {"sheets_total": 0, "sheets_done": 0, "chunks_total": 0, "chunks_done": 0,
+                         "chunks_cached": 0, "items_extracted": 0, "ai_calls": 0, "ai_tokens": 0}
+        self.errors = []
+        self.result = None
+        self._lock = threading.Lock()
+        self._store = store
+        self._persist_every = persist_every
+        self._persisted_at = 0.0
+
+    def update(self, error=None, **counters):
+        """Progress callback for DataManager.process_file: set counters, optionally record an error."""
+        with self._lock:
+            self.progress.update(counters)
+            if error:
+                self.errors.append(error)
+        self.persist(force=bool(error))
+
+    def persist(self, force=False):
+        """Write the current state to the store (throttled unless `force`)."""
+        if self._store is None:
+            return
+        now = time.time()
+        if not force and now - self._persisted_at < self._persist_every:
+            return
+        self._persisted_at = now
+        try:
+            self._store.save_ingest_job(self.to_dict())
+        except Exception as e:
+            print(f"⚠️ Ingest job {self.id} state not saved: {e}")
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "filename": self.filename,
+                "file_type": self.file_type,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "progress": dict(self.progress),
+                "errors": list(self.errors),
+                "result": self.result,
+            }
+
+
+class IngestQueue:
+    """
+    Runs uploads in a bounded pool of worker threads, so the API returns a job id at once
+    instead of blocking on parsing and AI extraction. At most `max_pending` jobs may wait;
+    the newest `max_history` jobs stay queryable after they finish.
+
+    Jobs run in the API worker that accepted the upload. With a `store` (the database)
+    their state is shared, so a poll that lands on another uvicorn worker still finds them.
+    """
+    def __init__(self, process, max_workers=2, max_pending=50, max_history=200, store=None):
+        self._process = process  # process(source, file_type_override=..., progress=...) -> result dict
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self._jobs = OrderedDict()  # job_id -> IngestJob, oldest first
+        self._lock = threading.Lock()
+        self._store = store  # save_ingest_job / get_ingest_job / trim_ingest_jobs
+
+    def submit(self, source, filename, file_type=None):
+        """
+        Queue an upload (an UploadBuffer, closed once processed, or a file path).
+        Returns the job, or None if the queue is full.
+        """
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if pending >= self.max_pending:
+                return None
+            job = IngestJob(source, filename, file_type, store=self._store)
+            self._jobs[job.id] = job
+            self._trim()
+        job.persist(force=True)
+        self._executor.submit(self._run, job)
+        return job
+
+    def _trim(self):
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("done", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[jid]
+
+    def _run(self, job):
+        with job._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        job.persist(force=True)
+        try:
+            result = self._process(job.source, file_type_override=job.file_type, progress=job)
+            status = "failed" if result.get("status") == "error" or "error" in result else "done"
+        except Exception as e:
+            result, status = {"status": "error", "message": str(e)}, "failed"
+        finally:
+            if hasattr(job.source, "close"):
+                job.source.close()
+        with job._lock:
+            job.source = None
+            job.result = result
+            job.status = status
+            job.finished_at = time.time()
+        job.persist(force=True)
+        if self._store is not None:
+            try:
+                self._store.trim_ingest_jobs(self.max_history)
+            except Exception as e:
+                print(f"⚠️ Ingest job history not trimmed: {e}")
+        print(f"📥 Ingest job {job.id} ({job.filename}) {status}: {result.get('status')}")
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job:
+            return job.to_dict()
+        # Accepted by another API worker
+        return self._store.get_ingest_job(job_id) if self._store is not None else None
+
+    def get_stats(self):
+        with self._lock:
+            counts = {}
+            for j in self._jobs.values():
+                counts[j.status] = counts.get(j.status, 0) + 1
+        return counts
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
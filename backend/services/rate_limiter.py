@@ -0,0 +1,52 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter for AI calls, shared by all ingest workers: one bucket for
+    requests/min and one for (estimated) tokens/min. Each bucket holds up to a minute
+    worth of budget and refills continuously; acquire() blocks until both can pay.
+    A limit of 0 disables that bucket.
+    """
+    def __init__(self, requests_per_minute=60, tokens_per_minute=1_000_000, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = {"requests": float(requests_per_minute), "tokens": float(tokens_per_minute)}
+        self._level = dict(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waits": 0, "waited_seconds": 0.0}
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        for name, cap in self.capacity.items():
+            self._level[name] = min(cap, self._level[name] + elapsed * cap / 60.0)
+
+    def acquire(self, tokens=0):
+        """Block until one request of `tokens` fits into both budgets; returns the seconds waited."""
+        cost = {"requests": 1.0, "tokens": min(float(tokens), self.capacity["tokens"])}
+        cost = {name: c for name, c in cost.items() if self.capacity[name] > 0}
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self._clock())
+                wait = max(
+                    ((cost[name] - self._level[name]) * 60.0 / self.capacity[name] for name in cost),
+                    default=0.0
+                )
+                if wait <= 0:
+                    for name in cost:
+                        self._level[name] -= cost[name]
+                    self._stats["acquired"] += 1
+                    if waited:
+                        self._stats["waits"] += 1
+                        self._stats["waited_seconds"] += waited
+                    return waited
+            self._sleep(wait)
+            waited += wait
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SharedCache:
+    """
+    Second (L2) tier of the match cache: a SQLite file in WAL mode shared by all worker
+    processes on the host, so entries survive restarts and a hit in one worker helps the others.
+
+    Every entry is stored with its dependencies ('q:<query>', 'i:<item id>', 't:<token>',
+    't' for queries without tokens), so invalidations are set-based deletes. Invalidations are
+    also appended to an event log with a growing sequence number; each process replays the
+    events of other processes into its in-memory tier (see CacheManager), which makes a clear()
+    or an item invalidation in one worker visible in all of them.
+    """
+    EVENT_RETENTION = 24 * 3600
+
+    def __init__(self, path, max_entries=200000):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.origin = f"{os.getpid()}-{id(self)}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deps (dep TEXT NOT NULL, key TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS ix_deps_dep ON deps (dep);
+            CREATE INDEX IF NOT EXISTS ix_deps_key ON deps (key);
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin TEXT NOT NULL, kind TEXT NOT NULL, payload TEXT, created_at REAL NOT NULL
+            );
+        """)
+
+    def _write(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _delete_keys(conn, query, params):
+        """Delete the entries (and their deps) whose keys `query` selects."""
+        keys = [(r[0],) for r in conn.execute(query, params).fetchall()]
+        conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+        conn.executemany("DELETE FROM deps WHERE key = ?", keys)
+
+    # --- Entries ---
+
+    def get(self, key, now=None):
+        """Stored value (decoded JSON) of a live entry, or None."""
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set_many(self, entries):
+        """Store [(key, value, expires_at, deps)] in one transaction."""
+        rows = [(key, json.dumps(value, default=str), expires_at, deps) for key, value, expires_at, deps in entries]
+        if not rows:
+            return
+
+        def write(conn):
+            conn.executemany("DELETE FROM deps WHERE key = ?", [(key,) for key, _, _, _ in rows])
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, value, expires_at, _ in rows]
+            )
+            conn.executemany(
+                "INSERT INTO deps (dep, key) VALUES (?, ?)",
+                [(dep, key) for key, _, _, deps in rows for dep in deps]
+            )
+        self._write(write)
+
+    def invalidate(self, deps, kind, payload):
+        """Delete entries with any of `deps` and log the invalidation for the other processes."""
+        deps = list(deps)
+
+        def write(conn):
+            for i in range(0, len(deps), 500):
+                chunk = deps[i:i + 500]
+                self._delete_keys(conn, f"SELECT DISTINCT key FROM deps WHERE dep IN ({','.join('?' * len(chunk))})", chunk)
+            self._log(conn, kind, payload)
+        self._write(write)
+
+    def clear(self):
+        def write(conn):
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM deps")
+            self._log(conn, "clear", None)
+        self._write(write)
+
+    def prune(self, now=None):
+        """Drop expired entries, entries over max_entries (soonest to expire first) and old events."""
+        now = now or time.time()
+
+        def write(conn):
+            self._delete_keys(conn, "SELECT key FROM entries WHERE expires_at <= ?", (now,))
+            excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._delete_keys(conn, "SELECT key FROM entries ORDER BY expires_at LIMIT ?", (excess,))
+            conn.execute("DELETE FROM events WHERE created_at < ?", (now - self.EVENT_RETENTION,))
+        self._write(write)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    # --- Event log ---
+
+    def _log(self, conn, kind, payload):
+        conn.execute(
+            "INSERT INTO events (origin, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+            (self.origin, kind, json.dumps(payload), time.time())
+        )
+
+    def _top_seq(self):
+        # sqlite_sequence keeps counting after old events are pruned
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+        return row[0] if row else 0
+
+    def last_seq(self):
+        with self._lock:
+            return self._top_seq()
+
+    def events_since(self, seq):
+        """
+        Events of other processes after `seq` -> (last_seq, [(kind, payload)], complete).
+        complete is False when events after `seq` were already pruned from the log.
+        """
+        with self._lock:
+            top = self._top_seq()
+            first = self._conn.execute("SELECT MIN(seq) FROM events").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, origin, kind, payload FROM events WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        complete = top <= seq or (first is not None and first <= seq + 1)
+        last = rows[-1][0] if rows else max(seq, top)
+        return last, [(kind, json.loads(payload)) for _, origin, kind, payload in rows if origin != self.origin], complete
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
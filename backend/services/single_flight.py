@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class _Flight:
+    __slots__ = ("done", "result", "failed")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """
+    In-flight deduplication of concurrent computations with the same key.
+
+    The first caller to lead() a key becomes its leader and computes it; callers arriving
+    while it runs get the leader's flight and wait() for its result instead of repeating
+    the work. Flights only exist while a computation runs - finished results live in the cache.
+    """
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> _Flight
+        self._stats = {"leaders": 0, "coalesced": 0, "wait_failures": 0}
+
+    def lead(self, keys):
+        """Split `keys` -> ({key: flight} this caller must compute, {key: flight} computed by others)."""
+        mine, theirs = {}, {}
+        with self._lock:
+            for key in keys:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    mine[key] = flight
+                else:
+                    theirs[key] = flight
+            self._stats["leaders"] += len(mine)
+            self._stats["coalesced"] += len(theirs)
+        return mine, theirs
+
+    def finish(self, mine, results):
+        """Publish `results` ({key: value}) of led flights; keys without a result fail their waiters."""
+        with self._lock:
+            for key, flight in mine.items():
+                if key in results:
+                    flight.result = results[key]
+                else:
+                    flight.failed = True
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        for flight in mine.values():
+            flight.done.set()
+
+    def wait(self, theirs, timeout=None):
+        """Results of flights led by others -> {key: value}; failed or timed out keys are left out."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        results = {}
+        for key, flight in theirs.items():
+            if flight.done.wait(max(0.0, deadline - time.monotonic())) and not flight.failed:
+                results[key] = flight.result
+            else:
+                with self._lock:
+                    self._stats["wait_failures"] += 1
+        return results
+
+    def get_stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), **self._stats}
@@ -0,0 +1,111 @@
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+
+
+class UploadBuffer:
+    """
+    The bytes of one file being ingested, read from the client (or disk) exactly once.
+
+    Uploads are streamed into memory up to `max_memory` and roll over to an anonymous
+    temporary file beyond that, so concurrent uploads never share a path. SHA-256 is
+    computed while the data streams in. Parsers then read the same bytes through view()
+    (a memoryview, mmap'd for rolled-over and on-disk files) or stream() (a seekable file).
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, name, max_memory=8 * 1024 * 1024, mtime=None):
+        self.name = name  # original path or upload filename (file type, labels, date fallback)
+        self.filename = os.path.basename(name)
+        self.ext = os.path.splitext(name)[1].lower()
+        self.mtime = mtime
+        self.path = None  # set when the bytes are a file on disk (parsers in other processes open it)
+        self.max_memory = max_memory
+        self.size = 0
+        self.sha256 = None
+        self._file = io.BytesIO()
+        self._in_memory = True
+        self._hasher = hashlib.sha256()
+        self._mmap = None
+        self._views = []
+
+    @classmethod
+    def from_fileobj(cls, fileobj, name, max_memory=8 * 1024 * 1024):
+        """Stream `fileobj` into a new buffer, hashing on the way."""
+        buf = cls(name, max_memory=max_memory)
+        for chunk in iter(lambda: fileobj.read(cls.CHUNK_SIZE), b""):
+            buf._write(chunk)
+        buf._finish()
+        return buf
+
+    @classmethod
+    def from_path(cls, path):
+        """Buffer over a file already on disk: mapped, not copied, and hashed in one pass."""
+        buf = cls(path, mtime=os.path.getmtime(path))
+        buf.path = path
+        buf._file = open(path, "rb")
+        buf._in_memory = False
+        buf.size = os.fstat(buf._file.fileno()).st_size
+        view = buf.view()
+        for i in range(0, buf.size, cls.CHUNK_SIZE):
+            buf._hasher.update(view[i:i + cls.CHUNK_SIZE])
+        buf._finish()
+        return buf
+
+    def _write(self, chunk):
+        self._hasher.update(chunk)
+        if self._in_memory and self.size + len(chunk) > self.max_memory:
+            # Roll over to an unnamed temp file (no path another upload could collide with)
+            spill = tempfile.TemporaryFile()
+            spill.write(self._file.getbuffer())
+            self._file = spill
+            self._in_memory = False
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def _finish(self):
+        self.sha256 = self._hasher.hexdigest()
+        self._file.flush()
+
+    def view(self):
+        """Read-only memoryview of the whole content, without copying it."""
+        if self.size == 0:
+            return memoryview(b"")
+        if self._in_memory:
+            view = self._file.getbuffer().toreadonly()
+        else:
+            if self._mmap is None:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._mmap)
+        self._views.append(view)
+        return view
+
+    def stream(self):
+        """The underlying seekable file, rewound (for readers such as pd.read_excel)."""
+        self._file.seek(0)
+        return self._file
+
+    def text(self, encoding="utf-8", errors="strict", limit=None):
+        view = self.view()
+        return bytes(view if limit is None else view[:limit]).decode(encoding, errors)
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        try:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._file.close()
+        except BufferError:
+            # A parser still holds a slice of the data; memory is freed once it lets go
+            pass
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
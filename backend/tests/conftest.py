@@ -18,19 +18,28 @@ def test_db_url():
 def setup_test_manager(test_db_url):
     # Overwrite the global manager in main with a test one
     import main
+    _remove_test_files()
     test_manager = DataManager(db_url=test_db_url)
     main.manager = test_manager
     yield test_manager
     
     # Properly shutdown/dispose to release file lock on Windows
     test_manager.db.engine.dispose()
+    if test_manager.cache.shared is not None:
+        test_manager.cache.shared.close()
     
     # Cleanup
-    if os.path.exists("test_database.db"):
-        try:
-            os.remove("test_database.db")
-        except:
-            pass
+    _remove_test_files()
+
+def _remove_test_files():
+    # Database plus the shared match cache (and its WAL files) next to it
+    for path in ["test_database.db", "test_database_match_cache.db",
+                 "test_database_match_cache.db-wal", "test_database_match_cache.db-shm"]:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except:
+                pass
 
 @pytest.fixture
 def client():
@@ -84,8 +84,12 @@ def test_cache_invalidation(client):
     assert initial_cache_size >= 1
 
     # 2. Add alias for DIFFERENT query - should not invalidate our test query (if specific)
-    # Actually my invalidate() is specific to query.
-    client.post("/feedback/learn", json={"query": "other query", "item_id": 1})
+    # Actually my invalidate() is specific to query. The alias goes to an item that is not
+    # among the cached candidates (matches list alternatives besides the exact hit).
+    unrelated = client.post("/items/add", json={"name": "Nesouvisející zboží XYZ", "price_material": 1.0}).json()
+    status = client.get("/status").json()
+    initial_cache_size = status["cache_size"]
+    client.post("/feedback/learn", json={"query": "other query", "item_id": unrelated["item_id"]})
     
     status = client.get("/status").json()
     assert status["cache_size"] == initial_cache_size # Should still be there (if it was 1)
@@ -97,3 +101,156 @@ def test_cache_invalidation(client):
     # To be safe, just check if it's less or if we can track specific key (internal logic)
     # Since we can't see specific keys, let's just check the flow.
     pass
+
+def test_match_bulk_with_duplicates(client):
+    client.post("/items/add", json={"name": "Krabice KO 68 pod omítku", "price_material": 8.5})
+    items = ["Krabice KO 68 pod omítku", "krabice ko 68", "Krabice KO 68 pod omítku", "Mezisoučet"]
+    resp = client.post("/match", json={"items": items, "threshold": 0.4})
+    assert resp.status_code == 200
+    results = resp.json()
+    assert set(results) == set(items)
+    best = results["Krabice KO 68 pod omítku"]
+    assert best["original_name"] == "Krabice KO 68 pod omítku"
+    assert best["price"] == 8.5
+    assert best["candidates"][0]["id"] == best["item_id"]
+    assert results["Mezisoučet"] is None
+
+SCOPE = ('SUPPLIER', 'ADMIN')
+
+def test_catalog_writes_invalidate_only_affected_matches(client, setup_test_manager):
+    cache = setup_test_manager.cache
+    client.post("/items/add", json={"name": "Rámeček Tango bílý", "price_material": 45.0})
+    client.post("/items/add", json={"name": "Vypínač Tango řazení 1", "price_material": 80.0})
+    client.post("/match", json={"items": ["rámeček tango bílý", "vypínač tango"], "threshold": 0.3})
+    assert cache.get("vypínač tango", SCOPE) is not None
+
+    # Unrelated admin edit keeps both entries warm
+    unrelated = client.post("/items/add", json={"name": "Hmoždinka 8mm", "price_material": 1.0}).json()["item_id"]
+    client.post("/admin/sync", json=[{"id": unrelated, "name": "Hmoždinka 8 mm", "price_material": 1.5, "price_labor": 0.0, "unit": "ks"}])
+    assert cache.get("rámeček tango bílý", SCOPE) is not None
+    assert cache.get("vypínač tango", SCOPE) is not None
+
+    # Repricing the switch drops the entries whose candidates include it
+    switch = cache.get("vypínač tango", SCOPE)[0]["id"]
+    client.post("/admin/sync", json=[{"id": switch, "name": "Vypínač Tango řazení 1", "price_material": 90.0, "price_labor": 0.0, "unit": "ks"}])
+    assert cache.get("vypínač tango", SCOPE) is None
+
+def test_match_cache_is_shared_across_thresholds_and_caches_misses(client, setup_test_manager):
+    cache = setup_test_manager.cache
+    client.post("/items/add", json={"name": "Zásuvka Tango jednonásobná", "price_material": 95.0, "price_labor": 40.0})
+    items = ["zásuvka tango jednonásobná", "Celkem bez DPH"]
+
+    first = client.post("/match", json={"items": items, "threshold": 0.4}).json()
+    hits = cache.get_stats()["hits"]
+    strict = client.post("/match", json={"items": items, "threshold": 1.01}).json()
+    assert cache.get_stats()["hits"] == hits + 2  # both rows answered from cache, incl. the junk row
+    assert first["zásuvka tango jednonásobná"]["price"] == 95.0
+    assert strict == {"zásuvka tango jednonásobná": None, "Celkem bez DPH": None}
+    assert cache.get("Celkem bez DPH", SCOPE) == []
+
+    # Labor requests search another source filter, then pick the labor price
+    labor = client.post("/match", json={"items": items[:1], "type": "labor"}).json()
+    assert labor["zásuvka tango jednonásobná"]["price"] == 40.0
+
+def test_concurrent_identical_matches_share_one_search(setup_test_manager, monkeypatch):
+    import threading
+    import time
+    import main
+    manager = setup_test_manager
+    manager.db.add_custom_item("Lišta LV 40x20 bílá", 35.0, 0.0, "m")
+    searched = []
+    original = manager.db.search_many
+
+    def slow_search_many(queries, **kwargs):
+        searched.append(list(queries))
+        time.sleep(0.2)
+        return original(queries, **kwargs)
+
+    monkeypatch.setattr(manager.db, "search_many", slow_search_many)
+    before = manager.flights.get_stats()["coalesced"]
+    req = main.MatchRequest(items=["lišta lv 40x20 bílá"], threshold=0.4)
+    results = [None] * 5
+
+    def run(i):
+        results[i] = main.match_items(req)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(5)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    assert len(searched) == 1
+    assert manager.flights.get_stats()["coalesced"] - before == 4
+    assert all(r == results[0] for r in results) and results[0]["lišta lv 40x20 bílá"]["price"] == 35.0
+    assert manager.flights.get_stats()["in_flight"] == 0
+
+def test_admin_items_delta_sync_with_conflicts(client, setup_test_manager):
+    db = setup_test_manager.db
+    cable = db.add_custom_item("Kabel CXKH 3x2,5", 40.0, 0.0, "m")
+    socket = db.add_custom_item("Zásuvka Tango bílá", 80.0, 0.0, "ks")
+
+    full = client.get("/admin/items?since=0").json()
+    assert full["full"] and {cable, socket} <= {r["id"] for r in full["items"]}
+    base = full["version"]
+    assert client.get(f"/admin/items?since={base}").json() == {"version": base, "full": False, "items": [], "deleted": []}
+
+    # Someone else edits the cable and deletes the socket
+    db.sync_admin_items([{"id": cable, "name": "Kabel CXKH 3x2,5", "price_material": 45.0, "price_labor": 0.0, "unit": "m"}])
+    client.post("/admin/batch-delete", json=[socket])
+    delta = client.get(f"/admin/items?since={base}").json()
+    assert not delta["full"] and delta["version"] > base
+    assert [(r["id"], r["price_material"]) for r in delta["items"]] == [(cable, 45.0)]
+    assert delta["deleted"] == [socket]
+
+    # A stale sheet only sends its changed rows; the cable edit conflicts, the new row is applied
+    res = client.post(f"/admin/sync?base_version={base}", json=[
+        {"id": cable, "name": "Kabel CXKH 3x2,5", "price_material": 50.0, "price_labor": 0.0, "unit": "m"},
+        {"id": None, "name": "1. Krabice  KO 97", "price_material": 15.0, "price_labor": 0.0, "unit": "ks"},
+    ]).json()
+    assert res["conflicts"] == [cable] and res["inserted"] == 1 and res["updated"] == 0
+    created = db.get_admin_changes(0)["items"]
+    krabice = next(r["id"] for r in created if r["name"] == "Krabice KO 97")
+    # Stored values (cleaned name) come back per row, so the sheet fingerprints what the database has
+    assert res["rows"] == [{"row": 1, "id": krabice, "name": "Krabice KO 97", "price_material": 15.0,
+                            "price_labor": 0.0, "unit": "ks"}]
+    again = client.post(f"/admin/sync?base_version={res['version']}", json=[
+        {"id": krabice, "name": "Krabice KO 97 ", "price_material": 15.001, "price_labor": 0.0, "unit": "ks"},
+    ]).json()
+    assert again["unchanged"] == 1 and again["rows"][0]["name"] == "Krabice KO 97" and again["rows"][0]["price_material"] == 15.0
+    after = client.get(f"/admin/items?since={delta['version']}").json()
+    assert [r["name"] for r in after["items"]] == ["Krabice KO 97"]
+    assert db.get_admin_changes(0)["full"]
+
+def test_admin_items_and_aliases_pages_and_ndjson(client, setup_test_manager):
+    import json
+    db = setup_test_manager.db
+    for i in range(5):
+        item_id = db.add_custom_item(f"Stránkovaná položka {i}", 10.0 + i, 0.0, "ks")
+        db.add_alias(item_id, f"strankovana {i}")
+    everything = client.get("/admin/items").json()
+
+    paged, cursor = [], None
+    while True:
+        page = client.get("/admin/items", params={"limit": 3, **({"cursor": cursor} if cursor else {})}).json()
+        paged += page["items"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert paged == everything
+
+    res = client.get("/admin/items?format=ndjson")
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in res.text.splitlines()] == everything
+
+    aliases = client.get("/admin/aliases").json()
+    first = client.get("/admin/aliases?limit=2").json()
+    rest = client.get("/admin/aliases", params={"cursor": first["next_cursor"], "limit": 1000}).json()
+    assert first["items"] + rest["items"] == aliases and rest["next_cursor"] is None
+    assert [json.loads(line) for line in client.get("/admin/aliases?format=ndjson").text.splitlines()] == aliases
+    assert client.get("/admin/aliases?cursor=bm90LWpzb24").status_code == 400
+    # Well-formed JSON of the wrong types is rejected too, before it reaches the keyset comparison
+    from main import _encode_cursor
+    for bad in ([123, "x"], ["x", "1"], ["x", True]):
+        assert client.get("/admin/items", params={"cursor": _encode_cursor(bad)}).status_code == 400
+    assert client.get("/admin/aliases", params={"cursor": _encode_cursor(True)}).status_code == 400
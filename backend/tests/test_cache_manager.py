@@ -0,0 +1,154 @@
+from services.cache_manager import CacheManager
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = CacheManager(max_entries=2)
+    cache.set("a", "material", {"price": 1})
+    cache.set("b", "material", {"price": 2})
+    assert cache.get("A ", "material") == {"price": 1}  # touch a -> b is LRU
+    cache.set("c", "material", {"price": 3})
+    assert cache.get("b", "material") is None
+    assert cache.get("a", "material") is not None
+
+    small = CacheManager(max_bytes=40)
+    small.set("x", "material", {"name": "x" * 10})
+    small.set("y", "material", {"name": "y" * 10})
+    assert len(small) == 1
+    small.set("z", "material", {"name": "z" * 100})  # larger than the whole budget
+    assert small.get("z", "material") is None
+
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+def test_per_entry_ttl_and_sweep(monkeypatch):
+    import services.cache_manager as cm
+    now = [1000.0]
+    monkeypatch.setattr(cm.time, "time", lambda: now[0])
+    cache = CacheManager(ttl_seconds=100, sweep_interval=10)
+    cache.set("short", "labor", {"price": 1}, ttl=5)
+    cache.set("long", "labor", {"price": 2})
+
+    now[0] += 20
+    cache.set("other", "labor", {"price": 3})  # triggers the lazy sweep
+    assert len(cache) == 2
+    assert cache.get_stats()["expirations"] == 1
+    assert cache.get("long", "labor") == {"price": 2}
+
+def test_invalidate_uses_query_index_and_is_thread_safe():
+    import threading
+    cache = CacheManager()
+    for scope in ("material", "labor", "admin"):
+        cache.set("Kabel CYKY", scope, {"price": 1})
+    cache.set("krabice", "material", {"price": 1})
+
+    cache.invalidate(" kabel cyky ")
+    assert len(cache) == 1
+    assert cache._by_query == {"krabice": {("krabice", "material")}}
+
+    def writer(n):
+        for i in range(300):
+            cache.set(f"q{n}-{i}", "material", {"price": i})
+            cache.invalidate(f"q{n}-{i - 1}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert len(cache) == 5
+    assert sum(len(keys) for keys in cache._by_query.values()) == len(cache)
+
+def test_invalidate_items_drops_only_dependent_entries():
+    cache = CacheManager()
+    cache.set("kabel cyky 3x1.5", "material", {"item_id": 1}, item_ids={1, 2}, tokens={"kabel", "cyky", "3x1.5"})
+    cache.set("krabice ko 68", "material", {"item_id": 3}, item_ids={3}, tokens={"krabice"})
+    cache.set("ko", "material", {"item_id": 3}, item_ids={3}, tokens=set())  # substring-only query
+
+    assert cache.invalidate_items([2]) == 1  # price change of a candidate
+    assert cache.get("kabel cyky 3x1.5", "material") is None
+    assert cache.get("krabice ko 68", "material") is not None
+
+    # A new item named "jistič lsn" shares no token but may substring-match "ko"
+    assert cache.invalidate_items([], tokens={"jistič", "lsn"}) == 1
+    assert cache.get("ko", "material") is None
+    assert cache.invalidate_items([], tokens={"krabice"}) == 1
+    assert len(cache) == 0 and not cache._by_item and not cache._by_token
+
+def test_shared_tier_spans_workers_and_propagates_invalidations(tmp_path):
+    from services.shared_cache import SharedCache
+    path = str(tmp_path / "match_cache.db")
+    # Two "workers": separate L1 caches and separate connections to one L2 file
+    a = CacheManager(shared=SharedCache(path), sync_interval=0)
+    b = CacheManager(shared=SharedCache(path), sync_interval=0)
+
+    a.set("kabel cyky", "material", [{"id": 1}], item_ids={1}, tokens={"kabel", "cyky"})
+    a.set("krabice", "material", [{"id": 2}], item_ids={2}, tokens={"krabice"})
+    assert b.get("Kabel CYKY", "material") == [{"id": 1}]
+    assert b.get("kabel cyky", "material") == [{"id": 1}]
+    assert b.get_stats()["l2_hits"] == 1 and b.get_stats()["l1_hits"] == 1
+
+    # A write handled by worker A reaches B's in-process tier
+    a.invalidate_items([1])
+    assert b.get("kabel cyky", "material") is None
+    b.get("krabice", "material")
+    b.clear()
+    assert a.get("krabice", "material") is None and len(a) == 0
+
+    # Entries survive a restart (new process, same file)
+    b.set("trubka", "material", [])
+    restarted = CacheManager(shared=SharedCache(path))
+    assert restarted.get("trubka", "material") == []
+    for cache in (a, b, restarted):
+        cache.shared.close()
+
+def test_shared_prune_runs_outside_the_l1_lock(tmp_path, monkeypatch):
+    import threading
+    import services.cache_manager as cm
+    from services.shared_cache import SharedCache
+    now = [1000.0]
+    monkeypatch.setattr(cm.time, "time", lambda: now[0])
+    cache = CacheManager(shared=SharedCache(str(tmp_path / "prune.db")), sweep_interval=10)
+    cache.set("kabel", "material", [{"id": 1}])
+    lock_free_during_prune = []
+
+    def take_lock():
+        acquired = cache._lock.acquire(timeout=1)
+        if acquired:
+            cache._lock.release()
+        lock_free_during_prune.append(acquired)
+
+    def prune(at):
+        # Another /match thread must be able to take the lock while the prune writes to disk
+        probe = threading.Thread(target=take_lock)
+        probe.start()
+        probe.join()
+
+    monkeypatch.setattr(cache.shared, "prune", prune)
+    now[0] += 20
+    assert cache.get("kabel", "material") == [{"id": 1}]
+    cache.set("krabice", "material", [])  # not due again yet
+    now[0] += 20
+    cache.set("trubka", "material", [])
+    assert lock_free_during_prune == [True, True]
+    cache.shared.close()
+
+def test_l2_hit_is_not_promoted_when_an_invalidation_overlaps_the_read(tmp_path):
+    from services.shared_cache import SharedCache
+    path = str(tmp_path / "race.db")
+    writer = CacheManager(shared=SharedCache(path), sync_interval=0)
+    reader = CacheManager(shared=SharedCache(path), sync_interval=3600)
+    writer.set("kabel cyky", "material", [{"id": 1}], item_ids={1}, tokens={"kabel", "cyky"})
+
+    read = reader.shared.get
+
+    def slow_read(key, now):
+        stored = read(key, now)
+        reader.invalidate_items([1])  # a catalog write lands between the L2 read and the promotion
+        return stored
+
+    reader.shared.get = slow_read
+    assert reader.get("kabel cyky", "material") is None
+    reader.shared.get = read
+    assert len(reader) == 0 and reader.get("kabel cyky", "material") is None
+    for cache in (writer, reader):
+        cache.shared.close()
@@ -0,0 +1,433 @@
+import time
+
+class StubExtractor:
+    """Local stand-in for AIExtractor: one item per non-empty line of the uploaded text."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def extract_from_text(self, text_content, filename, file_type='supplier'):
+        time.sleep(self.delay)
+        lines = [line.strip() for line in text_content.splitlines() if line.strip()]
+        return {
+            "vendor": "Stub s.r.o.",
+            "date": "2025-03-01",
+            "offer_number": f"STUB-{filename}",
+            "items": [{"raw_name": line, "price_material": 10.0 + i, "unit": "ks"} for i, line in enumerate(lines)],
+        }
+
+def _wait_for(client, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/ingest/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_upload_returns_job_and_reports_progress(client, setup_test_manager, monkeypatch):
+    monkeypatch.setattr(setup_test_manager, "ai", StubExtractor(delay=0.5))
+    content = "Chránička FXP 25\nChránička FXP 32\n".encode("utf-8")
+
+    started = time.time()
+    resp = client.post("/ingest/upload", files={"file": ("nabidka_stub.txt", content)}, data={"file_type": "supplier"})
+    assert resp.status_code == 200 and time.time() - started < 0.5  # does not wait for the extractor
+    body = resp.json()
+    assert body["status"] == "queued"
+
+    job = _wait_for(client, body["job_id"])
+    assert job["status"] == "done"
+    assert job["result"]["status"] == "success" and job["result"]["items_count"] == 2
+    assert job["progress"]["chunks_done"] == job["progress"]["chunks_total"] == 1
+    assert job["progress"]["items_extracted"] == 2
+    assert any(r["name"] == "Chránička FXP 32" for r in client.get("/search?q=fxp").json())
+
+    # Same content again -> duplicate (by hash), still reported through the job
+    again = client.post("/ingest/upload", files={"file": ("nabidka_stub.txt", content)}).json()
+    assert _wait_for(client, again["job_id"])["result"]["status"] == "duplicate"
+    assert client.get("/ingest/jobs/unknown").status_code == 404
+
+def test_rate_limiter_paces_requests_and_tokens():
+    from services.rate_limiter import RateLimiter
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=600, clock=lambda: now[0], sleep=sleep)
+    assert limiter.acquire(100) == 0 and limiter.acquire(100) == 0
+    assert abs(limiter.acquire(100) - 30.0) < 1e-6  # request bucket empty -> one refills in 30 s
+    assert limiter.get_stats()["waits"] == 1
+
+    tokens_only = RateLimiter(requests_per_minute=0, tokens_per_minute=600, clock=lambda: now[0], sleep=sleep)
+    assert tokens_only.acquire(500) == 0
+    assert abs(tokens_only.acquire(400) - 30.0) < 1e-6  # 100 left, 300 more refill in 30 s
+
+class FlakyChunkExtractor:
+    """Rate-limits the first call of every second chunk, never parses chunk 5; tracks how many calls overlap."""
+    def __init__(self):
+        import threading
+        self.lock = threading.Lock()
+        self.active = self.max_active = 0
+        self.failed = set()
+        self.calls = {}
+
+    def extract_from_text(self, text_content, filename, file_type='supplier'):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.05)
+            chunk = int(filename.rsplit("ch", 1)[1].rstrip("]"))
+            self.calls[chunk] = self.calls.get(chunk, 0) + 1
+            if chunk % 2 == 0 and chunk not in self.failed:
+                from services.ai_extractor import TransientAIError
+                self.failed.add(chunk)
+                raise TransientAIError("429 Resource exhausted")
+            if chunk == 5:
+                return None  # unparseable response: not worth a retry
+            rows = [line.split("\t")[0] for line in text_content.splitlines()[2:]]
+            # The first chunk carries no vendor, so metadata must come from the second one
+            vendor = None if chunk == 1 else f"Dodavatel {chunk}"
+            return {"vendor": vendor, "date": None, "offer_number": f"PAR-{chunk}",
+                    "items": [{"raw_name": r, "price_material": 1.0} for r in rows]}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+def test_excel_chunks_are_extracted_concurrently_in_order(setup_test_manager, monkeypatch, tmp_path):
+    import pandas as pd
+    manager = setup_test_manager
+    stub = FlakyChunkExtractor()
+    monkeypatch.setattr(manager, "ai", stub)
+    monkeypatch.setattr(manager, "ai_backoff", 0.0)
+    monkeypatch.setattr(manager, "ai_max_parallel", 3)
+    monkeypatch.setattr(manager.chunk_planner, "max_rows", 50)
+    path = tmp_path / "rozpocet_paralelni.xlsx"
+    names = [f"Položka paralelní {i:03d}" for i in range(260)]  # 6 chunks of 50 rows
+    pd.DataFrame({"Popis": names, "Cena": [1.0] * len(names)}).to_excel(path, index=False)
+
+    captured = {}
+    original = manager.db.add_processed_file
+
+    def capture(**kwargs):
+        captured.update(kwargs)
+        return original(**kwargs)
+
+    monkeypatch.setattr(manager.db, "add_processed_file", capture)
+    result = manager.process_file(str(path), file_type_override="supplier")
+
+    assert result["status"] == "success" and result["items_count"] == 210
+    assert [it["raw_name"] for it in captured["items"]] == names[:200] + names[250:]
+    assert captured["vendor"] == "Dodavatel 2" and captured["offer_number"] == "PAR-2"
+    assert stub.failed == {2, 4, 6}  # rate-limited: each retried once
+    assert stub.calls == {1: 1, 2: 2, 3: 1, 4: 2, 5: 1, 6: 2}  # an unparseable response is not retried
+    assert 1 < stub.max_active <= 3
+
+class CountingExtractor(StubExtractor):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def extract_from_text(self, text_content, filename, file_type='supplier'):
+        self.calls.append(filename)
+        data = super().extract_from_text(text_content, filename, file_type)
+        data["offer_number"] = None
+        return data
+
+def test_reingest_of_edited_workbook_only_extracts_changed_chunks(setup_test_manager, monkeypatch, tmp_path):
+    import pandas as pd
+    from services.ingest_queue import IngestJob
+    manager = setup_test_manager
+    stub = CountingExtractor()
+    monkeypatch.setattr(manager, "ai", stub)
+    monkeypatch.setattr(manager.chunk_planner, "max_rows", 50)
+
+    def write(path, prices):
+        with pd.ExcelWriter(path) as writer:
+            for sheet, price in prices.items():
+                rows = [f"{sheet} položka {i}" for i in range(60)]  # 2 chunks per sheet
+                pd.DataFrame({"Popis": rows, "Cena": [price] * 60}).to_excel(writer, sheet_name=sheet, index=False)
+
+    first, edited = tmp_path / "rozpocet_v1.xlsx", tmp_path / "rozpocet_v2.xlsx"
+    write(first, {"Silnoproud": 10.0, "Slaboproud": 20.0})
+    write(edited, {"Silnoproud": 10.0, "Slaboproud": 25.0})
+
+    assert manager.process_file(str(first), file_type_override="internal")["status"] == "success"
+    assert len(stub.calls) == 4
+    stub.calls.clear()
+
+    progress = IngestJob(str(edited), "rozpocet_v2.xlsx")
+    assert manager.process_file(str(edited), file_type_override="internal", progress=progress)["status"] == "success"
+    assert sorted(stub.calls) == ["rozpocet_v2.xlsx [Slaboproud ch1]", "rozpocet_v2.xlsx [Slaboproud ch2]"]
+    assert progress.progress["chunks_cached"] == 2
+
+class OfferExtractor(CountingExtractor):
+    """Returns the offer number written on the first line, like the AI would."""
+    def extract_from_text(self, text_content, filename, file_type='supplier'):
+        data = super().extract_from_text(text_content, filename, file_type)
+        data["offer_number"] = "2025-777"
+        data["items"] = [it for it in data["items"] if "Nabídka" not in it["raw_name"]]
+        return data
+
+def test_duplicates_are_rejected_before_ai_except_pdf_to_excel_upgrade(setup_test_manager, monkeypatch, tmp_path):
+    import fitz
+    import pandas as pd
+    manager = setup_test_manager
+    stub = OfferExtractor()
+    monkeypatch.setattr(manager, "ai", stub)
+
+    pdf = tmp_path / "nabidka_777.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Nabidka c. 2025-777\nKabelovy zlab 50x50\nVicko zlabu 50")
+    doc.save(str(pdf))
+    assert manager.process_file(str(pdf))["status"] == "success"
+    assert len(stub.calls) == 1
+
+    # Same bytes -> rejected by hash; re-typed offer (new bytes, same number) -> rejected by the regex pass
+    txt = tmp_path / "nabidka_777_kopie.txt"
+    txt.write_text("Nabídka č. 2025-777\nKabelový žlab 50x50\n", encoding="utf-8")
+    assert manager.process_file(str(pdf))["details"]["type"] == "hash"
+    assert manager.process_file(str(txt))["details"]["type"] == "offer"
+    assert len(stub.calls) == 1
+
+    # The Excel version of an offer ingested from PDF still replaces it
+    xlsx = tmp_path / "nabidka_777.xlsx"
+    pd.DataFrame({"Popis": ["Nabídka č. 2025-777", "Kabelový žlab 50x50", "Víko žlabu 50"], "Cena": [0, 310.0, 120.0]}).to_excel(xlsx, index=False)
+    result = manager.process_file(str(xlsx))
+    assert result["status"] == "success" and len(stub.calls) == 2
+    assert manager.db.check_file_exists(offer_number="2025-777")["filename"] == "nabidka_777.xlsx"
+
+def test_uploads_are_buffered_once_and_do_not_collide(client, setup_test_manager, monkeypatch):
+    import hashlib
+    import io
+    import fitz
+    from services.upload_buffer import UploadBuffer
+    class PerContentExtractor(StubExtractor):
+        def extract_from_text(self, text_content, filename, file_type='supplier'):
+            return dict(super().extract_from_text(text_content, filename, file_type), offer_number=text_content.strip())
+    monkeypatch.setattr(setup_test_manager, "ai", PerContentExtractor(delay=0.2))
+
+    # Large uploads spill to an anonymous temp file; hash and parsers see the same bytes
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Nabidka c. BUF-2025-01\nRozvadec RE 12")
+    pdf = doc.tobytes()
+    with UploadBuffer.from_fileobj(io.BytesIO(pdf), "velka.pdf", max_memory=1024) as buf:
+        assert buf.size == len(pdf) and buf.sha256 == hashlib.sha256(pdf).hexdigest()
+        assert setup_test_manager._pre_extract_offer_number(buf) == "BUF-2025-01"
+        assert "Rozvadec RE 12" in setup_test_manager._read_pages(buf)[0]
+
+    # Two concurrent uploads with the same file name keep their own content
+    jobs = [
+        client.post("/ingest/upload", files={"file": ("stejny_nazev.txt", f"Svorka WAGO varianta {v}\n".encode())}).json()
+        for v in ("A", "B")
+    ]
+    results = [_wait_for(client, j["job_id"])["result"] for j in jobs]
+    assert [r["status"] for r in results] == ["success", "success"]
+    assert results[0]["source_id"] != results[1]["source_id"]
+
+def test_chunk_planner_packs_by_token_budget_and_reports_usage(setup_test_manager, monkeypatch, tmp_path):
+    import fitz
+    import pandas as pd
+    from services.chunk_planner import ChunkPlanner
+    planner = ChunkPlanner(max_input_tokens=4000, max_output_tokens=6000)
+
+    # Narrow rows are limited by the output budget, wide rows by the input budget
+    narrow = pd.DataFrame({"Popis": [f"Hmoždinka {i}" for i in range(400)], "Cena": [1.0] * 400})
+    assert [end - start for start, end in planner.row_windows(narrow)] == [150, 150, 100]
+    wide = pd.DataFrame({"Popis": ["Kabel " + "x" * 400] * 100, "Cena": [1.0] * 100})
+    windows = planner.row_windows(wide)
+    assert windows[0] == (0, 20) and windows[-1][1] == 100
+    assert all(planner.prompt_tokens(wide[s:e].to_csv(index=False)) <= 4000 for s, e in windows)
+
+    # Pages are packed in order; an oversized page is split by lines, nothing is cut off
+    pages = ["Položka strana 1\n" * 20, "Položka strana 2\n" * 20, "Dlouhá strana 3\n" * 1500]
+    page_windows = planner.page_windows(pages)
+    assert page_windows[0] == (1, 2, pages[0] + pages[1])
+    assert {(first, last) for first, last, _ in page_windows[1:]} == {(3, 3)}
+    assert "".join(text for _, _, text in page_windows) == "".join(pages)
+
+    manager = setup_test_manager
+    stub = CountingExtractor()
+    monkeypatch.setattr(manager, "ai", stub)
+    monkeypatch.setattr(manager, "chunk_planner", ChunkPlanner(max_input_tokens=1500))
+    pdf = tmp_path / "dlouha_nabidka.pdf"
+    doc = fitz.open()
+    for p in range(6):
+        doc.new_page().insert_text((72, 72), "\n".join(f"Trubka PVC {p}-{i}" for i in range(40)))
+    doc.save(str(pdf))
+    result = manager.process_file(str(pdf))
+    assert result["status"] == "success" and result["items_count"] == 240
+    assert result["ai_calls"] == result["chunks"] == len(stub.calls) > 1
+    assert result["ai_tokens"] > 0 and all("[page" in label for label in stub.calls)
+
+def test_excel_chunks_are_compacted_before_prompting(setup_test_manager, monkeypatch, tmp_path):
+    import pandas as pd
+    manager = setup_test_manager
+    df = pd.DataFrame({
+        "Popis": ["Krabice  KU 68\n pod omítku", "Popis", "Svorka WAGO 221-413", "Trubka 1420", "Lišta LV 20x20", "Popis"],
+        "Unnamed: 1": [None] * 6,
+        "MJ": ["ks", "MJ", "ks", "m", "m", "MJ"],
+        "Množství": [2.0, "Množství", 10.0, 25.0, 4.0, "Množství"],
+        "Sazba DPH": ["21 %", "Sazba DPH", "21 %", "21 %", "21 %", "Sazba DPH"],
+    })
+    compact, constants = manager._compact_sheet(df)
+    assert list(compact.columns) == ["Popis", "MJ", "Množství", "Sazba DPH"]
+    assert compact["Popis"].tolist() == ["Krabice KU 68 pod omítku", "Svorka WAGO 221-413", "Trubka 1420", "Lišta LV 20x20"]
+    assert constants == {}  # fewer than 5 rows left: nothing is lifted out
+    assert manager._serialize_rows(compact).splitlines()[1] == "Krabice KU 68 pod omítku\tks\t2\t21 %"
+
+    # Repeated item rows with text prices are kept, blank cells stay blank, and a price
+    # column with one value stays in the rows (only text columns are lifted out)
+    df = pd.DataFrame({
+        "Popis": ["Jistič 16A", "Jistič 16A", "Chránič 40A", "Svorka", "Lišta", "Trubka"],
+        "Výrobce": ["OEZ"] * 6,
+        "MJ": ["ks", "ks", "", "ks", "m", "m"],
+        "Cena MJ": ["150,00"] * 6,
+    })
+    compact, constants = manager._compact_sheet(df)
+    assert compact["Popis"].tolist() == ["Jistič 16A", "Jistič 16A", "Chránič 40A", "Svorka", "Lišta", "Trubka"]
+    assert pd.isna(compact["MJ"][2]) and compact["Cena MJ"].tolist() == ["150,00"] * 6
+    assert constants == {"Výrobce": "OEZ"}
+
+    stub = CountingExtractor()
+    monkeypatch.setattr(manager, "ai", stub)
+    path = tmp_path / "kompaktni.xlsx"
+    rows = [f"Vypínač Tango řazení {i}" for i in range(30)]
+    pd.DataFrame({"Popis": rows, "Unnamed: 1": [None] * 30, "MJ": ["ks"] * 30, "Cena": [float(i) for i in range(30)]}).to_excel(path, index=False)
+    captured = []
+    monkeypatch.setattr(manager, "_extract_cached", lambda content, label, file_type: (captured.append(content), (None, False))[1])
+    result = manager.process_file(str(path), file_type_override="supplier")
+    assert captured[0].startswith("--- LIST: Sheet1 (Chunk 1/1; MJ=ks) ---\nPopis\tCena\nVypínač Tango řazení 0\t0\n")
+    assert result["prompt_bytes_saved"] > 0 and result["prompt_tokens_saved"] > 0
+
+def test_recognized_sheets_are_extracted_locally_and_others_by_ai(setup_test_manager, monkeypatch, tmp_path):
+    import pandas as pd
+    from processors.excel_processor import ExcelProcessor
+    manager = setup_test_manager
+    stub = CountingExtractor()
+    monkeypatch.setattr(manager, "ai", stub)
+
+    assert ExcelProcessor.parse_number("1 234,50 Kč") == 1234.5
+    assert ExcelProcessor.parse_number("1.234,50") == 1234.5
+    assert ExcelProcessor.parse_number("120,-") == 120.0
+    # Item-number columns are not descriptions; a plain "Položka" header is
+    roles = ExcelProcessor()._map_header(["Položka č.", "Označení položky", "Cena MJ"])
+    assert "description" not in roles
+    assert ExcelProcessor()._map_header(["Č.", "Položka", "Cena MJ"])["description"] == 1
+
+    path = tmp_path / "rozpocet_sablona.xlsx"
+    budget = pd.DataFrame([
+        ["Rozpočet objektu, nabídka č. 2025-117", None, None, None, None, None],
+        ["Č.", "Popis", "MJ", "Množství", "Dodávka A", "Montáž A"],
+        [1, "Krabice KO 68", "ks", 10, "12,50", "45,00"],
+        [None, "Silnoproud", None, None, None, None],
+        [2, "Kabel CYKY 3x1,5", "m", "100", 18.9, "22,-"],
+        [None, "Celkem", None, None, "1 234,00", None],
+    ])
+    with pd.ExcelWriter(path) as writer:
+        budget.to_excel(writer, sheet_name="Rozpocet", index=False, header=False)
+        pd.DataFrame({"Položky": ["Jistič 16A", "Chránič 40A"], "Cena": [150, 900]}).to_excel(
+            writer, sheet_name="Ostatni", index=False)
+
+    result = manager.process_file(str(path), file_type_override="internal")
+    assert result["status"] == "success"
+    assert stub.calls == ["rozpocet_sablona.xlsx [Ostatni ch1]"]
+    assert result["sheets"][0] == {"sheet": "Rozpocet", "path": "local", "layout": "internal_budget", "items": 2}
+    assert result["sheets"][1]["path"] == "ai" and result["sheets"][1]["items"] > 0
+
+    kabel = manager.db.search("Kabel CYKY 3x1,5", limit=1)[0]
+    assert kabel["item"] == "Kabel CYKY 3x1,5" and kabel["price_labor"] == 22.0
+    # The regex pre-check number is not stored as the offer number of a locally read file
+    with manager.db.engine.connect() as conn:
+        source = conn.execute(manager.db.sources.select().where(manager.db.sources.c.id == result["source_id"])).first()
+    assert source.offer_number is None
+
+    # A supplier price list in a recognized layout still goes to the AI for its metadata
+    stub.calls.clear()
+    supplier = tmp_path / "cenik_dodavatel.xlsx"
+    pd.DataFrame({"Popis": ["Vypínač řazení 1", "Zásuvka 230V"], "MJ": ["ks", "ks"], "Cena MJ": ["85,00", "120,00"]}).to_excel(
+        supplier, sheet_name="Cenik", index=False)
+    result = manager.process_file(str(supplier), file_type_override="supplier")
+    assert result["status"] == "success"
+    assert stub.calls == ["cenik_dodavatel.xlsx [Cenik ch1]"]
+    assert result["sheets"][0]["path"] == "ai" and result["sheets"][0]["reason"] == "price_list layout in a supplier file"
+
+def test_pdf_pages_are_read_as_tables_in_parallel_and_cached(setup_test_manager, monkeypatch, tmp_path):
+    import fitz
+    from processors.pdf_processor import PDFProcessor
+    from services.upload_buffer import UploadBuffer
+    manager = setup_test_manager
+
+    path = tmp_path / "katalog.pdf"
+    doc = fitz.open()
+    for p in range(4):
+        page = doc.new_page()
+        for x, title in [(40, "Popis"), (300, "MJ"), (350, "Mnozstvi"), (430, "Cena MJ bez DPH")]:
+            page.insert_text((x, 100), title, fontsize=10)
+        for i in range(3):
+            for x, cell in [(40, f"Kabel CYKY 3x{i + 1},5 str. {p}"), (300, "m"), (360, "100"), (440, f"1 2{i}4,50")]:
+                page.insert_text((x, 118 + 18 * i), cell, fontsize=10)
+    doc.save(path)
+
+    serial = PDFProcessor(workers=1)
+    texts = [text for _, text in serial.iter_page_texts(str(path))]
+    assert texts[0].splitlines()[1] == "Kabel CYKY 3x1,5 str. 0\tm\t100\t1 204,50"
+    assert serial.page_rows(texts[0])[2] == {"raw_name": "Kabel CYKY 3x3,5 str. 0", "price_material": 1224.5,
+                                             "price_labor": 0.0, "unit": "m", "quantity": 100.0}
+    # Pages parsed in a process pool come out identical and in order
+    pooled = PDFProcessor(workers=2, parallel_min_pages=2, batch_pages=1)
+    assert list(pooled.iter_page_texts(path.read_bytes())) == list(enumerate(texts))
+
+    # A second read of the same file is served from the page cache
+    parsed = []
+    page_text = PDFProcessor.page_text
+    monkeypatch.setattr(PDFProcessor, "page_text", classmethod(lambda cls, page: parsed.append(1) or page_text(page)))
+    with UploadBuffer.from_path(str(path)) as buf:
+        assert manager._read_pages(buf) == texts
+        assert len(parsed) == 4
+        assert manager._read_pages(buf) == texts
+        assert len(parsed) == 4
+
+def test_job_status_is_shared_between_api_workers(setup_test_manager):
+    from services.ingest_queue import IngestQueue
+    db = setup_test_manager.db
+
+    def process(source, file_type_override=None, progress=None):
+        progress.update(chunks_total=3, chunks_done=3)
+        return {"status": "success", "items_count": 3}
+
+    accepting = IngestQueue(process, store=db)
+    other = IngestQueue(process, store=db)  # another uvicorn worker: same database, own memory
+    job = accepting.submit("nabidka.txt", "nabidka.txt")
+    accepting.shutdown()
+
+    polled = other.get(job.id)
+    assert polled["status"] == "done"
+    assert polled["result"] == {"status": "success", "items_count": 3}
+    assert polled["progress"]["chunks_done"] == 3
+    assert other.get("unknown") is None
+
+def test_project_numbers_and_offer_prices_are_not_offer_numbers(setup_test_manager, monkeypatch, tmp_path):
+    import io
+    import pandas as pd
+    from services.upload_buffer import UploadBuffer
+    manager = setup_test_manager
+    monkeypatch.setattr(manager, "ai", CountingExtractor())
+
+    paths = []
+    for vendor, total in [("Elektro Alfa", "125 400,00 Kč"), ("Elektro Beta", "131 250,00 Kč")]:
+        path = tmp_path / f"nabidka_{vendor.split()[1].lower()}.xlsx"
+        head = pd.DataFrame([[f"Dodavatel: {vendor}"], ["Zakázka č.: Z2401"], [f"Celková cena nabídky: {total}"]])
+        rows = pd.DataFrame({"Popis": [f"{vendor} svítidlo LED {i}" for i in range(3)], "Cena": [900, 950, 990]})
+        with pd.ExcelWriter(path) as writer:
+            head.to_excel(writer, index=False, header=False)
+            rows.to_excel(writer, index=False, startrow=4)
+        paths.append(path)
+
+    for path in paths:
+        with UploadBuffer.from_path(str(path)) as buf:
+            assert manager._pre_extract_offer_number(buf) is None
+    assert manager._pre_extract_offer_number(UploadBuffer.from_fileobj(
+        io.BytesIO("Cenová nabídka č.: NAB-77/2025\nCelková cena nabídky: 125 400,00 Kč\n".encode()), "n.txt")) == "NAB-77/2025"
+    # Two vendors bidding on the same project are both stored
+    assert [manager.process_file(str(p))["status"] for p in paths] == ["success", "success"]
@@ -0,0 +1,231 @@
+from datetime import date
+
+from sqlalchemy import func, select
+
+def _latest(db, item_id):
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            select(db.latest_prices.c.source_type, db.latest_prices.c.price_material, db.latest_prices.c.vendor)
+            .where(db.latest_prices.c.item_id == item_id)
+        ).fetchall()
+    return {r.source_type: (r.price_material, r.vendor) for r in rows}
+
+def _item_id(db, name):
+    with db.engine.connect() as conn:
+        return conn.execute(select(db.items.c.id).where(db.items.c.name == name)).scalar()
+
+def test_latest_prices_follow_offer_dates_and_source_deletes(setup_test_manager):
+    db = setup_test_manager.db
+    item = {"raw_name": "Rozvodnice RZA 24M", "price_material": 900.0, "unit": "ks"}
+
+    new_src = db.add_processed_file("novy.pdf", "Elektro A", date(2025, 5, 1), [item], file_hash="lp-new")
+    item_id = _item_id(db, "Rozvodnice RZA 24M")
+    # An older offer ingested later must not replace the newer price
+    old_src = db.add_processed_file("stary.pdf", "Elektro B", date(2024, 1, 1), [dict(item, price_material=700.0)], file_hash="lp-old")
+    assert _latest(db, item_id) == {"SUPPLIER": (900.0, "Elektro A")}
+    assert db.search("rozvodnice rza", source_type_filter=['SUPPLIER'])[0]["price_material"] == 900.0
+
+    db.delete_source(new_src)
+    assert _latest(db, item_id) == {"SUPPLIER": (700.0, "Elektro B")}
+
+    db.add_custom_item("Rozvodnice RZA 24M", 0.0, 350.0, "ks")
+    assert _latest(db, item_id)["INTERNAL"] == (0.0, "Uživatel")
+
+    db.delete_source(old_src)
+    db.delete_items([item_id])
+    assert _latest(db, item_id) == {}
+
+def test_bulk_ingest_reuses_items_and_keeps_every_price_row(setup_test_manager):
+    db = setup_test_manager.db
+    existing = db.add_processed_file("bulk1.xlsx", "Elektro A", date(2025, 1, 1),
+                                     [{"item": "Chránič OFI 40A", "price_material": 1200.0}], file_hash="bulk-1")
+    items = [
+        {"item": "Chránič OFI 40A", "price_material": 1100.0},
+        {"raw_name": "1. Jistič LTN 16B", "price_material": 150.0, "unit": "ks"},
+        {"item": "Jistič LTN 16B", "price_material": 140.0},
+        {"item": ""},
+    ]
+    src = db.add_processed_file("bulk2.xlsx", "Elektro B", date(2025, 2, 1), items, file_hash="bulk-2")
+    assert src != existing
+
+    chranic, jistic = _item_id(db, "Chránič OFI 40A"), _item_id(db, "Jistič LTN 16B")
+    with db.engine.connect() as conn:
+        prices = conn.execute(
+            select(db.prices.c.item_id, db.prices.c.price_material).where(db.prices.c.source_id == src)
+        ).fetchall()
+    assert sorted(prices) == sorted([(chranic, 1100.0), (jistic, 150.0), (jistic, 140.0)])
+    assert _latest(db, chranic) == {"SUPPLIER": (1100.0, "Elektro B")}
+    assert db.search("jistič ltn")[0]["item"] == "Jistič LTN 16B"
+
+def test_admin_sync_writes_only_changed_rows(setup_test_manager):
+    db = setup_test_manager.db
+    same = db.add_custom_item("Krabice KU 68", 8.0, 0.0, "ks")
+    renamed = db.add_custom_item("Lišta LV 20x20", 30.0, 0.0, "m")
+    repriced = db.add_custom_item("Trubka 1420", 12.0, 0.0, "m")
+
+    counts = db.sync_admin_items([
+        {"id": same, "name": "Krabice KU 68", "price_material": 8.001, "price_labor": 0.0, "unit": "ks"},
+        {"id": renamed, "name": "Lišta LV 20x20 bílá", "price_material": 30.0, "price_labor": 0.0, "unit": "m"},
+        {"id": repriced, "name": "Trubka 1420", "price_material": 14.0, "price_labor": 0.0, "unit": "m"},
+        {"id": None, "name": "Montáž krabice", "price_material": 0.0, "price_labor": 45.0, "unit": "ks"},
+        {"id": 999999, "name": "Smazaná položka", "price_material": 1.0, "price_labor": 0.0, "unit": "ks"},
+    ])
+    assert {k: counts[k] for k in ("unchanged", "updated", "inserted", "skipped")} == \
+        {"unchanged": 1, "updated": 2, "inserted": 1, "skipped": 1}
+
+    with db.engine.connect() as conn:
+        price_counts = dict(conn.execute(
+            select(db.prices.c.item_id, func.count()).where(db.prices.c.item_id.in_([same, renamed, repriced]))
+            .group_by(db.prices.c.item_id)
+        ).fetchall())
+    assert price_counts == {same: 1, renamed: 1, repriced: 2}
+    assert _latest(db, repriced)["SUPPLIER"] == (14.0, "Uživatel (Změna)")
+    assert db.index.exact("lišta lv 20x20 bílá") == renamed
+    labor_id = _item_id(db, "Montáž krabice")
+    assert _latest(db, labor_id) == {"INTERNAL": (0.0, "Uživatel")}
+
+def test_reset_keeps_catalog_version_monotonic_across_workers(tmp_path):
+    from database.price_db import PriceDatabase
+    url = f"sqlite:///{tmp_path / 'reset.db'}"
+    worker_a, worker_b = PriceDatabase(url), PriceDatabase(url)
+    for n in range(3):
+        worker_a.add_processed_file(f"r{n}.pdf", "Elektro A", date(2025, 1, 1),
+                                    [{"raw_name": f"Svorka WAGO 221-41{n}", "price_material": 10.0}])
+    assert worker_b.search("svorka wago")  # worker B's index is now at the latest version
+
+    worker_a.reset_all_data()
+    assert worker_b.search("svorka wago") == []
+    # Items added after the reset are seen by the other worker's index
+    worker_a.add_processed_file("novy.pdf", "Elektro A", date(2025, 1, 1),
+                                [{"raw_name": "Jistic OEZ LTN 16B", "price_material": 120.0}])
+    assert [r["item"] for r in worker_b.search("jistic oez")] == ["Jistic OEZ LTN 16B"]
+    worker_a.engine.dispose()
+    worker_b.engine.dispose()
+
+def test_reset_keeps_ingest_jobs_and_extraction_caches(tmp_path):
+    from database.price_db import PriceDatabase
+    db = PriceDatabase(f"sqlite:///{tmp_path / 'keep.db'}")
+    db.save_ingest_job({"job_id": "job-1", "created_at": 1.0, "status": "running"})
+    db.save_extraction("chunk-key", "supplier", {"items": [{"raw_name": "Jistic OEZ LTN 16B"}]})
+    db.save_page_texts("file-hash", "1", 1, {0: "Jistic OEZ LTN 16B"})
+    db.add_custom_item("Jistic OEZ LTN 16B", 120.0, 0.0, "ks")
+
+    db.reset_all_data()
+    assert db.get_stats()["items"] == 0
+    assert db.get_ingest_job("job-1")["status"] == "running"
+    assert db.get_extraction("chunk-key") == {"items": [{"raw_name": "Jistic OEZ LTN 16B"}]}
+    assert db.get_page_texts("file-hash", "1") == (1, {0: "Jistic OEZ LTN 16B"})
+    db.engine.dispose()
+
+def test_other_workers_writes_are_replayed_into_the_search_index(tmp_path):
+    from database.price_db import PriceDatabase
+    url = f"sqlite:///{tmp_path / 'replay.db'}"
+    worker_a, worker_b = PriceDatabase(url), PriceDatabase(url)
+    worker_a.add_processed_file("a.pdf", "Elektro A", date(2025, 1, 1),
+                                [{"raw_name": "Svorka WAGO 221-412", "price_material": 10.0},
+                                 {"raw_name": "Jistic OEZ LTN 16B", "price_material": 120.0}])
+    assert worker_b.search("svorka wago")
+    trigrams = worker_b.index._trigrams
+
+    # Several writes by worker A: worker B's index is more than one version behind
+    kabel = worker_a.add_custom_item("Kabel CYKY 3x1,5", 18.0, 0.0, "m")
+    jistic = worker_a.search("jistic oez")[0]["id"]
+    worker_a.add_alias(jistic, "istic 16a")
+    worker_a.delete_items([worker_a.search("svorka wago")[0]["id"]])
+
+    assert [r["id"] for r in worker_b.search("kabel cyky")] == [kabel]
+    assert worker_b.search("svorka wago") == []
+    assert worker_b.search("istic 16a")[0]["id"] == jistic
+    assert worker_b.index._trigrams is trigrams  # caught up by replay, not rebuilt
+    worker_a.engine.dispose()
+    worker_b.engine.dispose()
+
+def test_admin_reprice_notifies_name_tokens_of_repriced_items(setup_test_manager):
+    db = setup_test_manager.db
+    item_id = db.add_custom_item("Lišta LHD 20x20", 0.0, 15.0, "m")
+    seen = []
+    db.change_listeners.append(lambda ids, tokens: seen.append((ids, tokens)))
+    try:
+        # A first material price puts the item into the SUPPLIER scope
+        db.sync_admin_items([{"id": item_id, "name": "Lišta LHD 20x20", "price_material": 42.0, "price_labor": 15.0, "unit": "m"}])
+    finally:
+        db.change_listeners.pop()
+    ids, tokens = seen[-1]
+    assert item_id in ids
+    assert {"lišta", "lhd"} <= tokens
+
+def test_admin_sync_resolves_name_collisions_within_a_batch(setup_test_manager):
+    db = setup_test_manager.db
+    a = db.add_custom_item("Rámeček 1násobný bílý", 35.0, 0.0, "ks")
+    b = db.add_custom_item("Rámeček 2násobný bílý", 60.0, 0.0, "ks")
+    c = db.add_custom_item("Rámeček 3násobný bílý", 85.0, 0.0, "ks")
+
+    result = db.sync_admin_items([
+        {"id": a, "name": "Rámeček 1-násobný bílý", "price_material": 35.0, "price_labor": 0.0, "unit": "ks"},
+        # New row with the name item A is renamed to: reuses item A
+        {"id": None, "name": "Rámeček 1-násobný bílý", "price_material": 0.0, "price_labor": 12.0, "unit": "ks"},
+        # Rename to the name item C already has: reported, not applied
+        {"id": b, "name": "Rámeček 3násobný bílý", "price_material": 61.0, "price_labor": 0.0, "unit": "ks"},
+        {"id": c, "name": "Rámeček 3násobný bílý", "price_material": 90.0, "price_labor": 0.0, "unit": "ks"},
+    ])
+    assert result["errors"] == [{"row": 2, "id": b, "name": "Rámeček 3násobný bílý", "error": "Název už má jiná položka"}]
+    assert (result["updated"], result["inserted"]) == (2, 1)
+    assert _item_id(db, "Rámeček 1-násobný bílý") == a
+    assert _item_id(db, "Rámeček 2násobný bílý") == b
+    assert _latest(db, a)["INTERNAL"] == (0.0, "Uživatel")
+    assert 90.0 in [price for price, _ in _latest(db, c).values()]
+
+def test_admin_delta_after_reset_requires_full_reload(tmp_path):
+    from database.price_db import PriceDatabase
+    db = PriceDatabase(f"sqlite:///{tmp_path / 'delta_reset.db'}")
+    db.add_custom_item("Trubka FXP 20", 9.0, 0.0, "m")
+    since = db.get_admin_changes(0)["version"]
+
+    db.reset_all_data()
+    new_id = db.add_custom_item("Trubka FXP 25", 11.0, 0.0, "m")
+    delta = db.get_admin_changes(since)
+    assert delta["full"] and delta["version"] > since
+    assert [(r["id"], r["name"]) for r in delta["items"]] == [(new_id, "Trubka FXP 25")]
+    # A sheet loaded after the reset gets deltas again; unknown (future) versions get a full reload
+    assert not db.get_admin_changes(delta["version"])["full"]
+    assert db.get_admin_changes(delta["version"] + 10)["full"]
+    # Rows of a sheet loaded before the reset are not applied to items that reuse their ids
+    stale = db.sync_admin_items([{"id": new_id, "name": "Trubka FXP 20", "price_material": 9.0, "price_labor": 0.0, "unit": "m"}],
+                                base_version=since)
+    assert stale["conflicts"] == [new_id]
+    db.engine.dispose()
+
+def test_admin_sync_of_unchanged_rows_keeps_the_catalog_version(setup_test_manager):
+    db = setup_test_manager.db
+    item_id = db.add_custom_item("Lišta LHD 40x20", 0.0, 25.0, "m")
+    before = db.get_admin_changes(0)["version"]
+    seen = []
+    db.change_listeners.append(lambda ids, tokens: seen.append(ids))
+    try:
+        res = db.sync_admin_items([{"id": item_id, "name": "Lišta LHD 40x20", "price_material": 0.0, "price_labor": 25.0, "unit": "m"}],
+                                  base_version=before)
+    finally:
+        db.change_listeners.pop()
+    assert res["unchanged"] == 1 and res["version"] == before
+    assert db.get_admin_changes(0)["version"] == before and seen == []
+
+def test_ingest_of_a_name_created_concurrently_reuses_the_item(setup_test_manager, monkeypatch):
+    db = setup_test_manager.db
+    original = db._item_ids_by_name
+    calls = []
+
+    def lookup(conn, names):
+        calls.append(names)
+        if len(calls) == 1:
+            # Another ingest creates the item right after this one looked it up
+            conn.execute(db.items.insert().values(name="Svorka WAGO 2273-204", normalized_name="svorka wago 2273-204"))
+            return {}
+        return original(conn, names)
+
+    monkeypatch.setattr(db, "_item_ids_by_name", lookup)
+    db.add_processed_file("soubezny.pdf", "Elektro A", date(2025, 2, 1),
+                          [{"raw_name": "Svorka WAGO 2273-204", "price_material": 11.0}])
+    monkeypatch.undo()
+    with db.engine.connect() as conn:
+        ids = db._item_ids_by_name(conn, ["Svorka WAGO 2273-204"])
+    assert [p["price_material"] for p in db.get_price_history(ids["Svorka WAGO 2273-204"])] == [11.0]
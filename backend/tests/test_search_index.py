@@ -0,0 +1,165 @@
+from database.search_index import SearchIndex
+
+def test_index_postings_follow_aliases_and_deletes():
+    idx = SearchIndex()
+    idx.ensure(1, lambda: ([(1, "kabel cyky 3x1.5"), (2, "krabice ko 68")], [(10, 2, "odbočná krabice")]))
+
+    assert idx.candidates({"kabel"}) == {1}
+    assert idx.candidates({"odbočná"}) == {2}
+    # "krabice" is in both the name and the alias of item 2; dropping the alias keeps it
+    idx.remove_aliases([10])
+    assert idx.candidates({"krabice"}) == {2}
+    assert idx.candidates({"odbočná"}) == set()
+
+    idx.remove_items([1])
+    assert idx.candidates({"kabel", "krabice"}) == {2}
+
+def test_index_apply_skips_delta_when_versions_skip():
+    idx = SearchIndex()
+    idx.ensure(5, lambda: ([(1, "trubka")], []))
+
+    idx.apply(6, lambda i: i.add_item(2, "trubka ohebná"))
+    assert idx.version == 6
+    assert idx.candidates({"trubka"}) == {1, 2}
+
+    # Another writer bumped to 7 meanwhile -> the delta is not applied, the index stays at 6
+    idx.apply(8, lambda i: i.add_item(3, "trubka pevná"))
+    assert idx.version == 6
+    assert idx.candidates({"trubka"}) == {1, 2}
+
+    # ... and the next read replays the items changed since 6 instead of rebuilding
+    def full_rebuild():
+        raise AssertionError("rebuilt")
+    idx.ensure(8, full_rebuild, lambda since: ([2, 3, 4], [(3, "trubka pevná"), (4, "lišta")], [(9, 4, "kanál")]))
+    assert idx.version == 8
+    assert idx.candidates({"trubka"}) == {1, 3}
+    assert idx.candidates({"kanál"}) == {4}
+
+def test_search_uses_index_for_new_items_and_renames(setup_test_manager):
+    db = setup_test_manager.db
+    item_id = db.add_custom_item("Svorkovnice WAGO 221-413", 12.0, 0.0, "ks")
+    assert any(r["id"] == item_id for r in db.search_items("wago svorkovnice"))
+
+    db.sync_admin_items([{"id": item_id, "name": "Svorka WAGO 221-413", "price_material": 12.0, "price_labor": 0.0, "unit": "ks"}])
+    assert not any(r["id"] == item_id for r in db.search_items("svorkovnice"))
+    assert any(r["id"] == item_id for r in db.search("svorka", source_type_filter=['SUPPLIER', 'ADMIN']))
+
+def _count_statements(engine, fn):
+    from sqlalchemy import event
+    statements = []
+
+    def listener(conn, cursor, stmt, params, context, executemany):
+        statements.append(stmt)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return len(statements)
+
+def test_search_statement_count_is_independent_of_candidates(setup_test_manager):
+    db = setup_test_manager.db
+    for i in range(3):
+        item_id = db.add_custom_item(f"Chránička KOPOFLEX {i}", 20.0, 0.0, "m")
+        db.add_alias(item_id, f"kopoflex trubka {i}")
+    few_search = _count_statements(db.engine, lambda: db.search("kopoflex", source_type_filter=['SUPPLIER', 'ADMIN']))
+    few_items = _count_statements(db.engine, lambda: db.search_items("kopoflex"))
+
+    for i in range(3, 60):
+        item_id = db.add_custom_item(f"Chránička KOPOFLEX {i}", 20.0, 0.0, "m")
+        db.add_alias(item_id, f"kopoflex trubka {i}")
+    assert _count_statements(db.engine, lambda: db.search("kopoflex", source_type_filter=['SUPPLIER', 'ADMIN'])) == few_search
+    assert _count_statements(db.engine, lambda: db.search_items("kopoflex")) == few_items
+    assert few_search <= 3
+
+def test_trigram_matrix_scores_match_exact_and_partial_names():
+    from database.similarity import TrigramMatrix
+    m = TrigramMatrix()
+    m.set('a', 1, "kabel cyky-j 3x1.5")
+    m.set('b', 2, "krabice ko 68")
+    m.compact()
+    m.set('c', 3, "kabel cyky-j 3x2.5")  # pending row (not yet compacted)
+    m.set('d', 2, "kabel cyky-j 3x1,5")  # second row of owner 2
+
+    exact, other, close = m.score("kabel cyky-j 3x1.5", ['a', 'b', 'c']).tolist()
+    assert exact > 0.99
+    assert other < 0.2
+    assert 0.6 < close < exact
+    assert m.best_by_owner("kabel cyky-j 3x1.5", [1, 2, 3]).tolist() == [exact, m.score("kabel cyky-j 3x1.5", ['d'])[0], close]
+
+    m.remove('a')
+    assert m.score("kabel cyky-j 3x1.5", ['a']).tolist() == [0.0]
+    assert m.best_by_owner("kabel cyky-j 3x1.5", [1]).tolist() == [0.0]
+    # Owners without rows score 0; compaction folds pending rows into the owner index
+    assert m.best_by_owner("kabel cyky-j 3x1.5", [99, 3]).tolist() == [0.0, close]
+    m.compact()
+    assert m.best_by_owner("kabel cyky-j 3x1.5", [3, 1, 2]).tolist() == [close, 0.0, m.score("kabel cyky-j 3x1.5", ['d'])[0]]
+
+def test_search_many_matches_single_search_with_constant_statements(setup_test_manager):
+    db = setup_test_manager.db
+    for name in ["Jistič LSN 16B", "Jistič LSN 25B", "Proudový chránič OFI 40A", "Zásuvka 230V bílá"]:
+        db.add_custom_item(name, 150.0, 0.0, "ks")
+    queries = ["jistič lsn 16b", "Jistič LSN 16B", "chránič ofi", "zásuvka bílá 230v", "xx"]
+    source_filter = ['SUPPLIER', 'ADMIN']
+
+    batch = db.search_many(queries, limit=5, source_type_filter=source_filter)
+    for q in queries:
+        assert batch[q] == db.search(q, limit=5, source_type_filter=source_filter)
+    assert batch["jistič lsn 16b"][0]["item"] == "Jistič LSN 16B"
+
+    one = _count_statements(db.engine, lambda: db.search_many(queries[:1], limit=5, source_type_filter=source_filter))
+    many = _count_statements(db.engine, lambda: db.search_many(queries[:4] * 50, limit=5, source_type_filter=source_filter))
+    assert one == many
+
+def test_exact_tier_tracks_names_aliases_and_renames(setup_test_manager):
+    db = setup_test_manager.db
+    source_filter = ['SUPPLIER', 'ADMIN']
+    item_id = db.add_custom_item("Vodič CY 6 zelenožlutý", 25.0, 0.0, "m")
+    other_id = db.add_custom_item("Vodič CY 6 modrý", 25.0, 0.0, "m")
+    db.add_alias(other_id, "cy6 modra")
+
+    hit = db.search_many(["1. Vodič CY 6 ZELENOŽLUTÝ"], limit=5, source_type_filter=source_filter, exact_first=True)
+    matches = hit["1. Vodič CY 6 ZELENOŽLUTÝ"]
+    # The exact hit comes first, the other candidates stay available as alternatives
+    assert (matches[0]["id"], matches[0]["match_score"]) == (item_id, 1.0)
+    assert other_id in [m["id"] for m in matches[1:]] and len(matches) <= 5
+    assert [m["id"] for m in matches].count(item_id) == 1
+    assert db.search_many(["CY6 modra"], source_type_filter=source_filter, exact_first=True)["CY6 modra"][0]["id"] == other_id
+
+    db.sync_admin_items([{"id": item_id, "name": "Vodič CYA 6 zelenožlutý", "price_material": 25.0, "price_labor": 0.0, "unit": "m"}])
+    assert db.index.exact("vodič cy 6 zelenožlutý") is None
+    assert db.index.exact("vodič cya 6 zelenožlutý") == item_id
+
+    db.delete_items([other_id])
+    assert db.index.exact("cy6 modra") is None
+    # Items without a price in the requested source types fall through to fuzzy search
+    with db.engine.connect() as conn:
+        labor_only = db._priced_item_ids(conn, db.index.version, ['INTERNAL'])
+    assert db.index.exact("vodič cya 6 zelenožlutý", allowed=labor_only) is None
+
+def test_rank_counts_overlap_over_sparse_ids_and_allowed_mask():
+    import numpy as np
+    idx = SearchIndex()
+    idx.ensure(1, lambda: ([(3, "kabel cyky 3x1.5"), (10_000_000, "kabel cyky 3x2.5"), (7, "kabel nyy")], []))
+
+    ranked = idx.rank("kabel cyky 3x2.5", ["kabel", "cyky", "3x2.5"], limit=2)
+    assert [item_id for item_id, _, _ in ranked] == [10_000_000, 3]
+    assert ranked[0][2] == 1.0
+
+    # Ids beyond the mask are outside the filter
+    allowed = np.zeros(8, dtype=bool)
+    allowed[[3, 7]] = True
+    assert [item_id for item_id, _, _ in idx.rank("kabel cyky", ["kabel", "cyky"], limit=5, allowed=allowed)] == [3, 7]
+
+def test_rank_scores_only_a_fixed_pool_of_top_overlap_candidates():
+    idx = SearchIndex()
+    items = [(i, f"kabel cyky typ{i}") for i in range(1, 200)] + [(500, "kabel cyky 3x1.5 pevny")]
+    idx.ensure(1, lambda: (items, []))
+    scored = []
+    best_by_owner = idx._trigrams.best_by_owner
+    idx._trigrams.best_by_owner = lambda query, ids: scored.append(len(ids)) or best_by_owner(query, ids)
+
+    ranked = idx.rank("kabel cyky 3x1.5", ["kabel", "cyky", "3x1.5"], limit=3)
+    assert scored == [3 * SearchIndex.RANK_POOL]
+    assert [item_id for item_id, _, _ in ranked][0] == 500
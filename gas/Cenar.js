@@ -51,6 +51,30 @@ function onOpen() {
         .addToUi();
 }
 
+const ADMIN_PAGE_SIZE = 2000;
+
+/**
+ * Stáhne všechny stránky endpointu (?limit=&cursor=) a každou předá `onPage(page)` -
+ * žádná odpověď tak nepřekročí limit velikosti UrlFetchApp
+ */
+function fetchAllPages(path, onPage) {
+    let cursor = null;
+    do {
+        const url = `${API_BASE_URL}${path}?limit=${ADMIN_PAGE_SIZE}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : "");
+        const res = UrlFetchApp.fetch(url, {
+            'method': 'get',
+            'headers': { 'bypass-tunnel-reminder': 'true' },
+            'muteHttpExceptions': true
+        });
+        if (res.getResponseCode() !== 200) {
+            throw new Error(res.getContentText());
+        }
+        const page = JSON.parse(res.getContentText());
+        onPage(page);
+        cursor = page.next_cursor;
+    } while (cursor);
+}
+
 /**
  * Načte všechny naučené aliasy do nového listu
  */
@@ -66,32 +90,25 @@ function loadAliasesSheet() {
     const headers = [["ID Aliasu", "ID Položky", "Hledaný výraz (Alias)", "Cílová položka v DB"]];
     sheet.getRange(1, 1, 1, headers[0].length).setValues(headers).setBackground("#fef7e0").setFontWeight("bold");
 
-    const url = `${API_BASE_URL}/admin/aliases`;
-    const options = {
-        'method': 'get',
-        'contentType': 'application/json',
-        'headers': { 'bypass-tunnel-reminder': 'true' },
-        'muteHttpExceptions': true
-    };
-
     try {
-        const response = UrlFetchApp.fetch(url, options);
-        if (response.getResponseCode() === 200) {
-            const data = JSON.parse(response.getContentText());
-            if (data && data.length > 0) {
-                const rows = data.map(al => [
-                    al.id,
-                    al.item_id,
-                    al.alias,
-                    al.item_name
-                ]);
-                sheet.getRange(2, 1, rows.length, headers[0].length).setValues(rows);
-                sheet.setFrozenRows(1);
-                sheet.autoResizeColumns(1, 4);
-                SpreadsheetApp.getUi().alert(`Načteno ${data.length} naučených aliasů.`);
-            } else {
-                SpreadsheetApp.getUi().alert("Zatím nebyli naučeni žádné aliasy.");
-            }
+        let count = 0;
+        fetchAllPages("/admin/aliases", page => {
+            if (page.items.length === 0) return;
+            const rows = page.items.map(al => [
+                al.id,
+                al.item_id,
+                al.alias,
+                al.item_name
+            ]);
+            sheet.getRange(count + 2, 1, rows.length, headers[0].length).setValues(rows);
+            count += rows.length;
+        });
+        if (count > 0) {
+            sheet.setFrozenRows(1);
+            sheet.autoResizeColumns(1, 4);
+            SpreadsheetApp.getUi().alert(`Načteno ${count} naučených aliasů.`);
+        } else {
+            SpreadsheetApp.getUi().alert("Zatím nebyli naučeni žádné aliasy.");
         }
     } catch (e) {
         SpreadsheetApp.getUi().alert("Chyba při načítání aliasů: " + e.message);
@@ -723,55 +740,112 @@ function getBackendStatus() {
     }
 }
 
+const ADMIN_HEADERS = ["ID", "Název", "Cena Materiál", "Cena Montáž", "Jednotka", "Poslední Zdroj", "Poslední Datum", "Otisk"];
+
+/**
+ * Otisk editovatelných hodnot řádku (název, ceny, jednotka) - podle něj se poznají změněné řádky
+ */
+function adminRowFingerprint(name, priceMaterial, priceLabor, unit) {
+    return JSON.stringify([String(name), parseFloat(priceMaterial) || 0, parseFloat(priceLabor) || 0, String(unit || "ks")]);
+}
+
+function adminItemToRow(item) {
+    return [item.id, item.name, item.price_material, item.price_labor, item.unit, item.source, item.date,
+        adminRowFingerprint(item.name, item.price_material, item.price_labor, item.unit)];
+}
+
 /**
- * Načte celou databázi do nového listu pro hromadnou editaci
+ * Stáhne změny od verze `since` (0 = vše) a promítne je do listu: změněné řádky přepíše,
+ * nové přidá, smazané odstraní. Vrací počet změněných položek.
+ */
+function refreshAdminSheet(sheet, since) {
+    if (!since) {
+        return loadFullAdminSheet(sheet);
+    }
+    const res = UrlFetchApp.fetch(`${API_BASE_URL}/admin/items?since=${since}`, {
+        'method': 'get',
+        'headers': { 'bypass-tunnel-reminder': 'true' },
+        'muteHttpExceptions': true
+    });
+    if (res.getResponseCode() !== 200) {
+        throw new Error(res.getContentText());
+    }
+    const delta = JSON.parse(res.getContentText());
+
+    if (delta.full) {
+        // Neznámá verze (např. po resetu databáze) - načíst vše znovu
+        return loadFullAdminSheet(sheet);
+    }
+
+    const data = sheet.getDataRange().getValues();
+    const rowById = {};
+    for (let i = 1; i < data.length; i++) {
+        if (data[i][0]) rowById[parseInt(data[i][0])] = i + 1;
+    }
+    const appended = [];
+    delta.items.forEach(item => {
+        const row = rowById[item.id];
+        if (row) {
+            sheet.getRange(row, 1, 1, ADMIN_HEADERS.length).setValues([adminItemToRow(item)]);
+        } else {
+            appended.push(adminItemToRow(item));
+        }
+    });
+    if (appended.length > 0) {
+        sheet.getRange(sheet.getLastRow() + 1, 1, appended.length, ADMIN_HEADERS.length).setValues(appended);
+    }
+    // Smazané položky odstranit zezadu, aby se nerozhodily indexy
+    delta.deleted.map(id => rowById[id]).filter(row => row).sort((a, b) => b - a).forEach(row => sheet.deleteRow(row));
+
+    PropertiesService.getDocumentProperties().setProperty('adminVersion', String(delta.version));
+    return delta.items.length + delta.deleted.length;
+}
+
+/**
+ * Načte celou databázi do listu po stránkách a uloží verzi pro další delta načítání
+ */
+function loadFullAdminSheet(sheet) {
+    sheet.clear();
+    sheet.getRange(1, 1, 1, ADMIN_HEADERS.length).setValues([ADMIN_HEADERS]).setBackground("#e8f0fe").setFontWeight("bold");
+    let version = null;
+    let count = 0;
+    fetchAllPages("/admin/items", page => {
+        // Verze první stránky - změny během stránkování se stáhnou příští deltou
+        if (version === null) version = page.version;
+        if (page.items.length === 0) return;
+        sheet.getRange(count + 2, 1, page.items.length, ADMIN_HEADERS.length).setValues(page.items.map(adminItemToRow));
+        count += page.items.length;
+    });
+    sheet.setFrozenRows(1);
+    sheet.hideColumns(ADMIN_HEADERS.length);
+    PropertiesService.getDocumentProperties().setProperty('adminVersion', String(version));
+    return count;
+}
+
+/**
+ * Načte databázi do listu pro hromadnou editaci (po prvním načtení stahuje jen změny)
  */
 function loadAdminSheet() {
     const ss = SpreadsheetApp.getActiveSpreadsheet();
     let sheet = ss.getSheetByName("ADMIN_DATABASE");
+    const stored = PropertiesService.getDocumentProperties().getProperty('adminVersion');
+    // Delta jen pokud list existuje a má sloupec s otisky (jinak načíst vše)
+    const since = sheet && stored && sheet.getLastColumn() >= ADMIN_HEADERS.length ? parseInt(stored) : 0;
 
     if (!sheet) {
         sheet = ss.insertSheet("ADMIN_DATABASE");
     }
 
-    sheet.clear();
-    const headers = [["ID", "Název", "Cena Materiál", "Cena Montáž", "Jednotka", "Poslední Zdroj", "Poslední Datum"]];
-    sheet.getRange(1, 1, 1, headers[0].length).setValues(headers).setBackground("#e8f0fe").setFontWeight("bold");
-
-    const url = `${API_BASE_URL}/admin/items`;
-    const options = {
-        'method': 'get',
-        'contentType': 'application/json',
-        'headers': { 'bypass-tunnel-reminder': 'true' },
-        'muteHttpExceptions': true
-    };
-
     try {
-        const response = UrlFetchApp.fetch(url, options);
-        if (response.getResponseCode() === 200) {
-            const data = JSON.parse(response.getContentText());
-            if (data && data.length > 0) {
-                const rows = data.map(item => [
-                    item.id,
-                    item.name,
-                    item.price_material,
-                    item.price_labor,
-                    item.unit,
-                    item.source,
-                    item.date
-                ]);
-                sheet.getRange(2, 1, rows.length, headers[0].length).setValues(rows);
-                sheet.setFrozenRows(1);
-                SpreadsheetApp.getUi().alert(`Načteno ${data.length} položek.`);
-            }
-        }
+        const changed = refreshAdminSheet(sheet, since);
+        SpreadsheetApp.getUi().alert(since ? `Aktualizováno ${changed} položek.` : `Načteno ${Math.max(sheet.getLastRow() - 1, 0)} položek.`);
     } catch (e) {
         SpreadsheetApp.getUi().alert("Chyba při načítání: " + e.message);
     }
 }
 
 /**
- * Odešle změny z listu ADMIN_DATABASE zpět do databáze
+ * Odešle změněné řádky z listu ADMIN_DATABASE zpět do databáze
  */
 function syncAdminSheet() {
     const ss = SpreadsheetApp.getActiveSpreadsheet();
@@ -790,17 +864,29 @@ function syncAdminSheet() {
     const data = sheet.getDataRange().getValues();
     const headers = data.shift(); // Remove headers
 
-    const itemsToSync = data.filter(row => row[1]).map(row => {
-        return {
+    // Odeslat jen nové řádky a řádky, jejichž hodnoty se liší od načteného otisku
+    const itemsToSync = [];
+    const sheetRows = []; // sheetRows[i] = číslo řádku v listu pro itemsToSync[i]
+    data.forEach((row, i) => {
+        if (!row[1]) return;
+        if (row[0] && row[7] === adminRowFingerprint(row[1], row[2], row[3], row[4])) return;
+        sheetRows.push(i + 2);
+        itemsToSync.push({
             id: row[0] ? parseInt(row[0]) : null,
             name: String(row[1]),
             price_material: parseFloat(row[2]) || 0,
             price_labor: parseFloat(row[3]) || 0,
             unit: String(row[4] || "ks")
-        };
+        });
     });
 
-    const url = `${API_BASE_URL}/admin/sync`;
+    if (itemsToSync.length === 0) {
+        ui.alert("Žádné změny k odeslání.");
+        return;
+    }
+
+    const baseVersion = parseInt(PropertiesService.getDocumentProperties().getProperty('adminVersion') || '0');
+    const url = `${API_BASE_URL}/admin/sync` + (baseVersion ? `?base_version=${baseVersion}` : "");
     const options = {
         'method': 'post',
         'contentType': 'application/json',
@@ -812,7 +898,32 @@ function syncAdminSheet() {
     try {
         const res = UrlFetchApp.fetch(url, options);
         if (res.getResponseCode() === 200) {
-            ui.alert(`Synchronizace úspěšná! Synchronizováno ${itemsToSync.length} položek.`);
+            const result = JSON.parse(res.getContentText());
+            // Uložené řádky převezmou hodnoty z databáze (očištěný název, ID nových položek) a jejich
+            // otisk, aby je příští synchronizace neposlala znovu a delta níže nové položky nepřidala podruhé
+            (result.rows || []).forEach(r => {
+                const row = data[sheetRows[r.row] - 2];
+                [row[0], row[1], row[2], row[3], row[4]] = [r.id, r.name, r.price_material, r.price_labor, r.unit];
+                row[7] = adminRowFingerprint(r.name, r.price_material, r.price_labor, r.unit);
+            });
+            if (result.rows && result.rows.length > 0) {
+                const width = ADMIN_HEADERS.length;
+                sheet.getRange(2, 1, data.length, width).setValues(
+                    data.map(row => Array.from({ length: width }, (_, j) => row[j] === undefined ? "" : row[j])));
+            }
+            // Stáhnout vlastní i cizí změny od posledního načtení (konfliktní řádky se přepíší stavem z DB)
+            refreshAdminSheet(sheet, baseVersion);
+            let message = `Synchronizace úspěšná! Odesláno ${itemsToSync.length} položek ` +
+                `(změněno: ${result.updated}, nových: ${result.inserted}, beze změny: ${result.unchanged}).`;
+            if (result.conflicts && result.conflicts.length > 0) {
+                message += `\n\n${result.conflicts.length} položek mezitím změnil někdo jiný - nebyly uloženy ` +
+                    `a v listu mají aktuální hodnoty z databáze (ID: ${result.conflicts.join(", ")}).`;
+            }
+            if (result.errors && result.errors.length > 0) {
+                message += `\n\n${result.errors.length} řádků nebylo uloženo:\n` +
+                    result.errors.map(e => `- ${e.name} (ID ${e.id}): ${e.error}`).join("\n");
+            }
+            ui.alert(message);
         } else {
             ui.alert("Chyba při synchronizaci: " + res.getContentText());
         }
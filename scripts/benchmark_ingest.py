@@ -0,0 +1,95 @@
+"""
+Benchmark of PriceDatabase.add_processed_file (rows/sec).
+- 'per-row': the previous loop (SELECT item, INSERT item, INSERT price for every row).
+- 'bulk': the current set-based path (chunked IN lookups + executemany inserts).
+Runs against a fresh temporary SQLite file, or against BENCH_DATABASE_URL when set (only
+SQLite has been measured so far). The target database is written to - never point it at production.
+
+Usage: python scripts/benchmark_ingest.py [rows] [repeats]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+# Load environment
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+load_dotenv(os.path.join(root_dir, '.env'))
+sys.path.append(os.path.join(root_dir, 'backend'))
+
+from database.price_db import PriceDatabase  # noqa: E402
+
+
+def make_items(rows, run):
+    """Half of the names are shared by all runs (existing items), half are new in each run."""
+    items = []
+    for i in range(rows):
+        name = f"Kabel CYKY 3x{i % 50 + 1},5 typ {i // 2}" if i % 2 else f"Položka {run}-{i} trubka PPR {i % 32} mm"
+        items.append({"item": name, "price_material": 10 + i % 100, "price_labor": i % 7, "unit": "m", "quantity": 1.0})
+    return items
+
+
+def add_per_row(db, filename, items):
+    """The previous per-row insert loop (for comparison)."""
+    with db.engine.connect() as conn:
+        source_id = conn.execute(db.sources.insert().values(
+            filename=filename, vendor="Bench", date_offer=date(2025, 1, 1), source_type='SUPPLIER'
+        )).inserted_primary_key[0]
+        for it in items:
+            name = db._clean_item_name(it.get('raw_name') or it.get('item'))
+            if not name:
+                continue
+            item_id = conn.execute(select(db.items.c.id).where(db.items.c.name == name)).scalar()
+            if not item_id:
+                item_id = conn.execute(
+                    db.items.insert().values(name=name, normalized_name=name.lower().strip())
+                ).inserted_primary_key[0]
+            conn.execute(db.prices.insert().values(
+                item_id=item_id, source_id=source_id,
+                price_material=it.get('price_material', 0), price_labor=it.get('price_labor', 0),
+                unit=it.get('unit', 'ks'), quantity=it.get('quantity', 1.0)
+            ))
+        affected = [r[0] for r in conn.execute(
+            select(db.prices.c.item_id).where(db.prices.c.source_id == source_id).distinct()
+        ).fetchall()]
+        db._refresh_latest_prices(conn, affected)
+        db._bump_catalog_version(conn)
+        conn.commit()
+
+
+def add_bulk(db, filename, items):
+    db.add_processed_file(filename, "Bench", date(2025, 1, 1), items)
+
+
+def run(db, label, fn, rows, repeats):
+    best = None
+    for r in range(repeats):
+        items = make_items(rows, f"{label}{r}")
+        start = time.perf_counter()
+        fn(db, f"bench_{label}_{r}.xlsx", items)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"   {label:8s} {rows / best:10.0f} rows/s  (best of {repeats}: {best:.2f}s for {rows} rows)")
+    return rows / best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    db_url = os.getenv("BENCH_DATABASE_URL")
+    if not db_url:
+        db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_'), 'bench.db')}"
+    print(f"🚀 Benchmarking add_processed_file on {db_url.split('@')[-1]} ...")
+
+    db = PriceDatabase(db_url)
+    before = run(db, "per-row", add_per_row, rows, repeats)
+    after = run(db, "bulk", add_bulk, rows, repeats)
+    print(f"✅ Speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()